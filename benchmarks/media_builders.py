@@ -0,0 +1,102 @@
+"""
+Builders of minimal JPEG, HEIC and QuickTime files carrying a capture time, for the synthetic libraries of the
+benchmarks and for the tests of the parsers
+"""
+import struct
+from typing import Optional
+
+
+def make_tiff(date_time_original: Optional[str], endian: str = ">", sub_sec: Optional[str] = None) -> bytes:
+    """
+    Build a TIFF header with IFD0 pointing to an Exif IFD holding DateTimeOriginal and SubSecTimeOriginal
+    """
+    values = []
+    if date_time_original is not None:
+        values.append((0x9003, date_time_original.encode() + b"\x00"))
+    if sub_sec is not None:
+        values.append((0x9291, sub_sec.encode() + b"\x00"))
+
+    ifd0_offset = 8
+    exif_ifd_offset = ifd0_offset + 2 + 12 + 4
+    data_offset = exif_ifd_offset + 2 + 12 * len(values) + 4
+    tiff = (b"II*\x00" if endian == "<" else b"MM\x00*") + struct.pack(endian + "I", ifd0_offset)
+    tiff += struct.pack(endian + "HHHII", 1, 0x8769, 4, 1, exif_ifd_offset) + b"\x00" * 4
+    tiff += struct.pack(endian + "H", len(values))
+    data = b""
+    for tag, value in values:
+        if len(value) <= 4:
+            tiff += struct.pack(endian + "HHI", tag, 2, len(value)) + value.ljust(4, b"\x00")
+        else:
+            tiff += struct.pack(endian + "HHII", tag, 2, len(value), data_offset + len(data))
+            data += value
+    return tiff + b"\x00" * 4 + data
+
+
+def make_jpeg(tiff: bytes) -> bytes:
+    app0 = b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    app1 = b"Exif\x00\x00" + tiff
+    return b"\xff\xd8" + \
+        b"\xff\xe0" + struct.pack(">H", len(app0) + 2) + app0 + \
+        b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1 + \
+        b"\xff\xda\x00\x02" + b"\x00" * 64 + b"\xff\xd9"
+
+
+def box(box_type: bytes, content: bytes) -> bytes:
+    return struct.pack(">I", len(content) + 8) + box_type + content
+
+
+def full_box(box_type: bytes, version: int, content: bytes) -> bytes:
+    return box(box_type, bytes([version, 0, 0, 0]) + content)
+
+
+def make_heic(tiff: bytes) -> bytes:
+    """
+    Build a HEIC file whose Exif item is stored after the meta box, located by a version 1 iloc
+    """
+    ftyp = box(b"ftyp", b"heic" + b"\x00" * 4 + b"mif1heic")
+    infe_image = full_box(b"infe", 2, struct.pack(">HH4s", 1, 0, b"hvc1") + b"\x00")
+    infe_exif = full_box(b"infe", 2, struct.pack(">HH4s", 2, 0, b"Exif") + b"\x00")
+    iinf = full_box(b"iinf", 0, struct.pack(">H", 2) + infe_image + infe_exif)
+    exif_data = struct.pack(">I", 6) + b"Exif\x00\x00" + tiff
+
+    def build(exif_offset):
+        # offset_size 4, length_size 4, base_offset_size 0, index_size 0
+        iloc_content = bytes([0x44, 0x00]) + struct.pack(">H", 2)
+        iloc_content += struct.pack(">HHHHII", 1, 0, 0, 1, 0, 0)
+        iloc_content += struct.pack(">HHHHII", 2, 0, 0, 1, exif_offset, len(exif_data))
+        meta = full_box(b"meta", 0, full_box(b"hdlr", 0, b"\x00" * 4 + b"pict" + b"\x00" * 13) +
+                        iinf + full_box(b"iloc", 1, iloc_content))
+        return ftyp + meta
+
+    head = build(0)
+    mdat_header_size = 8
+    return build(len(head) + mdat_header_size) + box(b"mdat", exif_data)
+
+
+def make_quicktime(creation_date: Optional[str], media_seconds: int, mdhd_version: int = 0,
+                   mdat_first: bool = True, iso_meta: bool = False) -> bytes:
+    """
+    Build a MOV file with the com.apple.quicktime.creationdate key and a track with a mdhd box
+    """
+    if mdhd_version == 1:
+        mdhd = full_box(b"mdhd", 1, struct.pack(">QQIQ", media_seconds, media_seconds, 600, 0) + b"\x00" * 4)
+    else:
+        mdhd = full_box(b"mdhd", 0, struct.pack(">IIII", media_seconds, media_seconds, 600, 0) + b"\x00" * 4)
+    trak = box(b"trak", full_box(b"tkhd", 0, b"\x00" * 80) + box(b"mdia", mdhd))
+    moov_content = full_box(b"mvhd", 0, b"\x00" * 96)
+    if creation_date is not None:
+        keys = [b"com.apple.quicktime.make", b"com.apple.quicktime.creationdate"]
+        keys_content = struct.pack(">I", len(keys)) + b"".join(struct.pack(">I", len(key) + 8) + b"mdta" + key
+                                                              for key in keys)
+        ilst = box(b"ilst", box(struct.pack(">I", 1), box(b"data", struct.pack(">II", 1, 0) + b"Apple")) +
+                   box(struct.pack(">I", 2), box(b"data", struct.pack(">II", 1, 0) + creation_date.encode())))
+        meta_content = full_box(b"hdlr", 0, b"\x00" * 4 + b"mdta" + b"\x00" * 13) + \
+            full_box(b"keys", 0, keys_content) + ilst
+        # Unlike the ISO meta box, the QuickTime one has no version and flags
+        moov_content += full_box(b"meta", 0, meta_content) if iso_meta else box(b"meta", meta_content)
+    moov_content += trak
+
+    ftyp = box(b"ftyp", b"qt  " + b"\x00" * 4 + b"qt  ")
+    mdat = box(b"mdat", b"\x00" * 1024)
+    moov = box(b"moov", moov_content)
+    return ftyp + mdat + moov if mdat_first else ftyp + moov + mdat
@@ -0,0 +1,322 @@
+"""
+Benchmark suite on a synthetic library, with the results compared against a stored baseline to catch regressions
+Usage: python -m benchmarks.run [--size small|medium|large] [--jobs N] [--scenario NAME ...] [--out results.json]
+                                [--baseline benchmarks/baseline.json] [--tolerance 0.25] [--update-baseline]
+                                [--profile] [--work-dir DIR]
+Exits with 1 if a scenario is slower than the baseline by more than the tolerance
+"""
+import argparse
+import cProfile
+import json
+import logging
+import os
+import platform
+import pstats
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+from unittest.mock import Mock
+
+from benchmarks.synthetic_library import SyntheticLibrary, build_library, Image
+from exception.exception import AuditException
+from photo_organizer.cache import Cache, Doc
+from photo_organizer.config import Config
+from photo_organizer.hasher import Hasher
+from photo_organizer.library import Library
+from photo_organizer.organizer import Organizer
+from photo_organizer.renamer.file_name_time_extractor import FileNameTimeExtractor
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+# The number of library files and incoming files
+SIZES = {"small": (2000, 200), "medium": (20000, 2000), "large": (200000, 20000)}
+# Scenarios faster than this are too noisy to be flagged as regressions
+MIN_SECONDS = 0.05
+CACHE_ROWS_PER_FILE = 10
+FILE_NAME_COUNT = 100000
+
+
+class Result(NamedTuple):
+    seconds: float
+    count: float
+    unit: str
+
+
+class Bench:
+    """
+    The state shared by the scenarios of a run
+    """
+
+    def __init__(self, library: SyntheticLibrary, work_dir: Path, jobs: int):
+        self.library = library
+        self.work_dir = work_dir
+        self.jobs = jobs
+        self.media_paths = [path for path in library.library_paths if path.suffix != ".aae"]
+        self.organizer: Optional[Organizer] = None
+
+
+def timed(func: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench_library_scan(bench: Bench) -> Result:
+    config = Mock()
+    config.cur_working_dir = bench.library.root
+    library = Library(config)
+    files = []
+    seconds = timed(lambda: files.extend(library.iter_library_files()))
+    return Result(seconds, len(files), "files")
+
+
+def bench_hasher(bench: Bench) -> Result:
+    hasher = Hasher(100 * 1024 * 1024)
+    seconds = timed(lambda: list(hasher.get_hashes(bench.media_paths, jobs=bench.jobs)))
+    return Result(seconds, sum(path.stat().st_size for path in bench.media_paths) / 1024 / 1024, "MB")
+
+
+def bench_cache_upsert(bench: Bench) -> Result:
+    cache = _new_cache(bench.work_dir / "cache_upsert")
+    docs = _make_docs(len(bench.library.library_paths) * CACHE_ROWS_PER_FILE)
+    seconds = timed(lambda: cache.upsert_many(docs))
+    cache._conn.close()
+    return Result(seconds, len(docs), "rows")
+
+
+def bench_cache_lookup(bench: Bench) -> Result:
+    cache = _new_cache(bench.work_dir / "cache_lookup")
+    docs = _make_docs(len(bench.library.library_paths) * CACHE_ROWS_PER_FILE)
+    cache.upsert_many(docs)
+
+    def lookup():
+        cache.get_docs_by_hashcodes(doc.hashcode for doc in docs)
+        cache.get_docs_by_sizes(doc.size for doc in docs)
+        for doc in docs[::100]:
+            cache.get_doc_by_path(doc.path)
+
+    seconds = timed(lookup)
+    cache._conn.close()
+    return Result(seconds, len(docs) * 2 + len(docs[::100]), "lookups")
+
+
+def bench_file_name_time(bench: Bench) -> Result:
+    names = [path.name for path in bench.library.library_paths + bench.library.incoming_paths]
+    names = (names * (FILE_NAME_COUNT // max(len(names), 1) + 1))[:FILE_NAME_COUNT]
+    extractor = FileNameTimeExtractor()
+    seconds = timed(lambda: [extractor.get_time(name) for name in names])
+    return Result(seconds, len(names), "names")
+
+
+def bench_setup(bench: Bench) -> Result:
+    # The first organizer run, so the time includes creating the cache
+    bench.organizer = Organizer(Config())
+    bench.organizer.config.jobs = bench.jobs
+    return Result(timed(bench.organizer.setup), len(bench.media_paths), "files")
+
+
+def bench_setup_warm(bench: Bench) -> Result:
+    return Result(timed(bench.organizer.setup), len(bench.media_paths), "files")
+
+
+def bench_merge_plan(bench: Bench) -> Result:
+    seconds = timed(lambda: bench.organizer.merge(plan_out=Path("plan.jsonl")))
+    return Result(seconds, len(bench.library.incoming_paths), "files")
+
+
+def bench_merge_apply(bench: Bench) -> Result:
+    moves = len(Path("plan.jsonl").read_text().splitlines())
+    return Result(timed(lambda: bench.organizer.apply_plan(Path("plan.jsonl"))), moves, "files")
+
+
+def bench_audit(bench: Bench) -> Result:
+    def audit():
+        try:
+            bench.organizer.audit(Path("audit.json"))
+        except AuditException:
+            pass  # Issues are expected, e.g. the names shared by the files of different suffixes
+
+    seconds = timed(audit)
+    return Result(seconds, bench.organizer.cache.count(), "rows")
+
+
+MICRO_SCENARIOS = {
+    "library_scan": bench_library_scan,
+    "hasher": bench_hasher,
+    "cache_upsert": bench_cache_upsert,
+    "cache_lookup": bench_cache_lookup,
+    "file_name_time": bench_file_name_time,
+}
+# Run in the library dir in this order, each one depending on the previous ones
+END_TO_END_SCENARIOS = {
+    "setup": bench_setup,
+    "setup_warm": bench_setup_warm,
+    "merge_plan": bench_merge_plan,
+    "merge_apply": bench_merge_apply,
+    "audit": bench_audit,
+}
+
+
+def _new_cache(working_dir: Path) -> Cache:
+    config = Mock()
+    config.working_dir = working_dir
+    return Cache(config)
+
+
+def _make_docs(count: int) -> List[Doc]:
+    # About one in ten sizes and hashes are shared, like the duplicates of a real library
+    return [Doc(f"20{i % 20:02}/{i % 12 + 1:02}/20{i % 20:02}0101_{i:08}.jpg", f"{i - i % 10 * (i % 7 == 0):032x}",
+                1024 + i // 2, "md5", i, i, 1) for i in range(count)]
+
+
+@contextmanager
+def _in_dir(path: Path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def run_scenario(name: str, scenario: Callable[[Bench], Result], bench: Bench, profile: bool) -> Result:
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        profiler.enable()
+    result = scenario(bench)
+    if profiler is not None:
+        profiler.disable()
+        print(f"--- Profile of {name} ---")
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(15)
+    print(f"{name:<16} {result.seconds:>9.3f} s {result.count / max(result.seconds, 1e-9):>12.1f} {result.unit}/s")
+    return result
+
+
+def run(library: SyntheticLibrary, work_dir: Path, jobs: int, scenarios: List[str], profile: bool) \
+        -> Dict[str, Result]:
+    """
+    Run the scenarios against the library
+    @param library: The synthetic library, modified by the end to end scenarios
+    @param work_dir: The dir for the files of the scenarios other than the library
+    @param jobs: The number of worker threads
+    @param scenarios: The names of the scenarios to record, the end to end ones they depend on run as well
+    @param profile: Whether to print the cProfile stats of each scenario
+    @return: Dict of scenario name to result
+    """
+    bench = Bench(library, work_dir, jobs)
+    results = {}
+    for name, scenario in MICRO_SCENARIOS.items():
+        if name in scenarios:
+            results[name] = run_scenario(name, scenario, bench, profile)
+
+    end_to_end_names = list(END_TO_END_SCENARIOS.keys())
+    selected_indexes = [end_to_end_names.index(name) for name in scenarios if name in END_TO_END_SCENARIOS]
+    if len(selected_indexes) > 0:
+        with _in_dir(library.root):
+            for name in end_to_end_names[:max(selected_indexes) + 1]:
+                result = run_scenario(name, END_TO_END_SCENARIOS[name], bench, profile)
+                if name in scenarios:
+                    results[name] = result
+            bench.organizer.cache._conn.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Compare the throughput of each scenario against the baseline, so that runs of different sizes are comparable
+    @param results: The results as written by main
+    @param baseline: The baseline results
+    @param tolerance: The share of throughput a scenario may lose before being flagged
+    @return: The names of the regressed scenarios
+    """
+    regressions = []
+    print(f"{'Scenario':<16} {'Rate':>12} {'Baseline':>12} {'Change':>8}")
+    for name, result in results["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            print(f"{name:<16} {result['rate']:>12.1f} {'-':>12} {'new':>8}")
+            continue
+        change = result["rate"] / max(base["rate"], 1e-9) - 1
+        regressed = change < -tolerance and max(result["seconds"], base["seconds"]) >= MIN_SECONDS
+        print(f"{name:<16} {result['rate']:>12.1f} {base['rate']:>12.1f} {change:>+8.0%}"
+              f"{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Photo Organizer benchmarks.")
+    parser.add_argument("--size", choices=SIZES.keys(), default="small", help="size of the synthetic library")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="share of incoming files already in library")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="average file size in bytes")
+    parser.add_argument("--jobs", type=int, default=4, help="number of worker threads")
+    parser.add_argument("--scenario", action="append", choices=list(MICRO_SCENARIOS) + list(END_TO_END_SCENARIOS),
+                        help="scenario to run, can be repeated, all by default")
+    parser.add_argument("--out", type=Path, default=Path("benchmark_results.json"), help="results JSON file")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline JSON file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="throughput loss flagged as a regression")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--profile", action="store_true", help="print the cProfile stats of each scenario")
+    parser.add_argument("--work-dir", type=Path, help="keep the library and files here instead of a temp dir")
+    parser.add_argument("--verbose", action="store_true", help="show the logs of the organizer")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    scenarios = args.scenario or list(MICRO_SCENARIOS) + list(END_TO_END_SCENARIOS)
+    file_count, incoming_count = SIZES[args.size]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = (args.work_dir or Path(temp_dir)).resolve()
+        start = time.perf_counter()
+        library = build_library(work_dir / "library", file_count, incoming_count, args.duplicate_rate,
+                                args.file_size)
+        print(f"Built {file_count} library and {incoming_count} incoming files ({library.duplicate_count} duplicates,"
+              f" {library.total_bytes / 1024 / 1024:.0f} MB) in {time.perf_counter() - start:.1f} s")
+        results = run(library, work_dir, args.jobs, scenarios, args.profile)
+
+    output = {
+        "meta": {
+            "size": args.size,
+            "library_files": file_count,
+            "incoming_files": incoming_count,
+            "duplicates": library.duplicate_count,
+            "file_size": args.file_size,
+            "jobs": args.jobs,
+            "pillow": Image is not None,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "scenarios": {name: {"seconds": round(result.seconds, 4), "count": round(result.count, 2),
+                             "unit": result.unit, "rate": round(result.count / max(result.seconds, 1e-9), 2)}
+                      for name, result in results.items()}
+    }
+    args.out.write_text(json.dumps(output, indent=2))
+    print(f"Results written to {args.out}")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(output, indent=2))
+        print(f"Baseline updated at {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create one")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline["meta"]["size"] != args.size or baseline["meta"]["platform"] != output["meta"]["platform"]:
+        print(f"Baseline measured on {baseline['meta']['size']} size and {baseline['meta']['platform']}, "
+              f"compare with care")
+    regressions = compare(output, baseline, args.tolerance)
+    if len(regressions) > 0:
+        print(f"Regressions beyond {args.tolerance:.0%}: {regressions}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
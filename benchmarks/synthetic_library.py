@@ -0,0 +1,121 @@
+"""
+Generator of synthetic libraries for the benchmarks, laid out like a real one:
+- Library files under YYYY/MM, named by their time like 20200801_093650.jpg, with a few sidecar files
+- Incoming files named like phones do (IMG_20200801_093650.jpg), or carrying their time only in the headers
+- A share of the incoming files are copies of library files, for the dedup to find
+Photos carry a real EXIF DateTimeOriginal, encoded by Pillow if installed, and videos a QuickTime creation date,
+so that no file needs exiftool
+"""
+import datetime
+import io
+import json
+import random
+from pathlib import Path
+from typing import List, NamedTuple
+
+from benchmarks.media_builders import box, make_heic, make_jpeg, make_quicktime, make_tiff
+
+try:
+    from PIL import Image
+except ImportError:  # The EXIF is then wrapped in a minimal JPEG built by hand
+    Image = None
+
+# Suffixes by share of the files, sidecars are not media and are skipped by the scans
+SUFFIX_WEIGHTS = {".jpg": 60, ".heic": 20, ".mp4": 8, ".mov": 7, ".aae": 5}
+START_TIME = datetime.datetime(2000, 1, 1)
+TIME_RANGE_SECONDS = 20 * 365 * 86400
+
+
+class SyntheticLibrary(NamedTuple):
+    root: Path
+    library_paths: List[Path]
+    incoming_paths: List[Path]
+    duplicate_count: int
+    total_bytes: int
+
+
+def build_library(root: Path, file_count: int, incoming_count: int = 0, duplicate_rate: float = 0.1,
+                  file_size: int = 64 * 1024, seed: int = 0) -> SyntheticLibrary:
+    """
+    Build a synthetic library with a config.json under root, same seed and sizes giving the same files
+    @param root: The library dir, created if missing
+    @param file_count: The number of files in the library
+    @param incoming_count: The number of files in the incoming dir
+    @param duplicate_rate: The share of incoming files which are copies of library files
+    @param file_size: The average file size in bytes, sizes range from half to 1.5 times of it
+    @param seed: The random seed
+    @return: The library
+    """
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "config.json").write_text(json.dumps({"IncomingDir": "Incoming"}))
+    incoming_dir = root / "Incoming"
+    incoming_dir.mkdir(exist_ok=True)
+    suffixes = list(SUFFIX_WEIGHTS.keys())
+    weights = list(SUFFIX_WEIGHTS.values())
+
+    # Distinct times, so that the library names do not collide
+    seconds = rng.sample(range(TIME_RANGE_SECONDS), file_count + incoming_count)
+    times = [START_TIME + datetime.timedelta(seconds=second) for second in seconds]
+
+    total_bytes = 0
+    library_paths = []
+    for time in times[:file_count]:
+        suffix = rng.choices(suffixes, weights)[0]
+        path = root / f"{time:%Y}" / f"{time:%m}" / f"{time:%Y%m%d_%H%M%S}{suffix}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        total_bytes += _write_media(path, time, file_size, rng)
+        library_paths.append(path)
+
+    media_paths = [path for path in library_paths if path.suffix != ".aae"]
+    duplicate_count = 0
+    incoming_paths = []
+    for index, time in enumerate(times[file_count:]):
+        if len(media_paths) > 0 and rng.random() < duplicate_rate:
+            source = rng.choice(media_paths)
+            path = incoming_dir / f"COPY_{index:06}_{source.name}"
+            path.write_bytes(source.read_bytes())
+            total_bytes += path.stat().st_size
+            duplicate_count += 1
+        else:
+            suffix = rng.choices(suffixes[:-1], weights[:-1])[0]
+            # A quarter only have the time in the headers, like camera files
+            name = f"DSC_{index:06}" if rng.random() < 0.25 else f"IMG_{time:%Y%m%d_%H%M%S}"
+            path = incoming_dir / f"{name}{suffix}"
+            total_bytes += _write_media(path, time, file_size, rng)
+        incoming_paths.append(path)
+
+    return SyntheticLibrary(root, library_paths, incoming_paths, duplicate_count, total_bytes)
+
+
+def _write_media(path: Path, time: datetime.datetime, file_size: int, rng: random.Random) -> int:
+    # Random padding makes every file unique, and gives the hasher realistic sizes to read
+    padding_size = rng.randint(file_size // 2, file_size * 3 // 2)
+    padding = rng.getrandbits(padding_size * 8).to_bytes(padding_size, "little")
+    suffix = path.suffix
+    if suffix == ".jpg":
+        data = _make_photo(time, rng) + padding  # Trailing data after the end of image is ignored by readers
+    elif suffix == ".heic":
+        data = make_heic(make_tiff(f"{time:%Y:%m:%d %H:%M:%S}")) + box(b"free", padding)
+    elif suffix in (".mp4", ".mov"):
+        data = make_quicktime(f"{time:%Y-%m-%dT%H:%M:%S}+0000", _get_media_seconds(time), mdat_first=False) + \
+            box(b"free", padding)
+    else:
+        data = padding
+    path.write_bytes(data)
+    return len(data)
+
+
+def _make_photo(time: datetime.datetime, rng: random.Random) -> bytes:
+    tiff = make_tiff(f"{time:%Y:%m:%d %H:%M:%S}", sub_sec=f"{rng.randrange(1000):03}")
+    if Image is None:
+        return make_jpeg(tiff)
+    output = io.BytesIO()
+    color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    Image.new("RGB", (64, 48), color).save(output, "JPEG", exif=b"Exif\x00\x00" + tiff)
+    return output.getvalue()
+
+
+def _get_media_seconds(time: datetime.datetime) -> int:
+    return int((time - datetime.datetime(1904, 1, 1)).total_seconds())
+
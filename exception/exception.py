@@ -12,3 +12,11 @@ class DatabaseException(Exception):
 
 class AuditException(Exception):
     pass
+
+
+class ExifToolException(Exception):
+    pass
+
+
+class FileMoveException(Exception):
+    pass
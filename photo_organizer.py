@@ -9,7 +9,7 @@ from photo_organizer.config import Config
 from photo_organizer.organizer import Organizer
 
 # All supported actions
-supported_actions = ["audit", "setup", "merge"]
+supported_actions = ["audit", "setup", "merge", "resume", "similar", "watch"]
 
 logging_format = "%(asctime)s %(threadName)s [%(levelname)s] %(message)s"
 
@@ -44,8 +44,11 @@ def parse_args():
     @return: the args
     """
     parser = argparse.ArgumentParser(description='Photo Organizer.')
-    parser.add_argument('action', help="setup, audit or merge")
+    parser.add_argument('action', help="setup, audit, merge, resume, similar or watch")
     parser.add_argument('-debug', action="store_true", help="enable debug logging")
+    parser.add_argument('-jobs', '--jobs', type=int, help="number of worker threads for hashing, overrides config.json")
+    parser.add_argument('-plan-out', '--plan-out', type=Path, help="merge: write the plan to this file instead of moving")
+    parser.add_argument('-apply', '--apply', type=Path, help="merge: move the files as planned in this file")
     return parser.parse_args()
 
 
@@ -59,7 +62,16 @@ def main():
     if args.action not in supported_actions:
         raise InvalidInputException(f"Unsupported command '{args.action}'")
 
+    if (args.plan_out is not None or args.apply is not None) and args.action != "merge":
+        raise InvalidInputException("--plan-out and --apply are only supported by merge")
+    if args.plan_out is not None and args.apply is not None:
+        raise InvalidInputException("--plan-out and --apply cannot be used together")
+
     config = Config()
+    if args.jobs is not None:
+        if args.jobs < 1:
+            raise InvalidInputException(f"Invalid number of jobs {args.jobs}")
+        config.jobs = args.jobs
     setup_file_logging(config, args.action)
     logging.info(f"Running command {args.action}")
 
@@ -69,8 +81,16 @@ def main():
             organizer.audit()
         elif args.action == "setup":
             organizer.setup()
+        elif args.action == "merge" and args.apply is not None:
+            organizer.apply_plan(args.apply)
         elif args.action == "merge":
-            organizer.merge()
+            organizer.merge(plan_out=args.plan_out)
+        elif args.action == "resume":
+            organizer.resume()
+        elif args.action == "similar":
+            organizer.similar()
+        elif args.action == "watch":
+            organizer.watch()
         else:
             raise InvalidInputException(f"Unsupported command '{args.action}'")
     except (InvalidInputException, InvalidConfigException) as ex:
@@ -0,0 +1,71 @@
+from typing import Any, List, Optional, Tuple
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """
+    Get the number of differing bits of two hashes
+    @param a: The first hash
+    @param b: The second hash
+    @return: The Hamming distance
+    """
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over the Hamming distance of hashes, for finding the hashes within a distance of a given one
+    Each child is keyed by its distance to the parent, and by the triangle inequality a search within max_distance
+    only descends into the children keyed within max_distance of the distance to the parent,
+    so that a small max_distance only visits a small part of the tree
+    """
+
+    def __init__(self):
+        # Each node is [hash, items, {distance: child node}], lists rather than objects to keep millions of nodes small
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, hashcode: int, item: Any) -> None:
+        """
+        Add an item to the tree, items of the same hash share a node
+        @param hashcode: The hash of the item
+        @param item: The item, e.g. the file path
+        """
+        self._size += 1
+        if self._root is None:
+            self._root = [hashcode, [item], {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(hashcode, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hashcode, [item], {}]
+                return
+            node = child
+
+    def search(self, hashcode: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        Find the items whose hash is within max_distance of the given hash
+        @param hashcode: The hash to search for
+        @param max_distance: The maximum Hamming distance, inclusive
+        @return: List of (distance, item) sorted by distance
+        """
+        results = []
+        stack = [] if self._root is None else [self._root]
+        while stack:
+            node_hashcode, items, children = stack.pop()
+            distance = hamming_distance(hashcode, node_hashcode)
+            if distance <= max_distance:
+                results.extend((distance, item) for item in items)
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
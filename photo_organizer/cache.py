@@ -1,21 +1,64 @@
+import datetime
+import functools
 import logging
 import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, List
+from typing import Any, Callable, Dict, Optional, List, Iterable, Iterator, Tuple, Union
 
 from exception.exception import DatabaseException
 from photo_organizer.config import Config
 
 
 class Doc:
-    def __init__(self, path: Path, hashcode: str, size: int):
-        self.path = path
+    """
+    A row of the hash table
+    Millions are loaded on large libraries, so the attributes are slots and the path is kept as the str of the row,
+    only turned into a Path when asked for
+    """
+    __slots__ = ("path_str", "hashcode", "size", "algorithm", "mtime_ns", "inode", "device")
+
+    def __init__(self, path: Union[str, Path], hashcode: str, size: int, algorithm: str = "md5",
+                 mtime_ns: Optional[int] = None, inode: Optional[int] = None, device: Optional[int] = None):
+        self.path_str = str(path)
         self.hashcode = hashcode
         self.size = size
+        self.algorithm = algorithm
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.device = device
+
+    @property
+    def path(self) -> Path:
+        return Path(self.path_str)
+
+
+_UPSERT_SQL = "REPLACE INTO hash (path, hashcode, size, algorithm, mtime_ns, inode, device) VALUES (?, ?, ?, ?, ?, ?, ?)"
+_DELETE_SQL = "DELETE FROM hash WHERE path = ?"
+_JOURNAL_STATUS_SQL = "UPDATE journal SET status = ? WHERE incoming_path = ?"
+_IN_CHUNK_SIZE = 500
+_UINT64_MASK = (1 << 64) - 1
+
+# Status of the moves in the journal
+JOURNAL_PLANNED = "planned"
+JOURNAL_MOVED = "moved"
+JOURNAL_FAILED = "failed"
+
+
+def _synchronized(method):
+    # The connection is shared by the threads of the merge pipeline, one statement or transaction at a time
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class Cache:
+    _doc_columns = "path, hashcode, size, algorithm, mtime_ns, inode, device"
+
     def __init__(self, config: Config):
         """
         Creating the cache object depending on a TinyDB file under WorkingDir
@@ -23,39 +66,130 @@ class Cache:
         """
         config.working_dir.mkdir(exist_ok=True)
         self._config = config
-        self._conn = sqlite3.connect(os.path.join(self._config.working_dir, "database.db"), isolation_level=None)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(self._config.working_dir, "database.db"), isolation_level=None,
+                                     check_same_thread=False)
         self._conn.execute("""CREATE TABLE IF NOT EXISTS hash (
                              path text PRIMARY KEY,
                              hashcode text NOT NULL,
-                             size long NOT NULL); """)
+                             size long NOT NULL,
+                             algorithm text NOT NULL DEFAULT 'md5',
+                             mtime_ns integer,
+                             inode integer,
+                             device integer); """)
+        self._migrate()
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS metadata (
+                             fingerprint text NOT NULL,
+                             extractor_version text NOT NULL,
+                             time text,
+                             utc_offset integer,
+                             source text,
+                             PRIMARY KEY (fingerprint, extractor_version)); """)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS journal (
+                             incoming_path text PRIMARY KEY,
+                             hashcode text,
+                             new_path text NOT NULL,
+                             status text NOT NULL); """)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS perceptual (
+                             path text PRIMARY KEY,
+                             mtime_ns integer NOT NULL,
+                             phash integer); """)
         self._conn.execute("""CREATE INDEX IF NOT EXISTS hashcode ON hash (hashcode)""")
+        self._conn.execute("""CREATE INDEX IF NOT EXISTS size ON hash (size)""")
+        self._conn.execute("""CREATE INDEX IF NOT EXISTS file_id ON hash (device, inode)""")
+        # Paths are stored by str(Path), so the separators are the native ones os.path.basename splits on
+        self._conn.create_function("basename", 1, os.path.basename, deterministic=True)
         self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')  # Durable with WAL, only the last commits may be lost
 
     def __del__(self):
         if self._conn is not None:
             self._conn.close()
 
+    def batch(self, batch_size: int = 10000) -> "CacheBatch":
+        """
+        Get a batch for buffering many writes, to be used as a context manager which flushes on exit
+        @param batch_size: The number of writes committed per transaction
+        @return: The batch
+        """
+        return CacheBatch(self, batch_size)
+
+    @_synchronized
     def delete_by_path(self, path: Path) -> None:
         """
-        Get the doc by hash
+        Delete the doc by file path
         @param path: The path
-        @return: The doc
         """
-        path = str(path).lower()
-        self._conn.execute(f"DELETE FROM hash WHERE path = '{path}'")
+        self._conn.execute(_DELETE_SQL, (str(path).lower(),))
 
-    def get_all(self):
-        rows = self._conn.execute(f"SELECT * FROM hash").fetchall()
-        return [self._row_to_doc(row) for row in rows]
+    @_synchronized
+    def delete_many(self, paths: Iterable[Path]) -> None:
+        """
+        Delete the docs by file paths in a single transaction
+        @param paths: The paths
+        """
+        with self._transaction():
+            self._conn.executemany(_DELETE_SQL, ((str(path).lower(),) for path in paths))
+
+    def get_all(self) -> List[Doc]:
+        """
+        Get all docs, prefer iter_docs on large libraries
+        @return: List of docs
+        """
+        return list(self.iter_docs())
+
+    def iter_docs(self, batch_size: int = 10000) -> Iterator[Doc]:
+        """
+        Stream all docs from the cursor batch_size rows at a time, so that the whole table is never in memory
+        The lock is only held while fetching, so the other threads can use the cache while the docs are processed
+        @param batch_size: The number of rows fetched at once
+        @return: Iterator of docs
+        """
+        with self._lock:
+            cursor = self._conn.execute(f"SELECT {self._doc_columns} FROM hash")
+        try:
+            while True:
+                with self._lock:
+                    rows = cursor.fetchmany(batch_size)
+                if len(rows) == 0:
+                    return
+                yield from map(self._row_to_doc, rows)
+        finally:
+            cursor.close()
+
+    @_synchronized
+    def get_duplicate_hashcodes(self, excluded_algorithm: str) -> Dict[str, List[str]]:
+        """
+        Get the paths sharing a hash, grouped by SQLite through the hashcode index
+        @param excluded_algorithm: The algorithm of the rows left out, e.g. the pending ones sharing an empty hash
+        @return: Dict of hashcode to the sorted lowercase paths, only for hashes of more than one path
+        """
+        rows = self._conn.execute("""SELECT hashcode, path FROM hash WHERE algorithm != ? AND hashcode IN (
+                                         SELECT hashcode FROM hash WHERE algorithm != ?
+                                         GROUP BY hashcode HAVING COUNT(*) > 1)
+                                     ORDER BY hashcode, path""", (excluded_algorithm, excluded_algorithm))
+        return self._group_rows(rows)
+
+    @_synchronized
+    def get_duplicate_names(self) -> Dict[str, List[str]]:
+        """
+        Get the paths sharing a file name in different directories, grouped by SQLite
+        @return: Dict of lowercase file name to the sorted lowercase paths, only for names of more than one path
+        """
+        rows = self._conn.execute("""SELECT basename(path) AS name, path FROM hash WHERE basename(path) IN (
+                                         SELECT basename(path) FROM hash GROUP BY 1 HAVING COUNT(*) > 1)
+                                     ORDER BY name, path""")
+        return self._group_rows(rows)
 
+    @_synchronized
     def get_doc_by_path(self, path: Path) -> Optional[Doc]:
         """
         Get the doc by file path
         @param path: The file path
         @return: The doc
         """
-        path = str(path).lower()
-        rows = self._conn.execute(f"SELECT * FROM hash WHERE path = '{path}'").fetchall()
+        rows = self._conn.execute(f"SELECT {self._doc_columns} FROM hash WHERE path = ?",
+                                  (str(path).lower(),)).fetchall()
         if len(rows) == 0:
             return None
         elif len(rows) > 1:
@@ -63,26 +197,419 @@ class Cache:
 
         return self._row_to_doc(rows[0])
 
+    @_synchronized
     def get_docs_by_hashcode(self, hashcode: str) -> List[Doc]:
         """
         Get the doc by hash
         @param hashcode: The hashcode
         @return: The doc
         """
-        rows = self._conn.execute(f"SELECT * FROM hash WHERE hashcode = '{hashcode}'").fetchall()
+        rows = self._conn.execute(f"SELECT {self._doc_columns} FROM hash WHERE hashcode = ?", (hashcode,)).fetchall()
         return [self._row_to_doc(row) for row in rows]
 
-    def upsert_hashcode_doc(self, path: Path, hashcode: str, size: int) -> None:
+    @_synchronized
+    def get_paths_in_dir(self, dir_path: Path) -> List[str]:
+        """
+        Get the paths of the docs directly under a directory, through a range scan of the path index
+        @param dir_path: The directory path like 2020/08
+        @return: The lowercase paths
+        """
+        prefix = os.path.join(str(dir_path).lower(), "")
+        rows = self._conn.execute("SELECT path FROM hash WHERE path >= ? AND path < ?",
+                                  (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))).fetchall()
+        return [row[0] for row in rows if os.sep not in row[0][len(prefix):]]
+
+    @_synchronized
+    def get_docs_by_hashcodes(self, hashcodes: Iterable[str]) -> Dict[str, List[Doc]]:
+        """
+        Get the docs by many hashes, with one query per chunk of hashes
+        @param hashcodes: The hashcodes
+        @return: Dict of hashcode to docs, hashcodes without doc are left out
+        """
+        return self._get_docs_by_values("hashcode", hashcodes, lambda doc: doc.hashcode)
+
+    @_synchronized
+    def get_docs_by_sizes(self, sizes: Iterable[int]) -> Dict[int, List[Doc]]:
+        """
+        Get the docs by many file sizes, with one query per chunk of sizes
+        @param sizes: The file sizes
+        @return: Dict of size to docs, sizes without doc are left out
+        """
+        return self._get_docs_by_values("size", sizes, lambda doc: doc.size)
+
+    @_synchronized
+    def upsert_hashcode_doc(self, path: Path, hashcode: str, size: int, algorithm: str = "md5",
+                            mtime_ns: Optional[int] = None, inode: Optional[int] = None,
+                            device: Optional[int] = None) -> None:
         """
         Insert an record into the DB
         @param path: The file path
         @param hashcode: The MD5
         @param size: The file size
+        @param algorithm: The algorithm tag of the hashcode
+        @param mtime_ns: The file modification time in nanoseconds when hashed
+        @param inode: The file inode (file index on Windows) when hashed
+        @param device: The device (volume serial number on Windows) of the file when hashed
         @return: success or not
         """
-        path = str(path).lower()
-        self._conn.execute(f"REPLACE INTO hash VALUES ('{path}', '{hashcode}', {size})")
+        self._conn.execute(_UPSERT_SQL, self._doc_to_row(Doc(path, hashcode, size, algorithm, mtime_ns, inode, device)))
+
+    @_synchronized
+    def upsert_many(self, docs: Iterable[Doc]) -> None:
+        """
+        Insert the records into the DB in a single transaction
+        @param docs: The docs
+        """
+        with self._transaction():
+            self._conn.executemany(_UPSERT_SQL, (self._doc_to_row(doc) for doc in docs))
+
+    @_synchronized
+    def get_metadata_times(self, fingerprints: Iterable[str], extractor_version: str) \
+            -> Dict[str, Optional[Tuple[datetime.datetime, str]]]:
+        """
+        Get the times extracted earlier by the same version of extractors
+        @param fingerprints: The content fingerprints of the files
+        @param extractor_version: The version of the extractors
+        @return: Dict of fingerprint to (time, source), or None if no time was found, fingerprints not cached are left out
+        """
+        fingerprints = list(dict.fromkeys(fingerprints))
+        fingerprint_to_time = {}
+        for start in range(0, len(fingerprints), _IN_CHUNK_SIZE):
+            chunk = fingerprints[start:start + _IN_CHUNK_SIZE]
+            rows = self._conn.execute(f"SELECT fingerprint, time, utc_offset, source FROM metadata "
+                                      f"WHERE extractor_version = ? AND fingerprint IN ({', '.join('?' * len(chunk))})",
+                                      [extractor_version] + chunk).fetchall()
+            for fingerprint, time, utc_offset, source in rows:
+                if time is None:
+                    fingerprint_to_time[fingerprint] = None
+                    continue
+                time = datetime.datetime.fromisoformat(time)
+                if utc_offset is not None:
+                    time = time.replace(tzinfo=datetime.timezone(datetime.timedelta(seconds=utc_offset)))
+                fingerprint_to_time[fingerprint] = (time, source)
+        return fingerprint_to_time
+
+    @_synchronized
+    def upsert_metadata_times(self, entries: Iterable[Tuple[str, Optional[Tuple[datetime.datetime, str]]]],
+                              extractor_version: str) -> None:
+        """
+        Insert the extracted times into the DB in a single transaction
+        @param entries: Iterable of (fingerprint, (time, source) or None if no time was found)
+        @param extractor_version: The version of the extractors
+        """
+        rows = []
+        for fingerprint, time_and_source in entries:
+            if time_and_source is None:
+                rows.append((fingerprint, extractor_version, None, None, None))
+                continue
+            time, source = time_and_source
+            utc_offset = time.utcoffset()
+            rows.append((fingerprint, extractor_version, time.replace(tzinfo=None).isoformat(),
+                         None if utc_offset is None else int(utc_offset.total_seconds()), source))
+        with self._transaction():
+            self._conn.executemany("REPLACE INTO metadata VALUES (?, ?, ?, ?, ?)", rows)
+
+    @_synchronized
+    def delete_metadata_of_other_versions(self, extractor_version: str) -> int:
+        """
+        Invalidate the times extracted by other versions of extractors
+        @param extractor_version: The current version of the extractors
+        @return: The number of records deleted
+        """
+        return self._conn.execute("DELETE FROM metadata WHERE extractor_version != ?", (extractor_version,)).rowcount
+
+    @_synchronized
+    def start_journal(self, entries: Iterable[Tuple[Path, Optional[str], Path]], append: bool = False) -> None:
+        """
+        Replace the journal with the planned moves of a merge, in a single transaction
+        The moves are checkpointed through CacheBatch.set_journal_status along with the hash of the moved file
+        @param entries: Iterable of (incoming path, hashcode or None if deferred, new path)
+        @param append: Keep the moves not done yet, e.g. the failed ones of earlier batches for resume to retry,
+                       a planned move of the same incoming path replacing the former one
+        """
+        with self._transaction():
+            if append:
+                self._conn.execute("DELETE FROM journal WHERE status = ?", (JOURNAL_MOVED,))
+            else:
+                self._conn.execute("DELETE FROM journal")
+            self._conn.executemany("REPLACE INTO journal VALUES (?, ?, ?, ?)",
+                                   ((str(incoming_path), hashcode, str(new_path), JOURNAL_PLANNED)
+                                    for incoming_path, hashcode, new_path in entries))
+
+    @_synchronized
+    def get_journal_entries(self) -> List[Tuple[Path, Optional[str], Path]]:
+        """
+        Get the moves of the journal which are not done yet, in the planned order
+        @return: List of (incoming path, hashcode or None if deferred, new path)
+        """
+        rows = self._conn.execute("SELECT incoming_path, hashcode, new_path FROM journal WHERE status != ? "
+                                  "ORDER BY rowid", (JOURNAL_MOVED,)).fetchall()
+        return [(Path(incoming_path), hashcode, Path(new_path)) for incoming_path, hashcode, new_path in rows]
+
+    @_synchronized
+    def clear_journal(self) -> None:
+        """
+        Clear the journal once all the moves are done
+        """
+        self._conn.execute("DELETE FROM journal")
+
+    @_synchronized
+    def get_perceptual_hashes(self) -> Dict[str, Tuple[int, Optional[int]]]:
+        """
+        Get all the perceptual hashes of the library photos
+        @return: Dict of lowercase path to (mtime_ns when hashed, hash or None if the photo cannot be decoded)
+        """
+        rows = self._conn.execute("SELECT path, mtime_ns, phash FROM perceptual").fetchall()
+        return {path: (mtime_ns, None if phash is None else phash & _UINT64_MASK) for path, mtime_ns, phash in rows}
+
+    @_synchronized
+    def upsert_perceptual_hashes(self, entries: Iterable[Tuple[Path, int, Optional[int]]]) -> None:
+        """
+        Insert the perceptual hashes into the DB in a single transaction
+        @param entries: Iterable of (path, mtime_ns when hashed, unsigned 64-bit hash or None if not decodable)
+        """
+        # SQLite integers are signed 64-bit, the hash is stored in two's complement
+        rows = ((str(path).lower(), mtime_ns, None if phash is None else phash - (phash >> 63 << 64))
+                for path, mtime_ns, phash in entries)
+        with self._transaction():
+            self._conn.executemany("REPLACE INTO perceptual VALUES (?, ?, ?)", rows)
+
+    @_synchronized
+    def delete_perceptual_hashes(self, paths: Iterable[str]) -> None:
+        """
+        Delete the perceptual hashes of the photos no longer in the library
+        @param paths: The lowercase paths as returned by get_perceptual_hashes
+        """
+        with self._transaction():
+            self._conn.executemany("DELETE FROM perceptual WHERE path = ?", ((path,) for path in paths))
+
+    @_synchronized
+    def count(self) -> int:
+        """
+        Get the number of docs
+        @return: The count
+        """
+        return self._conn.execute("SELECT COUNT(*) FROM hash").fetchone()[0]
+
+    @_synchronized
+    def load_scan(self, entries: Iterable[Tuple[str, int, int, int, int, str]]) -> int:
+        """
+        Load the scanned library files into the temp table scan, to be reconciled with the docs by the scan_* methods
+        @param entries: Iterable of (path, size, mtime_ns, inode, device, algorithm expected for the size)
+        @return: The number of scanned files
+        """
+        self._conn.execute("DROP TABLE IF EXISTS temp.scan")
+        self._conn.execute("""CREATE TEMP TABLE scan (
+                             path text PRIMARY KEY,
+                             real_path text NOT NULL,
+                             size long NOT NULL,
+                             mtime_ns integer,
+                             inode integer,
+                             device integer,
+                             algorithm text NOT NULL); """)
+        self._conn.execute("CREATE INDEX temp.scan_file_id ON scan (device, inode)")
+        with self._transaction():
+            self._conn.executemany("INSERT OR REPLACE INTO temp.scan VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   ((path.lower(), path, size, mtime_ns, inode, device, algorithm)
+                                    for path, size, mtime_ns, inode, device, algorithm in entries))
+        return self._conn.execute("SELECT COUNT(*) FROM temp.scan").fetchone()[0]
+
+    @_synchronized
+    def drop_scan(self) -> None:
+        self._conn.execute("DROP TABLE IF EXISTS temp.scan")
+
+    @_synchronized
+    def get_scan_paths_without_file_id(self) -> List[str]:
+        """
+        Get the scanned files without file id, which are missing in docs or whose doc has no stat recorded yet
+        @return: The paths
+        """
+        rows = self._conn.execute("""SELECT s.real_path FROM temp.scan s LEFT JOIN hash h ON h.path = s.path
+                                     WHERE s.inode = 0 AND (h.path IS NULL OR h.mtime_ns IS NULL)""").fetchall()
+        return [row[0] for row in rows]
+
+    @_synchronized
+    def update_scan_file_ids(self, entries: Iterable[Tuple[str, int, int]]) -> None:
+        """
+        Fill in the file ids missing from the directory listing (e.g. on Windows)
+        @param entries: Iterable of (path, inode, device)
+        """
+        with self._transaction():
+            self._conn.executemany("UPDATE temp.scan SET inode = ?, device = ? WHERE path = ?",
+                                   ((inode, device, path.lower()) for path, inode, device in entries))
+
+    @_synchronized
+    def scan_carry_over_moved(self) -> int:
+        """
+        For scanned files missing in docs, take over the doc of a file no longer scanned with the same file id,
+        as long as the size, mtime and algorithm are unchanged
+        @return: The number of docs carried over
+        """
+        with self._transaction():
+            cursor = self._conn.execute("""
+                INSERT OR REPLACE INTO hash (path, hashcode, size, algorithm, mtime_ns, inode, device)
+                SELECT s.path, h.hashcode, h.size, h.algorithm, s.mtime_ns, s.inode, s.device
+                FROM temp.scan s JOIN hash h ON h.device = s.device AND h.inode = s.inode
+                WHERE s.inode != 0 AND h.size = s.size AND h.mtime_ns = s.mtime_ns AND h.algorithm = s.algorithm
+                AND NOT EXISTS (SELECT 1 FROM hash WHERE path = s.path)
+                AND NOT EXISTS (SELECT 1 FROM temp.scan WHERE path = h.path)""")
+        return cursor.rowcount
+
+    @_synchronized
+    def scan_delete_missing(self) -> int:
+        """
+        Delete the docs whose file is no longer scanned
+        @return: The number of docs deleted
+        """
+        with self._transaction():
+            cursor = self._conn.execute("DELETE FROM hash WHERE path NOT IN (SELECT path FROM temp.scan)")
+        return cursor.rowcount
+
+    @_synchronized
+    def scan_record_stat(self) -> int:
+        """
+        Record the stat for docs hashed before the stat was recorded, trusted as long as the size is unchanged
+        @return: The number of docs updated
+        """
+        with self._transaction():
+            cursor = self._conn.execute("""
+                INSERT OR REPLACE INTO hash (path, hashcode, size, algorithm, mtime_ns, inode, device)
+                SELECT h.path, h.hashcode, h.size, h.algorithm, s.mtime_ns, s.inode, s.device
+                FROM hash h JOIN temp.scan s ON s.path = h.path
+                WHERE h.mtime_ns IS NULL AND h.size = s.size AND h.algorithm = s.algorithm""")
+        return cursor.rowcount
+
+    @_synchronized
+    def get_scan_paths_to_hash(self) -> List[Tuple[str, int, int]]:
+        """
+        Get the scanned files which are new, modified since hashing (size or mtime changed)
+        or hashed by an outdated algorithm
+        @return: List of (path, size, mtime_ns) as scanned
+        """
+        return self._conn.execute("""SELECT s.real_path, s.size, s.mtime_ns FROM temp.scan s
+                                     LEFT JOIN hash h ON h.path = s.path
+                                     WHERE h.path IS NULL OR h.size != s.size OR h.mtime_ns IS NOT s.mtime_ns
+                                     OR h.algorithm != s.algorithm""").fetchall()
+
+    def _get_docs_by_values(self, column: str, values: Iterable, key_selector: Callable[[Doc], Any]) \
+            -> Dict[Any, List[Doc]]:
+        # Chunked below the 999 variables limit of older SQLite versions
+        values = list(dict.fromkeys(values))
+        key_to_docs = {}
+        for start in range(0, len(values), _IN_CHUNK_SIZE):
+            chunk = values[start:start + _IN_CHUNK_SIZE]
+            rows = self._conn.execute(f"SELECT {self._doc_columns} FROM hash "
+                                      f"WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+            for doc in [self._row_to_doc(row) for row in rows]:
+                key_to_docs.setdefault(key_selector(doc), []).append(doc)
+        return key_to_docs
+
+    @staticmethod
+    def _group_rows(rows: Iterable[Tuple[str, str]]) -> Dict[str, List[str]]:
+        # The rows are ordered by key, so only the duplicates found by SQLite are ever held in memory
+        key_to_paths = {}
+        for key, path in rows:
+            key_to_paths.setdefault(key, []).append(path)
+        return key_to_paths
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Explicit transaction on the autocommit connection, so that many writes share a single commit
+        The lock is held throughout, so statements of other threads do not end up inside the transaction
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _migrate(self) -> None:
+        """
+        Upgrade the hash table created by older versions in place
+        """
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(hash)").fetchall()]
+        if "algorithm" not in columns:
+            # Before the algorithm tag existed, large files were identified by their size only
+            logging.info("Migrating hash table: adding algorithm column")
+            self._conn.execute("ALTER TABLE hash ADD COLUMN algorithm text NOT NULL DEFAULT 'md5'")
+            self._conn.execute("UPDATE hash SET algorithm = 'size' WHERE hashcode = CAST(size AS text)")
+        for column in ["mtime_ns", "inode", "device"]:
+            if column not in columns:
+                # Left as NULL, setup records the stat of existing rows without rehashing them
+                logging.info(f"Migrating hash table: adding {column} column")
+                self._conn.execute(f"ALTER TABLE hash ADD COLUMN {column} integer")
 
     @staticmethod
     def _row_to_doc(row):
-        return Doc(Path(row[0]), row[1], row[2])
+        return Doc(*row)
+
+    @staticmethod
+    def _doc_to_row(doc: Doc) -> Tuple:
+        return doc.path_str.lower(), doc.hashcode, doc.size, doc.algorithm, doc.mtime_ns, doc.inode, doc.device
+
+
+class CacheBatch:
+    """
+    Buffer of Cache writes, flushed with executemany in one transaction every batch_size writes
+    Writes are applied in order, reads through the Cache only see them once flushed
+    """
+
+    def __init__(self, cache: Cache, batch_size: int):
+        self._cache = cache
+        self._batch_size = batch_size
+        self._statements = []  # List of (sql, rows) in order
+        self._row_count = 0
+
+    def __enter__(self) -> "CacheBatch":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def delete_by_path(self, path: Path) -> None:
+        """
+        Delete the doc by file path
+        @param path: The path
+        """
+        self._add(_DELETE_SQL, (str(path).lower(),))
+
+    def upsert_hashcode_doc(self, path: Path, hashcode: str, size: int, algorithm: str = "md5",
+                            mtime_ns: Optional[int] = None, inode: Optional[int] = None,
+                            device: Optional[int] = None) -> None:
+        """
+        Insert an record into the DB, see Cache.upsert_hashcode_doc
+        """
+        self._add(_UPSERT_SQL, (str(path).lower(), hashcode, size, algorithm, mtime_ns, inode, device))
+
+    def set_journal_status(self, incoming_path: Path, status: str) -> None:
+        """
+        Checkpoint a move of the journal, committed in the same transaction as the hash of the moved file
+        @param incoming_path: The incoming path of the move
+        @param status: The status like JOURNAL_MOVED
+        """
+        self._add(_JOURNAL_STATUS_SQL, (status, str(incoming_path)))
+
+    def flush(self) -> None:
+        """
+        Write the buffered records in a single transaction
+        """
+        if self._row_count == 0:
+            return
+        with self._cache._transaction():
+            for sql, rows in self._statements:
+                self._cache._conn.executemany(sql, rows)
+        self._statements = []
+        self._row_count = 0
+
+    def _add(self, sql: str, row: Tuple) -> None:
+        # Consecutive writes of the same statement share one executemany
+        if len(self._statements) == 0 or self._statements[-1][0] != sql:
+            self._statements.append((sql, []))
+        self._statements[-1][1].append(row)
+        self._row_count += 1
+        if self._row_count >= self._batch_size:
+            self.flush()
@@ -3,6 +3,7 @@ import logging
 from pathlib import Path
 
 from exception.exception import InvalidConfigException
+from .renamer.file_name_time_extractor import FileNameTimeExtractor
 
 
 class Config:
@@ -13,6 +14,14 @@ class Config:
         cur_working_dir - The current working dir where the script is run
         incoming_dir - The directory of the incoming medias
         working_dir - The directory of dbs, logs and other temporary files
+        jobs - The number of worker threads for hashing
+        mmap_threshold - The size in MB from which files are hashed through mmap, None to always stream them
+        move_jobs - The number of files moved concurrently by merge
+        cache_batch_size - The number of cache writes committed per transaction
+        file_name_patterns - The strftime like patterns of the time in file names, None for the default ones
+        sub_second_names - Whether to append the milliseconds of the time to the new file names
+        similar_check - Whether merge warns about incoming photos similar to library ones, needs Pillow and NumPy
+        similar_distance - The maximum Hamming distance of the perceptual hashes of similar photos
         """
         self.cur_working_dir = Path(".")
         config_file_path = self.cur_working_dir / "config.json"
@@ -30,6 +39,40 @@ class Config:
 
         self.md5_size_limit = 100
 
+        self.mmap_threshold = config.get("MmapThreshold", None)
+        if self.mmap_threshold is not None:
+            self._validate_positive_int(self.mmap_threshold, "MmapThreshold")
+
+        self.jobs = config.get("Jobs", 8)
+        self._validate_positive_int(self.jobs, "Jobs")
+
+        self.move_jobs = config.get("MoveJobs", 4)
+        self._validate_positive_int(self.move_jobs, "MoveJobs")
+
+        self.cache_batch_size = config.get("CacheBatchSize", 1000)
+        self._validate_positive_int(self.cache_batch_size, "CacheBatchSize")
+
+        self.file_name_patterns = config.get("FileNamePatterns", None)
+        if self.file_name_patterns is not None:
+            self._validate_string_list(self.file_name_patterns, "FileNamePatterns")
+            try:
+                FileNameTimeExtractor(self.file_name_patterns)
+            except ValueError as e:
+                raise InvalidConfigException(f"FileNamePatterns is invalid: {e}")
+
+        self.sub_second_names = config.get("SubSecondNames", False)
+        if not isinstance(self.sub_second_names, bool):
+            raise InvalidConfigException(f"SubSecondNames must be true or false but got {self.sub_second_names}")
+
+        self.similar_check = config.get("SimilarCheck", False)
+        if not isinstance(self.similar_check, bool):
+            raise InvalidConfigException(f"SimilarCheck must be true or false but got {self.similar_check}")
+
+        self.similar_distance = config.get("SimilarDistance", 6)
+        if not isinstance(self.similar_distance, int) or not 0 <= self.similar_distance <= 64:
+            raise InvalidConfigException(f"SimilarDistance must be an integer from 0 to 64 but got "
+                                         f"{self.similar_distance}")
+
         logging.debug(f"Config: {config}")
 
     @staticmethod
@@ -37,6 +80,16 @@ class Config:
         if not dir_path.exists():
             raise InvalidConfigException(f"{dir_name} directory {dir_path} does not exists")
 
+    @staticmethod
+    def _validate_positive_int(value, name):
+        if not isinstance(value, int) or value < 1:
+            raise InvalidConfigException(f"{name} must be a positive integer but got {value}")
+
+    @staticmethod
+    def _validate_string_list(value, name):
+        if not isinstance(value, list) or not all(isinstance(item, str) and item for item in value):
+            raise InvalidConfigException(f"{name} must be a list of non-empty strings but got {value}")
+
     @staticmethod
     def _get_or_raise(config, key):
         if key not in config:
@@ -0,0 +1,38 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_bounded(func: Callable[[T], R], items: Iterable[T], jobs: int, max_pending: int,
+                thread_name_prefix: str) -> Iterator[R]:
+    """
+    Apply func to the items on a pool of worker threads and stream the results back in completion order
+    Unlike ThreadPoolExecutor.map, at most max_pending items are submitted at any time,
+    so that the items can be a lazy iterable of any size and the results are consumed as they complete
+    @param func: The function run on the worker threads
+    @param items: The items
+    @param jobs: The number of worker threads, 1 for running func on the calling thread
+    @param max_pending: The number of items submitted but not yielded yet at most
+    @param thread_name_prefix: The name prefix of the worker threads
+    @return: Iterator of the results in completion order
+    """
+    if jobs <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix=thread_name_prefix) as executor:
+        pending = set()
+        for item in items:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(func, item))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
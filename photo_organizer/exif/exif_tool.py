@@ -1,12 +1,175 @@
-import subprocess
 import json
+import logging
+import queue
+import subprocess
+import threading
+import time
 from pathlib import Path
+from typing import List, Sequence, Union
+
+from exception.exception import ExifToolException
 
 
 class ExifTool:
-    def __init__(self, executable: Path):
+    """
+    Wrapper of exiftool, running a pool of long-lived "-stay_open" sessions
+    so that the interpreter start-up is paid once per session instead of once per file
+    """
+
+    def __init__(self, executable: Union[Path, Sequence[str]], sessions: int = 1, timeout: float = 60):
+        """
+        @param executable: The exiftool executable, or the command line launching it
+        @param sessions: The maximum number of exiftool processes serving calls in parallel
+        @param timeout: The seconds to wait for the response of a call before restarting the session
+        """
         self.executable = executable
+        self.timeout = timeout
+        self._max_sessions = sessions
+        self._sessions = []
+        self._idle_sessions = queue.Queue()
+        self._lock = threading.Lock()
+
+    def __del__(self):
+        self.close()
 
     def get_metadata(self, path: Path):
-        out = subprocess.check_output([self.executable, "-G", "-j", "-n", path])
-        return json.loads(out)
+        """
+        Get all the metadata of a file
+        @param path: The file path
+        @return: The list of metadata dicts as returned by "exiftool -j", empty if the file can't be read
+        """
+        out = self.execute(["-G", "-j", "-n", str(path)])
+        return json.loads(out) if out.strip() else []
+
+    def get_metadata_batch(self, paths: Sequence[Path], tags: Sequence[str] = (), fast: int = 0) -> List[dict]:
+        """
+        Get the metadata of many files with a single call
+        @param paths: The file paths
+        @param tags: The tags to extract like "EXIF:DateTimeOriginal", all tags if empty
+        @param fast: The exiftool -fast level, 0 to read the files fully
+        @return: The list of metadata dicts as returned by "exiftool -j", files that can't be read are left out
+                 SourceFile is the path with forward slashes
+        """
+        if len(paths) == 0:
+            return []
+        args = ["-G", "-j", "-n"] + ([f"-fast{fast}"] if fast else []) + [f"-{tag}" for tag in tags]
+        out = self.execute(args + [Path(path).as_posix() for path in paths])
+        return json.loads(out) if out.strip() else []
+
+    def execute(self, args: List[str]) -> str:
+        """
+        Run exiftool with the args on an idle session, restarting the session once if it crashed or timed out
+        @param args: The exiftool arguments
+        @return: The stdout of exiftool
+        """
+        session = self._acquire_session()
+        try:
+            try:
+                return session.execute(args)
+            except ExifToolException as ex:
+                logging.warning(f"Restarting exiftool session: {ex.args[0]}")
+                return session.execute(args)
+        finally:
+            self._idle_sessions.put(session)
+
+    def close(self) -> None:
+        """
+        Stop all the exiftool sessions
+        """
+        for session in getattr(self, "_sessions", []):
+            session.stop()
+
+    def _acquire_session(self) -> "_ExifToolSession":
+        try:
+            return self._idle_sessions.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._sessions) < self._max_sessions:
+                command = [str(self.executable)] if isinstance(self.executable, (str, Path)) \
+                    else [str(part) for part in self.executable]
+                session = _ExifToolSession(command, self.timeout)
+                self._sessions.append(session)
+                return session
+        return self._idle_sessions.get()
+
+
+class _ExifToolSession:
+    """
+    A single exiftool process reading arguments from stdin, each call ends with "-executeNUM",
+    and the response ends with "{readyNUM}" on stdout
+    """
+
+    def __init__(self, command: List[str], timeout: float):
+        self._command = command
+        self._timeout = timeout
+        self._process = None
+        self._stdout_lines = None
+        self._sequence = 0
+
+    def execute(self, args: List[str]) -> str:
+        if self._process is None or self._process.poll() is not None:
+            self._start()
+
+        self._sequence += 1
+        ready_line = f"{{ready{self._sequence}}}"
+        request = "\n".join(["-charset", "filename=utf8"] + args + [f"-execute{self._sequence}"]) + "\n"
+        try:
+            self._process.stdin.write(request.encode("utf-8"))
+            self._process.stdin.flush()
+        except OSError as ex:
+            raise ExifToolException(f"exiftool is not accepting requests: {ex}")
+
+        lines = []
+        deadline = time.monotonic() + self._timeout
+        while True:
+            try:
+                line = self._stdout_lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self._kill()
+                raise ExifToolException(f"exiftool timed out after {self._timeout}s for {args}")
+            if line is None:
+                self._kill()
+                raise ExifToolException(f"exiftool exited unexpectedly for {args}")
+            if line.rstrip() == ready_line:
+                return "".join(lines)
+            lines.append(line)
+
+    def stop(self) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.write(b"-stay_open\nFalse\n")
+            process.stdin.flush()
+            process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+
+    def _kill(self) -> None:
+        process, self._process = self._process, None
+        if process is not None:
+            process.kill()
+            process.wait()
+
+    def _start(self) -> None:
+        self.stop()
+        self._process = subprocess.Popen(self._command + ["-stay_open", "True", "-@", "-"],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._stdout_lines = queue.Queue()
+        threading.Thread(target=self._read_stdout, args=(self._process, self._stdout_lines), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self._process,), daemon=True).start()
+
+    @staticmethod
+    def _read_stdout(process: subprocess.Popen, lines: queue.Queue) -> None:
+        # Reading on a thread, as pipes can't be polled with a timeout on Windows
+        for line in iter(process.stdout.readline, b""):
+            lines.put(line.decode("utf-8", errors="replace"))
+        lines.put(None)
+
+    @staticmethod
+    def _read_stderr(process: subprocess.Popen) -> None:
+        for line in iter(process.stderr.readline, b""):
+            logging.debug(f"exiftool: {line.decode('utf-8', errors='replace').rstrip()}")
@@ -0,0 +1,361 @@
+"""
+In-process parser of the capture time stored in the headers of JPEG, HEIC and QuickTime (MP4/MOV) files
+Only the few KB holding the metadata are read with bounded, seek-based reads
+The values and source names follow what exiftool reports with "-G -n", so both can be used interchangeably
+"""
+import datetime
+import struct
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+# Upper bounds keeping a corrupted or hostile file from causing large reads or long loops
+MAX_SEGMENT_SIZE = 256 * 1024
+MAX_BOXES = 4096
+
+EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+QUICKTIME_EPOCH = datetime.datetime(1904, 1, 1)
+# The largest QuickTime time a datetime can hold, a corrupted one past it is ignored
+MAX_QUICKTIME_SECONDS = int((datetime.datetime.max - QUICKTIME_EPOCH).total_seconds())
+
+TAG_EXIF_IFD = 0x8769
+TAG_DATE_TIME_ORIGINAL = 0x9003
+TAG_SUB_SEC_TIME_ORIGINAL = 0x9291
+
+HEIF_BRANDS = frozenset([b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1", b"avif"])
+
+ParsedTime = Tuple[datetime.datetime, str]
+
+
+def read_time(f: BinaryIO) -> Optional[ParsedTime]:
+    """
+    Read the capture time from the file header
+    @param f: The file opened in binary mode
+    @return: (time, source) like (2020-08-01 09:36:50, "EXIF:DateTimeOriginal"), None if not found or not supported
+    """
+    head = f.read(12)
+    if head[:2] == b"\xff\xd8":
+        return read_jpeg_time(f)
+    elif head[4:8] == b"ftyp":
+        if head[8:12] in HEIF_BRANDS:
+            return read_heif_time(f)
+        return read_quicktime_time(f)
+    return None
+
+
+def read_jpeg_time(f: BinaryIO) -> Optional[ParsedTime]:
+    """
+    Read EXIF:DateTimeOriginal with EXIF:SubSecTimeOriginal from the APP1 segment of a JPEG file
+    """
+    f.seek(2)
+    for _ in range(MAX_BOXES):
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xff:
+            return None
+        # Start of scan, or a segment without length: the metadata segments are all before it
+        if marker[1] in (0xda, 0xd9):
+            return None
+        length = struct.unpack(">H", marker[2:])[0] - 2
+        if marker[1] == 0xe1 and 6 <= length <= MAX_SEGMENT_SIZE:
+            segment = f.read(length)
+            if segment[:6] == b"Exif\x00\x00":
+                return _read_tiff_time(segment[6:])
+        else:
+            f.seek(length, 1)
+    return None
+
+
+def read_heif_time(f: BinaryIO) -> Optional[ParsedTime]:
+    """
+    Read EXIF:DateTimeOriginal from the Exif item of a HEIF (HEIC) file, located through meta/iinf and meta/iloc
+    """
+    meta = _find_box(f, 0, _get_file_size(f), b"meta")
+    if meta is None:
+        return None
+    meta_start, meta_end = _skip_full_box_header(f, *meta)
+
+    iinf = _find_box(f, meta_start, meta_end, b"iinf")
+    iloc = _find_box(f, meta_start, meta_end, b"iloc")
+    if iinf is None or iloc is None or iloc[1] - iloc[0] > MAX_SEGMENT_SIZE:
+        return None
+
+    item_id = _find_exif_item_id(f, *iinf)
+    if item_id is None:
+        return None
+
+    f.seek(iloc[0])
+    extent = _find_item_extent(f.read(iloc[1] - iloc[0]), item_id)
+    if extent is None:
+        return None
+    offset, length = extent
+    f.seek(offset)
+    data = f.read(min(length, MAX_SEGMENT_SIZE))
+    if len(data) < 4:
+        return None
+    # The Exif item starts with the offset to the TIFF header, skipping e.g. "Exif\0\0"
+    tiff_offset = 4 + struct.unpack(">I", data[:4])[0]
+    return _read_tiff_time(data[tiff_offset:])
+
+
+def read_quicktime_time(f: BinaryIO) -> Optional[ParsedTime]:
+    """
+    Read QuickTime:CreationDate from moov/meta, or else QuickTime:MediaCreateDate from the mdhd of the first track
+    Like exiftool without the QuickTimeUTC option, MediaCreateDate is the raw UTC value without timezone
+    """
+    moov = _find_box(f, 0, _get_file_size(f), b"moov")
+    if moov is None:
+        return None
+
+    meta = _find_box(f, moov[0], moov[1], b"meta")
+    if meta is not None:
+        creation_date = _read_creation_date(f, *_skip_full_box_header(f, *meta))
+        if creation_date is not None:
+            return creation_date, "QuickTime:CreationDate"
+
+    trak = _find_box(f, moov[0], moov[1], b"trak")
+    mdia = None if trak is None else _find_box(f, trak[0], trak[1], b"mdia")
+    mdhd = None if mdia is None else _find_box(f, mdia[0], mdia[1], b"mdhd")
+    if mdhd is None:
+        return None
+    f.seek(mdhd[0])
+    header = f.read(12)
+    if len(header) < 12:
+        return None
+    if header[0] == 1:
+        seconds = struct.unpack(">Q", header[4:12])[0]
+    else:
+        seconds = struct.unpack(">I", header[4:8])[0]
+    if seconds == 0 or seconds > MAX_QUICKTIME_SECONDS:
+        return None
+    return QUICKTIME_EPOCH + datetime.timedelta(seconds=seconds), "QuickTime:MediaCreateDate"
+
+
+def read_tiff_sub_sec_time(tiff: bytes) -> Optional[str]:
+    """
+    Read EXIF:SubSecTimeOriginal from a TIFF header, e.g. "123" for 0.123 seconds
+    """
+    value = _read_tiff_exif_value(tiff, TAG_SUB_SEC_TIME_ORIGINAL)
+    return None if value is None else value.strip() or None
+
+
+def get_sub_second_microseconds(sub_sec: str) -> int:
+    """
+    Convert a SubSecTimeOriginal value to microseconds, e.g. "5" is 0.5 seconds, 0 if not digits
+    """
+    sub_sec = sub_sec.strip()
+    return int((sub_sec + "000000")[:6]) if sub_sec.isdigit() else 0
+
+
+def _read_tiff_time(tiff: bytes) -> Optional[ParsedTime]:
+    value = _read_tiff_exif_value(tiff, TAG_DATE_TIME_ORIGINAL)
+    if value is None:
+        return None
+    try:
+        time = datetime.datetime.strptime(value, EXIF_DATE_FORMAT)
+    except ValueError:
+        return None
+    sub_sec = read_tiff_sub_sec_time(tiff)
+    if sub_sec is not None:
+        time = time.replace(microsecond=get_sub_second_microseconds(sub_sec))
+    return time, "EXIF:DateTimeOriginal"
+
+
+def _read_tiff_exif_value(tiff: bytes, tag: int) -> Optional[str]:
+    """
+    Read an ASCII value of the Exif IFD, pointed to by IFD0
+    """
+    if tiff[:4] == b"II*\x00":
+        endian = "<"
+    elif tiff[:4] == b"MM\x00*":
+        endian = ">"
+    else:
+        return None
+    try:
+        ifd0_offset = struct.unpack(endian + "I", tiff[4:8])[0]
+        exif_ifd_entry = _find_ifd_entry(tiff, endian, ifd0_offset, TAG_EXIF_IFD)
+        if exif_ifd_entry is None:
+            return None
+        exif_ifd_offset = struct.unpack(endian + "I", exif_ifd_entry[8:12])[0]
+        entry = _find_ifd_entry(tiff, endian, exif_ifd_offset, tag)
+        if entry is None:
+            return None
+        value_type, count = struct.unpack(endian + "HI", entry[2:8])
+        if value_type != 2:  # ASCII
+            return None
+        if count <= 4:
+            raw = entry[8:8 + count]
+        else:
+            value_offset = struct.unpack(endian + "I", entry[8:12])[0]
+            raw = tiff[value_offset:value_offset + count]
+        return raw.split(b"\x00")[0].decode("ascii")
+    except (struct.error, UnicodeDecodeError):
+        return None
+
+
+def _find_ifd_entry(tiff: bytes, endian: str, ifd_offset: int, tag: int) -> Optional[bytes]:
+    count = struct.unpack(endian + "H", tiff[ifd_offset:ifd_offset + 2])[0]
+    for i in range(count):
+        entry = tiff[ifd_offset + 2 + i * 12:ifd_offset + 14 + i * 12]
+        if len(entry) < 12:
+            return None
+        if struct.unpack(endian + "H", entry[:2])[0] == tag:
+            return entry
+    return None
+
+
+def _iter_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Iterate the ISO base media file format boxes within [start, end) by reading their headers only
+    @return: Iterator of (type, content start, content end)
+    """
+    offset = start
+    for _ in range(MAX_BOXES):
+        if offset + 8 > end:
+            return
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        content_start = offset + 8
+        if size == 1:
+            large_size = f.read(8)
+            if len(large_size) < 8:
+                return
+            size = struct.unpack(">Q", large_size)[0]
+            content_start += 8
+        elif size == 0:
+            size = end - offset
+        if size < content_start - offset or offset + size > end:
+            return
+        yield box_type, content_start, offset + size
+        offset += size
+
+
+def _find_box(f: BinaryIO, start: int, end: int, box_type: bytes) -> Optional[Tuple[int, int]]:
+    for found_type, content_start, content_end in _iter_boxes(f, start, end):
+        if found_type == box_type:
+            return content_start, content_end
+    return None
+
+
+def _skip_full_box_header(f: BinaryIO, start: int, end: int) -> Tuple[int, int]:
+    """
+    Skip the version and flags of a meta box, which are absent from the QuickTime flavor of the box
+    """
+    f.seek(start)
+    return (start + 4, end) if f.read(4) == b"\x00\x00\x00\x00" else (start, end)
+
+
+def _find_exif_item_id(f: BinaryIO, start: int, end: int) -> Optional[int]:
+    f.seek(start)
+    version = f.read(1)
+    if len(version) < 1:
+        return None
+    entries_start = start + 4 + (2 if version[0] == 0 else 4)
+    for box_type, content_start, content_end in _iter_boxes(f, entries_start, end):
+        if box_type != b"infe":
+            continue
+        f.seek(content_start)
+        infe = f.read(min(content_end - content_start, 16))
+        # Item id and type follow the version, flags and item id of 2 bytes in version 2 and 4 bytes after
+        if len(infe) < 4 or infe[0] < 2 or len(infe) < (12 if infe[0] == 2 else 14):
+            continue
+        if infe[0] == 2:
+            item_id, item_type = struct.unpack(">H2x4s", infe[4:12])
+        else:
+            item_id, item_type = struct.unpack(">I2x4s", infe[4:14])
+        if item_type == b"Exif":
+            return item_id
+    return None
+
+
+def _find_item_extent(iloc: bytes, item_id: int) -> Optional[Tuple[int, int]]:
+    """
+    Find the file offset and length of the first extent of the item in the iloc box content
+    """
+    try:
+        version = iloc[0]
+        offset_size, length_size = iloc[4] >> 4, iloc[4] & 0xf
+        base_offset_size, index_size = iloc[5] >> 4, iloc[5] & 0xf if version in (1, 2) else 0
+        pos = 6
+        item_count, pos = _read_uint(iloc, pos, 2 if version < 2 else 4)
+        for _ in range(item_count):
+            current_id, pos = _read_uint(iloc, pos, 2 if version < 2 else 4)
+            construction_method = 0
+            if version in (1, 2):
+                construction_method, pos = _read_uint(iloc, pos, 2)
+                construction_method &= 0xf
+            pos += 2  # Data reference index
+            base_offset, pos = _read_uint(iloc, pos, base_offset_size)
+            extent_count, pos = _read_uint(iloc, pos, 2)
+            extents = []
+            for _ in range(extent_count):
+                pos += index_size
+                extent_offset, pos = _read_uint(iloc, pos, offset_size)
+                extent_length, pos = _read_uint(iloc, pos, length_size)
+                extents.append((base_offset + extent_offset, extent_length))
+            if current_id == item_id:
+                # Only items stored in the file itself are supported, not those in idat
+                if construction_method != 0 or len(extents) == 0:
+                    return None
+                return extents[0]
+    except (IndexError, struct.error):
+        return None
+    return None
+
+
+def _read_uint(data: bytes, pos: int, size: int) -> Tuple[int, int]:
+    if size == 0:
+        return 0, pos
+    if pos + size > len(data):
+        raise IndexError("Out of box bounds")
+    return int.from_bytes(data[pos:pos + size], "big"), pos + size
+
+
+def _read_creation_date(f: BinaryIO, start: int, end: int) -> Optional[datetime.datetime]:
+    """
+    Read com.apple.quicktime.creationdate from the keys and ilst boxes of moov/meta
+    """
+    keys = _find_box(f, start, end, b"keys")
+    ilst = _find_box(f, start, end, b"ilst")
+    if keys is None or ilst is None or keys[1] - keys[0] > MAX_SEGMENT_SIZE:
+        return None
+
+    f.seek(keys[0])
+    keys_content = f.read(keys[1] - keys[0])
+    key_index = None
+    pos = 8  # Full box version and flags, entry count
+    index = 1
+    while pos + 8 <= len(keys_content):
+        key_size = struct.unpack(">I", keys_content[pos:pos + 4])[0]
+        if key_size < 8:
+            return None
+        if keys_content[pos + 8:pos + key_size] == b"com.apple.quicktime.creationdate":
+            key_index = index
+            break
+        pos += key_size
+        index += 1
+    if key_index is None:
+        return None
+
+    for box_type, content_start, content_end in _iter_boxes(f, ilst[0], ilst[1]):
+        if struct.unpack(">I", box_type)[0] != key_index:
+            continue
+        data = _find_box(f, content_start, content_end, b"data")
+        if data is None or not 8 <= data[1] - data[0] <= 256:
+            return None
+        f.seek(data[0] + 8)  # Type indicator and locale
+        value = f.read(data[1] - data[0] - 8).decode("utf-8", errors="replace").strip()
+        for date_format in ("%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%dT%H:%M:%S.%f%z"):
+            try:
+                return datetime.datetime.strptime(value, date_format)
+            except ValueError:
+                continue
+        return None
+    return None
+
+
+def _get_file_size(f: BinaryIO) -> int:
+    position = f.tell()
+    size = f.seek(0, 2)
+    f.seek(position)
+    return size
@@ -1,31 +1,121 @@
 import hashlib
 import logging
+import mmap
 import os
 import pathlib
+import threading
+from typing import Callable, Iterable, Iterator, Tuple, Optional
+
+from .executor import map_bounded
 
 
 class Hasher:
+    # Algorithm tags stored alongside the hashcode in the cache
+    ALGORITHM_MD5 = "md5"
+    ALGORITHM_SAMPLED = "sampled"
+    ALGORITHM_SIZE = "size"  # Legacy size-only identity for large files, upgraded lazily by setup
+    ALGORITHM_PENDING = "pending"  # Not hashed yet as merge found no file of the same size, hashed by setup
 
-    def __init__(self, size_threshold: int):
+    def __init__(self, size_threshold: int, chunk_size: int = 1024 * 1024, mmap_threshold: Optional[int] = None,
+                 sample_size: int = 64 * 1024):
         """
-        @param size_threshold: The threshold of whether the hash should be calculated by MD5 or size
+        @param size_threshold: The threshold of whether the hash should be calculated by full MD5 or sampled MD5
+        @param chunk_size: The size of the buffer each thread reads the file into
+        @param mmap_threshold: Files at least this large are hashed through mmap, None to always stream
+                               Only worth it for local disks, as network files would be faulted in page by page
+        @param sample_size: The size of each block (head, middle, tail) read by the sampled hash
         """
         self.size_threshold = size_threshold
+        self.chunk_size = chunk_size
+        self.mmap_threshold = mmap_threshold
+        self.sample_size = sample_size
+        self._local = threading.local()
+
+    def get_algorithm(self, size: int) -> str:
+        """
+        Get the algorithm get_hash uses for a file of the given size
+        @param size: The file size in bytes
+        @return: The algorithm tag
+        """
+        return self.ALGORITHM_SAMPLED if size > self.size_threshold else self.ALGORITHM_MD5
 
     def get_hash(self, file_path: pathlib.Path):
         """
-        Get the hash of a given file, using either MD5 or just the size in bytes
-        If the size is too big, MD5 will not be run and the byte size will be used instead
-        - This is to save some power and time, as large files are unlikely to have byte size conflict
-        - Also for Cloud files it avoids downloading the file again
+        Get the hash of a given file, using either the full MD5 or a sampled MD5
+        If the size is too big, the full MD5 will not be run and only a few blocks are hashed instead
+        - This is to save some power and time, as large files differing only outside the samples are very unlikely
+        - Also for Cloud files it avoids downloading the whole file again
         @param file_path: The file path
-        @return: The MD5 hash or size value
+        @return: The MD5 hash or sampled MD5 hash
         """
         size = os.path.getsize(file_path)
         if size > self.size_threshold:
-            hashcode = str(os.path.getsize(file_path))
+            hashcode = self.get_sampled_hash(file_path, size)
+        elif self.mmap_threshold is not None and size >= max(self.mmap_threshold, 1):
+            hashcode = self._get_md5_by_mmap(file_path)
         else:
-            hashcode = hashlib.md5(open(file_path, 'rb').read()).hexdigest()
+            hashcode = self._get_md5_by_chunks(file_path)
 
         logging.debug(f"Hash {file_path} to {hashcode}")
         return hashcode
+
+    def get_sampled_hash(self, file_path: pathlib.Path, size: int) -> str:
+        """
+        Get the MD5 of the file size plus the head, middle and tail blocks of the file
+        The I/O is constant no matter how large the file is
+        @param file_path: The file path
+        @param size: The file size in bytes
+        @return: The sampled MD5 hash
+        """
+        md5 = hashlib.md5(str(size).encode())
+        offsets = sorted({0, max(0, (size - self.sample_size) // 2), max(0, size - self.sample_size)})
+        with open(file_path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                md5.update(f.read(self.sample_size))
+        return md5.hexdigest()
+
+    def get_hashes(self, file_paths: Iterable[pathlib.Path], jobs: int = 1) -> Iterator[Tuple[pathlib.Path, str]]:
+        """
+        Hash the given files on a pool of worker threads and stream the results back in completion order
+        - Threads are enough since hashlib releases the GIL while digesting, and they keep many reads in flight
+          which matters most for network-mounted libraries
+        - At most jobs * 4 files are queued at any time, so the paths can be a lazy iterable of any size
+        @param file_paths: The file paths
+        @param jobs: The number of worker threads, 1 for hashing on the calling thread
+        @return: Iterator of (path, hashcode) in completion order
+        """
+        return self._map(self.get_hash, file_paths, jobs)
+
+    @staticmethod
+    def _map(hash_func: Callable[[pathlib.Path], str], file_paths: Iterable[pathlib.Path], jobs: int) \
+            -> Iterator[Tuple[pathlib.Path, str]]:
+        return map_bounded(lambda path: (path, hash_func(path)), file_paths, jobs, jobs * 4, "Hasher")
+
+    def _get_md5_by_chunks(self, file_path: pathlib.Path) -> str:
+        """
+        Stream the file through MD5 with a buffer reused across calls on the same thread
+        so the memory usage does not grow with the file size
+        """
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) != self.chunk_size:
+            buffer = bytearray(self.chunk_size)
+            self._local.buffer = buffer
+
+        md5 = hashlib.md5()
+        view = memoryview(buffer)
+        with open(file_path, "rb", buffering=0) as f:
+            while True:
+                read = f.readinto(view)
+                if not read:
+                    break
+                md5.update(view[:read])
+        return md5.hexdigest()
+
+    def _get_md5_by_mmap(self, file_path: pathlib.Path) -> str:
+        md5 = hashlib.md5()
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for offset in range(0, len(view), self.chunk_size):
+                    md5.update(view[offset:offset + self.chunk_size])
+        return md5.hexdigest()
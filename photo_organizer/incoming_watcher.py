@@ -0,0 +1,63 @@
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+
+class IncomingWatcher:
+    """
+    Debounce of the files polled from the incoming dir, so that files still being copied are not merged half written
+    A file is ready once its size and modification time have not changed for settle_seconds
+    Files already handled are skipped until modified, e.g. duplicates left in the incoming dir by merge
+    """
+
+    def __init__(self, settle_seconds: float):
+        """
+        @param settle_seconds: How long the size and modification time of a file must be unchanged
+        """
+        self.settle_seconds = settle_seconds
+        self._pending: Dict[Path, Tuple[int, int, float]] = {}  # Path to (size, mtime_ns, unchanged since)
+        self._handled: Dict[Path, Tuple[int, int]] = {}  # Path to (size, mtime_ns) when handled
+
+    def poll(self, paths: Iterable[Path], now: float) -> List[Path]:
+        """
+        Record the current stat of the polled files
+        Each file is stat-ed again rather than trusting the directory listing, which lags behind writes on Windows
+        @param paths: All the media paths currently in the incoming dir
+        @param now: The monotonic time of the poll
+        @return: The sorted paths of the files ready to be merged
+        """
+        seen = set()
+        ready = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            seen.add(path)
+            key = (stat.st_size, stat.st_mtime_ns)
+            if self._handled.get(path) == key:
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[:2] != key:
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - pending[2] >= self.settle_seconds:
+                ready.append(path)
+
+        # Forget the files gone, so that the memory does not grow and a file dropped again is merged again
+        for path_to_state in (self._pending, self._handled):
+            for path in [path for path in path_to_state if path not in seen]:
+                del path_to_state[path]
+        return sorted(ready)
+
+    def mark_handled(self, paths: Iterable[Path]) -> None:
+        """
+        Stop tracking the files passed to merge, the ones left in place are skipped until modified
+        @param paths: The paths returned by poll
+        """
+        for path in paths:
+            self._pending.pop(path, None)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            self._handled[path] = (stat.st_size, stat.st_mtime_ns)
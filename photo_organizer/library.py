@@ -1,9 +1,18 @@
+import hashlib
 import logging
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple
 
+from exception.exception import FileMoveException
 from photo_organizer.config import Config
+from photo_organizer.executor import map_bounded
+
+MEDIA_SUFFIXES = frozenset([".bmp", ".gif", ".heic", ".jpg", ".jpeg", ".m4v", ".mov", ".mp4", ".nef", ".png"])
+COPY_CHUNK_SIZE = 1024 * 1024
+PARTIAL_SUFFIX = ".partial"
 
 
 class Library:
@@ -14,37 +23,179 @@ class Library:
     def get_all_library_paths(self) -> List[Path]:
         """
         Get all the media paths in the library
-        @return: Paths that are relative to LibraryDir and all lowercase
+        @return: Paths that are relative to LibraryDir
+        """
+        return [Path(path) for path, _ in self.iter_library_files()]
+
+    def iter_library_files(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """
+        Lazily walk the media files under the year dirs (e.g. 2020/) of the library
+        Paths are plain strings as building a Path per file dominates the walk on large libraries
+        The stat comes from the directory listing, so on Windows st_ino and st_dev are 0
+        @return: Iterator of (path relative to LibraryDir, stat)
         """
-        glob_paths = self._config.cur_working_dir.glob("[0-9]*/**/*")
-        return list(filter(lambda p: self._is_media_path(p), glob_paths))
+        with os.scandir(self._config.cur_working_dir) as it:
+            # Normalized like str(Path) (e.g. without "./"), so that the yielded paths match the ones in Cache
+            top_dirs = sorted(str(Path(entry.path)) for entry in it
+                              if entry.name[:1].isdigit() and entry.is_dir(follow_symlinks=False))
+        return self._walk(top_dirs)
 
-    def get_all_incoming_paths(self) -> List[Path]:
+    def get_all_incoming_paths(self, summarize_unrecognized: bool = True) -> List[Path]:
         """
         Get all the media paths in the incoming dir
-        @return: Paths that are relative to incoming dir and all lowercase
+        @param summarize_unrecognized: Whether to log the summary of unrecognized files, off when polled repeatedly
+        @return: Paths that are relative to incoming dir
+        """
+        return [Path(path) for path, _ in self._walk([str(self._config.incoming_dir)], summarize_unrecognized)]
+
+    @staticmethod
+    def get_dir_paths(dir_path: Path) -> List[str]:
+        """
+        Get the paths of all entries directly under a directory, media or not
+        @param dir_path: The directory path
+        @return: The paths, empty if the directory does not exist
         """
-        glob_paths = self._config.incoming_dir.glob("**/*")
-        return list(filter(lambda p: self._is_media_path(p), glob_paths))
+        try:
+            with os.scandir(dir_path) as it:
+                return [os.path.join(str(dir_path), entry.name) for entry in it]
+        except FileNotFoundError:
+            return []
 
     @staticmethod
-    def move_file(cur_path: Path, new_path: Path):
+    def move_file(cur_path: Path, new_path: Path) -> os.stat_result:
         """
         Move file from current path to new path inside the library
+        A rename if both are on the same device, otherwise a streamed copy verified by MD5 before the source is removed
+        @return: The stat of the moved file
         """
         new_path.parent.mkdir(parents=True, exist_ok=True)
         if new_path.exists():
-            raise Exception(f"Attempt to overwrite {new_path}!")
-        cur_path.rename(new_path)
+            raise FileMoveException(f"Attempt to overwrite {new_path}!")
+        if Library._is_same_device(cur_path, new_path.parent):
+            cur_path.rename(new_path)
+        else:
+            Library._copy_verified(cur_path, new_path)
+            os.remove(cur_path)
+        return os.stat(new_path)
 
     @staticmethod
-    def _is_media_path(path: Path):
-        suffix = path.suffix.lower()
-        if suffix == "":
-            return False
-        elif suffix not in [".bmp", ".gif", ".heic", ".jpg", ".jpeg", ".m4v", ".mov", ".mp4",
-                            ".nef", ".png"]:
-            logging.info(f"Not a recognized media file: {path}")
-            return False
-        else:
-            return True
+    def get_sizes(paths: List[str], jobs: int = 1) -> List[Optional[int]]:
+        """
+        Stat the files on a pool of worker threads
+        The paths are split into one chunk per thread, as a task per file would cost more than the stat itself
+        @param paths: The file paths
+        @param jobs: The number of worker threads
+        @return: The sizes in the order of the paths, None for missing files or files which cannot be stat-ed
+        """
+        def get_chunk_sizes(chunk):
+            sizes = []
+            for path in chunk:
+                try:
+                    sizes.append(os.stat(path).st_size)
+                except FileNotFoundError:
+                    sizes.append(None)
+                except OSError as e:
+                    logging.warning(f"Unable to stat {path}: {e}")
+                    sizes.append(None)
+            return sizes
+
+        chunk_size = max(1, -(-len(paths) // jobs))
+        chunks = [paths[start:start + chunk_size] for start in range(0, len(paths), chunk_size)]
+        if len(chunks) <= 1:
+            return [size for chunk in chunks for size in get_chunk_sizes(chunk)]
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="Stat") as executor:
+            return [size for sizes in executor.map(get_chunk_sizes, chunks) for size in sizes]
+
+    def move_files(self, moves: Iterable[Tuple[Path, Path]], jobs: int = 1) \
+            -> Iterator[Tuple[Path, Path, Optional[os.stat_result]]]:
+        """
+        Move files on a pool of worker threads, see move_file
+        A failed move is logged and leaves the source file in place, so that the other moves carry on
+        - At most jobs * 2 moves are queued at any time
+        @param moves: The (current path, new path) pairs
+        @param jobs: The number of moves running concurrently
+        @return: Iterator of (current path, new path, stat of the moved file or None if failed) in completion order
+        """
+        def move(item):
+            cur_path, new_path = item
+            try:
+                return cur_path, new_path, self.move_file(cur_path, new_path)
+            except (OSError, FileMoveException) as e:
+                logging.error(f"Failed to move {cur_path} => {new_path}: {e}")
+                return cur_path, new_path, None
+
+        return map_bounded(move, moves, jobs, jobs * 2, "Mover")
+
+    @staticmethod
+    def _is_same_device(path: Path, dir_path: Path) -> bool:
+        return os.stat(path).st_dev == os.stat(dir_path).st_dev
+
+    @staticmethod
+    def _copy_verified(cur_path: Path, new_path: Path) -> None:
+        """
+        Copy through a partial file next to the new path, hashing the data as it is read
+        The partial file is read back and compared by MD5 before being renamed to the new path
+        A partial file left by an interrupted copy is overwritten
+        """
+        partial_path = new_path.with_name(new_path.name + PARTIAL_SUFFIX)
+        buffer = bytearray(COPY_CHUNK_SIZE)
+        view = memoryview(buffer)
+        source_md5 = hashlib.md5()
+        try:
+            with open(cur_path, "rb", buffering=0) as source, open(partial_path, "wb") as target:
+                while True:
+                    read = source.readinto(view)
+                    if not read:
+                        break
+                    source_md5.update(view[:read])
+                    target.write(view[:read])
+                target.flush()
+                os.fsync(target.fileno())
+
+            target_md5 = hashlib.md5()
+            with open(partial_path, "rb", buffering=0) as target:
+                while True:
+                    read = target.readinto(view)
+                    if not read:
+                        break
+                    target_md5.update(view[:read])
+            if target_md5.hexdigest() != source_md5.hexdigest():
+                raise FileMoveException(f"Copy of {cur_path} to {new_path} failed verification")
+
+            shutil.copystat(cur_path, partial_path)
+            os.rename(partial_path, new_path)
+        except BaseException:
+            if partial_path.exists():
+                os.remove(partial_path)
+            raise
+
+    @staticmethod
+    def _walk(top_dirs: List[str], summarize_unrecognized: bool = True) -> Iterator[Tuple[str, os.stat_result]]:
+        """
+        Iterative depth-first walk with os.scandir, in name order within each directory
+        Unrecognized files are only logged per file at DEBUG, and summarized by suffix at the end
+        """
+        unrecognized_suffix_to_count = {}
+        stack = list(reversed(top_dirs))
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                entries = sorted(it, key=lambda e: e.name)
+
+            sub_dirs = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    sub_dirs.append(entry.path)
+                    continue
+
+                name = entry.name
+                dot = name.rfind(".")
+                suffix = name[dot:].lower() if dot > 0 else ""
+                if suffix in MEDIA_SUFFIXES:
+                    yield entry.path, entry.stat()
+                elif suffix != "":
+                    logging.debug(f"Not a recognized media file: {entry.path}")
+                    unrecognized_suffix_to_count[suffix] = unrecognized_suffix_to_count.get(suffix, 0) + 1
+            stack.extend(reversed(sub_dirs))
+
+        if summarize_unrecognized and len(unrecognized_suffix_to_count) > 0:
+            logging.info(f"Not recognized media files by suffix: {unrecognized_suffix_to_count}")
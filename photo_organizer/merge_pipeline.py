@@ -0,0 +1,222 @@
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .cache import Cache, CacheBatch, Doc
+from .hasher import Hasher
+from .logging.counter import CounterLogger
+from .pipeline import Pipeline
+from .renamer.renamer import ExtractedTime, Renamer
+
+# The number of hashes looked up in the cache at once by the dedup stage
+DEDUP_BATCH_SIZE = 500
+# The number of files passed to the renamer at once by the time stage, enough to keep all exiftool sessions busy
+TIME_BATCH_SIZE = 500
+# The version of the key of the cached times, bumped when it changes so that the rows of the former keys are dropped
+TIME_KEY_VERSION = 2
+
+
+class SizeGroup(NamedTuple):
+    """
+    The incoming files of the same size, with the library files of that size
+    """
+    size: int
+    paths: List[Path]
+    library_docs: List[Doc]
+
+
+class HashedGroup(NamedTuple):
+    """
+    A SizeGroup with the hashes computed by the hash stage
+    """
+    paths: List[Path]
+    path_to_hash: Dict[Path, Optional[str]]  # None if hashing is deferred
+    path_to_fingerprint: Dict[Path, str]  # The sampled hash keying the extracted times
+    pending_docs: List[Tuple[Path, str, os.stat_result]]  # Library files hashed now they have a size conflict
+
+
+class MergeResult(NamedTuple):
+    path: Path
+    hashcode: Optional[str]
+    extracted_time: Optional[ExtractedTime]
+
+
+class MergePipeline:
+    """
+    Dedup the incoming files and extract the time of the unique ones, with the stages overlapped in a Pipeline:
+    1. scan: group the files by size, and look up the library files of the same sizes
+    2. hash: cascade per size group on worker threads, so that the content is only read when it can tell files apart
+       - Files whose size matches no library file and no other incoming file are unique, hashing is deferred
+       - Files whose size only matches other incoming files are told apart by the sampled hash first
+       - The rest are fully hashed, along with the not yet hashed library files of the same size
+    3. dedup: check the hashes against the library and the other files of the group in sorted order,
+       so that the first file of a duplicate group is kept
+    4. time: look up the times extracted by earlier runs, keyed by the sampled fingerprint and the file name
+       since the time may come from either, and extract the others
+    The files of a size group only depend on each other, so the result is the same as running the stages in sequence
+    """
+
+    def __init__(self, cache: Cache, hasher: Hasher, renamer: Renamer, counter_logger: CounterLogger,
+                 jobs: int, batch: CacheBatch):
+        """
+        @param jobs: The number of threads of the hash stage
+        @param batch: The cache batch the hashes of library files are written through
+        """
+        self.cache = cache
+        self.hasher = hasher
+        self.renamer = renamer
+        self.counter_logger = counter_logger
+        self.jobs = jobs
+        self.batch = batch
+        self.extractor_version = f"{renamer.get_version()}:{TIME_KEY_VERSION}"
+        self._dedup_groups: List[HashedGroup] = []
+        self._dedup_hash_count = 0
+        self._time_results: List[MergeResult] = []
+        self._time_fingerprints: List[str] = []
+
+    def run(self, incoming_paths: Sequence[Path]) -> Iterator[MergeResult]:
+        """
+        @param incoming_paths: The sorted incoming file paths
+        @return: Iterator of the results of the unique files in no particular order, duplicates are left out
+        """
+        self.cache.delete_metadata_of_other_versions(self.extractor_version)
+        pipeline = Pipeline("merge") \
+            .add_stage("hash", self._hash_group, workers=self.jobs) \
+            .add_stage("dedup", self._dedup_group, flush=self._dedup_buffered) \
+            .add_stage("time", self._extract_time, flush=self._extract_buffered_times)
+        return pipeline.run(self._scan(incoming_paths))
+
+    def _scan(self, incoming_paths: Sequence[Path]) -> Iterator[SizeGroup]:
+        size_to_paths = {}
+        for path in incoming_paths:
+            size_to_paths.setdefault(os.path.getsize(path), []).append(path)
+        size_to_library_docs = self.cache.get_docs_by_sizes(size_to_paths.keys())
+        for size, paths in size_to_paths.items():
+            yield SizeGroup(size, paths, size_to_library_docs.get(size, []))
+
+    def _hash_group(self, group: SizeGroup) -> Iterator[HashedGroup]:
+        path_to_fingerprint = {}
+        paths_to_hash = []
+        pending_docs = []
+        if len(group.library_docs) == 0 and len(group.paths) == 1:
+            self.counter_logger.inc("Hash deferred by unique size")
+        elif len(group.library_docs) == 0 and self.hasher.get_algorithm(group.size) == Hasher.ALGORITHM_MD5:
+            path_to_fingerprint = {path: self.hasher.get_sampled_hash(path, group.size) for path in group.paths}
+            fingerprint_to_paths = {}
+            for path in group.paths:
+                fingerprint_to_paths.setdefault(path_to_fingerprint[path], []).append(path)
+            for paths in fingerprint_to_paths.values():
+                if len(paths) == 1:
+                    self.counter_logger.inc("Hash deferred by unique sample")
+                else:
+                    paths_to_hash.extend(paths)
+        else:
+            paths_to_hash = group.paths
+            for doc in group.library_docs:
+                if doc.algorithm == Hasher.ALGORITHM_PENDING:
+                    stat = os.stat(doc.path)
+                    hashcode = self.hasher.get_hash(doc.path)
+                    self.counter_logger.inc("Hash computed")
+                    # Left pending for setup rather than recorded with the stat of a later content
+                    try:
+                        stat_after = os.stat(doc.path)
+                    except FileNotFoundError:
+                        logging.warning(f"Skip {doc.path} deleted while hashing")
+                        continue
+                    if (stat_after.st_size, stat_after.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                        logging.warning(f"Skip {doc.path} modified while hashing, the next setup hashes it again")
+                        continue
+                    pending_docs.append((doc.path, hashcode, stat))
+
+        path_to_hash = {path: None for path in group.paths}
+        for path in paths_to_hash:
+            path_to_hash[path] = self.hasher.get_hash(path)
+            self.counter_logger.inc("Incoming hashed", step=1000)
+        for path in group.paths:
+            if path not in path_to_fingerprint:
+                path_to_fingerprint[path] = self.hasher.get_sampled_hash(path, group.size)
+        yield HashedGroup(group.paths, path_to_hash, path_to_fingerprint, pending_docs)
+
+    def _dedup_group(self, group: HashedGroup) -> Iterator[Tuple[Path, Optional[str], str]]:
+        hash_count = len([hashcode for hashcode in group.path_to_hash.values() if hashcode is not None])
+        if hash_count == 0:
+            yield from self._dedup(group, {})
+            return
+
+        # One lookup per batch of hashes rather than per group
+        self._dedup_groups.append(group)
+        self._dedup_hash_count += hash_count
+        if self._dedup_hash_count >= DEDUP_BATCH_SIZE:
+            yield from self._dedup_buffered()
+
+    def _dedup_buffered(self) -> Iterator[Tuple[Path, Optional[str], str]]:
+        groups = self._dedup_groups
+        self._dedup_groups = []
+        self._dedup_hash_count = 0
+        hash_to_library_docs = self.cache.get_docs_by_hashcodes(hashcode for group in groups
+                                                                for hashcode in group.path_to_hash.values()
+                                                                if hashcode is not None)
+        for group in groups:
+            yield from self._dedup(group, hash_to_library_docs)
+
+    def _dedup(self, group: HashedGroup, hash_to_library_docs: Dict[str, List[Doc]]) \
+            -> Iterator[Tuple[Path, Optional[str], str]]:
+        # The library files hashed by this run are not in the cache until the batch is flushed
+        library_hash_to_path = {}
+        for path, hashcode, stat in group.pending_docs:
+            self.batch.upsert_hashcode_doc(path, hashcode, stat.st_size, self.hasher.get_algorithm(stat.st_size),
+                                           stat.st_mtime_ns, stat.st_ino, stat.st_dev)
+            library_hash_to_path[hashcode] = path
+
+        incoming_hash_to_path = {}
+        for path in group.paths:
+            hashcode = group.path_to_hash[path]
+            if hashcode is not None:
+                if hashcode in incoming_hash_to_path:
+                    logging.warning(f"Duplicate: {path} == {incoming_hash_to_path[hashcode]} ({hashcode})")
+                    self.counter_logger.inc("Duplicates")
+                    continue
+                same_hash_files = [doc.path for doc in hash_to_library_docs.get(hashcode, [])]
+                if hashcode in library_hash_to_path:
+                    same_hash_files.append(library_hash_to_path[hashcode])
+                if len(same_hash_files) > 0:
+                    logging.warning(f"Duplicate: {path} == {same_hash_files[0]} ({hashcode})")
+                    self.counter_logger.inc("Duplicates")
+                    continue
+                incoming_hash_to_path[hashcode] = path
+            yield path, hashcode, group.path_to_fingerprint[path]
+
+    def _extract_time(self, item: Tuple[Path, Optional[str], str]) -> Iterator[MergeResult]:
+        path, hashcode, fingerprint = item
+        self._time_results.append(MergeResult(path, hashcode, None))
+        # A renamed file keeps its content but may get another time from its new name
+        self._time_fingerprints.append(f"{fingerprint}:{path.name}")
+        if len(self._time_results) >= TIME_BATCH_SIZE:
+            yield from self._extract_buffered_times()
+
+    def _extract_buffered_times(self) -> Iterator[MergeResult]:
+        results, fingerprints = self._time_results, self._time_fingerprints
+        self._time_results, self._time_fingerprints = [], []
+        if len(results) == 0:
+            return
+
+        fingerprint_to_time = self.cache.get_metadata_times(fingerprints, self.extractor_version)
+        paths_to_extract = [result.path for result, fingerprint in zip(results, fingerprints)
+                            if fingerprint not in fingerprint_to_time]
+        self.counter_logger.inc("Time cache hits", increment=len(results) - len(paths_to_extract))
+
+        path_to_extracted_time = self.renamer.get_times(paths_to_extract)
+        path_to_fingerprint = {result.path: fingerprint for result, fingerprint in zip(results, fingerprints)}
+        self.cache.upsert_metadata_times(((path_to_fingerprint[path], extracted_time)
+                                          for path, extracted_time in path_to_extracted_time.items()),
+                                         self.extractor_version)
+        self.counter_logger.inc("Time extracted", increment=len(paths_to_extract))
+
+        for result, fingerprint in zip(results, fingerprints):
+            if result.path in path_to_extracted_time:
+                extracted_time = path_to_extracted_time[result.path]
+            else:
+                cached_time = fingerprint_to_time[fingerprint]
+                extracted_time = None if cached_time is None else ExtractedTime(*cached_time)
+            yield result._replace(extracted_time=extracted_time)
@@ -1,16 +1,35 @@
+import itertools
+import json
 import logging
 import os
-from typing import List, Callable
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from exception.exception import AuditException
-from .cache import Cache, Doc
+from exception.exception import AuditException, ExifToolException, InvalidConfigException, InvalidInputException
+from .bk_tree import BKTree
+from .cache import JOURNAL_FAILED, JOURNAL_MOVED, Cache, CacheBatch
 from .config import Config
 from .hasher import Hasher
+from .incoming_watcher import IncomingWatcher
 from .library import Library
 from .logging.counter import CounterLogger
+from .merge_pipeline import MergePipeline
+from .perceptual_hasher import PerceptualHasher
+from .plan import PlanEntry, read_plan, write_plan
 from .renamer.exif_time_extractor import MetadataTimeExtractor
 from .renamer.renamer import Renamer
 from .renamer.file_name_time_extractor import FileNameTimeExtractor
+from .renamer.header_time_extractor import HeaderTimeExtractor
+from .renamer.path_allocator import PathAllocator
+
+# The number of cache rows stat-ed at once by audit
+AUDIT_BATCH_SIZE = 10000
+# Watch polls the incoming dir every second, and merges files unchanged for 2 seconds at most 100 at a time
+WATCH_INTERVAL_SECONDS = 1.0
+WATCH_SETTLE_SECONDS = 2.0
+WATCH_BATCH_SIZE = 100
 
 
 class Organizer:
@@ -21,167 +40,471 @@ class Organizer:
         """
         self.config = config
         self.cache = Cache(self.config)
-        self.hasher = Hasher(self.config.md5_size_limit * 1024 * 1024)
+        self.hasher = Hasher(self.config.md5_size_limit * 1024 * 1024,
+                             mmap_threshold=None if self.config.mmap_threshold is None
+                             else self.config.mmap_threshold * 1024 * 1024)
+        self.perceptual_hasher = PerceptualHasher()
         self.library = Library(self.config)
         self.counter_logger = CounterLogger()
-        self.renamer = Renamer([FileNameTimeExtractor(), MetadataTimeExtractor(self.config.working_dir)])
-
-    def audit(self):
-        """
-        Scan for duplicates which are harmless but annoying:
-        1. Multiple files with the same hash
-        2. Multiple files with the same name
-        3. File modification after hashing found by size change
-        """
-        audit_issue_found = False
-        all_docs = self.cache.get_all()
-        cache_hash_to_docs = self._group_by(self.cache.get_all(), lambda doc: doc.hashcode)
-        for hashcode, docs in cache_hash_to_docs.items():
-            if len(docs) > 1:
-                logging.warning(f"Duplicate files with same hash {hashcode}: {[doc.path for doc in docs]}")
-                audit_issue_found = True
-
-        file_name_to_docs = self._group_by(all_docs, lambda d: os.path.basename(d.path).lower())
-        for file_name, docs in file_name_to_docs.items():
-            if len(docs) > 1:
-                logging.warning(f"Duplicate files with the same name found: {[doc.path for doc in docs]}")
-                audit_issue_found = True
-
-        for doc in all_docs:
-            if os.path.getsize(doc.path) != doc.size:
-                logging.warning(f"File size changed after hashing: {doc.path}")
-                audit_issue_found = True
-
-        logging.info("Audit completed!")
-        if audit_issue_found:
+        self.renamer = Renamer([FileNameTimeExtractor(self.config.file_name_patterns),
+                                HeaderTimeExtractor(),
+                                MetadataTimeExtractor(self.config.working_dir, sessions=self.config.jobs)],
+                                sub_second_names=self.config.sub_second_names)
+
+    def audit(self, report_path: Optional[Path] = None):
+        """
+        Scan for duplicates which are harmless but annoying, and write the issues found to a JSON report:
+        1. Multiple files with the same hash, grouped by SQLite
+        2. Multiple files with the same name, grouped by SQLite
+        3. File modification after hashing found by size change, or files missing since hashing, by a parallel stat
+           sweep over the docs streamed page by page, so that the memory does not grow with the library
+        @param report_path: The report file, WorkingDir/Reports/[datetime]_audit.json by default
+        """
+        report = {
+            "duplicate_hashes": [{"hashcode": hashcode, "paths": paths} for hashcode, paths
+                                 in self.cache.get_duplicate_hashcodes(Hasher.ALGORITHM_PENDING).items()],
+            "duplicate_names": [{"name": name, "paths": paths} for name, paths
+                                in self.cache.get_duplicate_names().items()],
+            "size_changed": [],
+            "missing": []
+        }
+        docs = self.cache.iter_docs(AUDIT_BATCH_SIZE)
+        while True:
+            page = list(itertools.islice(docs, AUDIT_BATCH_SIZE))
+            if len(page) == 0:
+                break
+            sizes = self.library.get_sizes([doc.path_str for doc in page], self.config.jobs)
+            for doc, size in zip(page, sizes):
+                if size is None:
+                    report["missing"].append(doc.path_str)
+                elif size != doc.size:
+                    report["size_changed"].append({"path": doc.path_str, "cached_size": doc.size, "size": size})
+            self.counter_logger.inc("Audited", increment=len(page), step=100000)
+
+        if report_path is None:
+            file_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_audit.json"
+            report_path = self.config.working_dir / "Reports" / file_name
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        with report_path.open("w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+
+        self.counter_logger.dump()
+        issue_counts = {key: len(issues) for key, issues in report.items() if len(issues) > 0}
+        logging.info(f"Audit completed! Report written to {report_path}")
+        if len(issue_counts) > 0:
+            logging.warning(f"Audit issues found: {issue_counts}")
             raise AuditException()
 
-    def merge(self):
+    def merge(self, plan_out: Optional[Path] = None):
         """
         Merge the photos pending processing into the library
         0. Run setup
-        1. Find out the duplicated ones and exclude those
-        2. Rename files according to the file info
+        1. Find out the duplicated ones and exclude those, only hashing files whose size is not unique
+        2. Rename files according to the file info, extracting the times while other files are being hashed
         3. If not preview, move the files and update cache
+        @param plan_out: If set, write the plan to this file for apply_plan instead of confirming and moving
         """
+        if self.config.similar_check and not self.perceptual_hasher.is_available():
+            raise InvalidConfigException("SimilarCheck requires Pillow and NumPy, install them or turn it off")
         self.setup()
 
         incoming_paths = sorted(self.library.get_all_incoming_paths())
         logging.info(f"Process incoming files: {len(incoming_paths)}")
-
-        # Deduplication
-        incoming_path_to_hash = {}
-        pending_processing_paths = self._merge_dedup_files(incoming_paths, incoming_path_to_hash)
-
-        # Calculate new paths
-        incoming_path_to_new_path = self._merge_calculate_new_paths(pending_processing_paths)
+        journal_entries, incoming_path_to_phash = self._merge_plan(incoming_paths, PathAllocator(self._get_taken_paths))
         self.counter_logger.dump()
 
+        if plan_out is not None:
+            self._merge_write_plan(plan_out, journal_entries)
+            return
+
         # Confirm
         logging.warning("Continue? (y/n)")
         if input() not in ["y", "yes"]:
             return
 
+        self._merge_execute(journal_entries, incoming_path_to_phash)
+
+    def _merge_execute(self, journal_entries, incoming_path_to_phash: Dict[Path, int], append_journal: bool = False,
+                       similar_index: Optional[BKTree] = None):
+        # Persist the plan before moving anything, so that an interrupted merge can be resumed
+        self.cache.start_journal(journal_entries, append=append_journal)
+
         # Move files
-        self._merge_move_files(incoming_path_to_new_path, incoming_path_to_hash)
+        self._merge_move_files(journal_entries)
+        self._merge_record_perceptual_hashes(journal_entries, incoming_path_to_phash, similar_index)
         self.counter_logger.dump()
 
-    def _merge_dedup_files(self, incoming_paths, incoming_path_to_hash):
-        pending_processing_paths = []
-        incoming_hash_to_path = {}
-        for path in incoming_paths:
-            hashcode = self.hasher.get_hash(path)
-            if hashcode in incoming_hash_to_path:
-                logging.warning(f"Duplicate: {path} == {incoming_hash_to_path[hashcode]} ({hashcode})")
-                self.counter_logger.inc("Duplicates")
+    def _merge_plan(self, incoming_paths: List[Path], path_allocator: PathAllocator,
+                    similar_index: Optional[BKTree] = None) \
+            -> Tuple[List[Tuple[Path, Optional[str], Path]], Dict[Path, int]]:
+        """
+        Dedup the incoming files, and allocate the new paths of the unique ones by their times
+        @param incoming_paths: The sorted incoming file paths
+        @param path_allocator: The allocator of the new paths
+        @param similar_index: The index of the library photos for SimilarCheck, loaded from the cache if None
+        @return: The journal entries of the planned moves, and the perceptual hashes computed by SimilarCheck
+        """
+        # Deduplication and time extraction
+        incoming_path_to_hash = {}
+        path_to_time = {}
+        with self.cache.batch(self.config.cache_batch_size) as batch:
+            merge_pipeline = MergePipeline(self.cache, self.hasher, self.renamer, self.counter_logger,
+                                           self.config.jobs, batch)
+            for result in merge_pipeline.run(incoming_paths):
+                incoming_path_to_hash[result.path] = result.hashcode
+                path_to_time[result.path] = result.extracted_time
+        pending_processing_paths = sorted(incoming_path_to_hash.keys())
+
+        # Calculate new paths
+        incoming_path_to_new_path = self._merge_calculate_new_paths(pending_processing_paths, path_to_time,
+                                                                    path_allocator)
+        incoming_path_to_phash = {}
+        if self.config.similar_check:
+            if similar_index is None:
+                similar_index = self._load_similar_index()
+            incoming_path_to_phash = self._merge_check_similar(incoming_path_to_new_path.keys(), similar_index)
+        journal_entries = [(cur_path, incoming_path_to_hash[cur_path], new_path)
+                           for cur_path, new_path in incoming_path_to_new_path.items()]
+        return journal_entries, incoming_path_to_phash
+
+    @staticmethod
+    def _merge_write_plan(plan_out: Path, journal_entries):
+        def plan_entries():
+            for cur_path, hashcode, new_path in journal_entries:
+                stat = os.stat(cur_path)
+                yield PlanEntry(cur_path, hashcode, new_path, stat.st_size, stat.st_mtime_ns)
+
+        count = write_plan(plan_out, plan_entries())
+        logging.info(f"Plan of {count} moves written to {plan_out}, apply it with merge --apply {plan_out}")
+
+    def apply_plan(self, plan_path: Path):
+        """
+        Move the files as planned by merge with plan_out, without scanning, hashing or extracting times again
+        Incoming files whose size or modification time changed since planning are skipped
+        @param plan_path: The plan file written by merge
+        """
+        journal_entries = []
+        for entry in read_plan(plan_path):
+            try:
+                stat = os.stat(entry.incoming_path)
+            except FileNotFoundError:
+                logging.warning(f"Skip {entry.incoming_path} missing since planning")
+                self.counter_logger.inc("Skipped changed since planning")
                 continue
-            same_hash_files = self.cache.get_docs_by_hashcode(hashcode)
-            if len(same_hash_files) > 0:
-                logging.warning(f"Duplicate: {path} == {same_hash_files[0].path} ({hashcode})")
-                self.counter_logger.inc("Duplicates")
+            if stat.st_size != entry.size or stat.st_mtime_ns != entry.mtime_ns:
+                logging.warning(f"Skip {entry.incoming_path} modified since planning")
+                self.counter_logger.inc("Skipped changed since planning")
                 continue
+            journal_entries.append((entry.incoming_path, entry.hashcode, entry.new_path))
+        logging.info(f"Moves to apply: {len(journal_entries)}")
+
+        self.cache.start_journal(journal_entries)
+        self._merge_move_files(journal_entries)
+        self.counter_logger.dump()
 
-            incoming_hash_to_path[hashcode] = path
-            incoming_path_to_hash[path] = hashcode
-            pending_processing_paths.append(path)
+    def resume(self):
+        """
+        Resume the moves of an interrupted merge from the journal, without hashing or extracting times again
+        1. Files moved before the interruption but not checkpointed are recorded in the cache
+        2. Files copied to another device but not removed from the incoming dir yet are removed once verified
+        3. The rest are moved like merge does
+        """
+        journal_entries = self.cache.get_journal_entries()
+        logging.info(f"Moves to resume: {len(journal_entries)}")
+        if len(journal_entries) == 0:
+            return
 
-        return pending_processing_paths
+        entries_to_move = []
+        with self.cache.batch(self.config.cache_batch_size) as batch:
+            for cur_path, hashcode, new_path in journal_entries:
+                if not new_path.exists():
+                    entries_to_move.append((cur_path, hashcode, new_path))
+                    continue
+                if cur_path.exists():
+                    if self.hasher.get_hash(cur_path) != self.hasher.get_hash(new_path):
+                        logging.error(f"Unable to resume {cur_path} => {new_path}, a different file is in the way")
+                        batch.set_journal_status(cur_path, JOURNAL_FAILED)
+                        self.counter_logger.inc("Move failed")
+                        continue
+                    os.remove(cur_path)
+                logging.info(f"Moved before interruption {cur_path} => {new_path}")
+                self._record_move(batch, cur_path, hashcode, new_path, os.stat(new_path))
+                self.counter_logger.inc("Added to library")
 
-    def _merge_calculate_new_paths(self, pending_processing_paths):
-        # Calculate new paths
+        self._merge_move_files(entries_to_move)
+        self.counter_logger.dump()
+
+    def watch(self, interval: float = WATCH_INTERVAL_SECONDS, settle_seconds: float = WATCH_SETTLE_SECONDS,
+              cycles: Optional[int] = None):
+        """
+        Keep merging the files dropped into the incoming dir without confirmation, until interrupted
+        0. Run setup once, and resume the moves of an interrupted merge
+        1. Poll the incoming dir every interval seconds, the library is not walked again
+        2. Merge the files whose size and modification time have settled, in batches of WATCH_BATCH_SIZE,
+           against the cache and the new paths allocated since startup
+        Files left in the incoming dir, like duplicates, files without time or files failing to merge,
+        are not merged again unless modified, the failed moves are kept in the journal for resume to retry
+        @param interval: The seconds between polls
+        @param settle_seconds: The seconds the size and modification time of a file must be unchanged
+        @param cycles: The number of polls before returning, None to poll until interrupted
+        """
+        if self.config.similar_check and not self.perceptual_hasher.is_available():
+            raise InvalidConfigException("SimilarCheck requires Pillow and NumPy, install them or turn it off")
+        self.setup()
+        if len(self.cache.get_journal_entries()) > 0:
+            self.resume()
+
+        path_allocator = PathAllocator(self._get_taken_paths)
+        # Loaded once, the photos merged since are added to it
+        similar_index = self._load_similar_index() if self.config.similar_check else None
+        watcher = IncomingWatcher(settle_seconds)
+        logging.info(f"Watching {self.config.incoming_dir}, press Ctrl+C to stop")
+        cycle = 0
+        try:
+            while cycles is None or cycle < cycles:
+                if cycle > 0:
+                    time.sleep(interval)
+                cycle += 1
+                incoming_paths = self.library.get_all_incoming_paths(summarize_unrecognized=False)
+                ready_paths = watcher.poll(incoming_paths, time.monotonic())
+                for start in range(0, len(ready_paths), WATCH_BATCH_SIZE):
+                    batch_paths = ready_paths[start:start + WATCH_BATCH_SIZE]
+                    logging.info(f"Process incoming files: {len(batch_paths)}")
+                    self._watch_merge_batch(batch_paths, path_allocator, similar_index)
+                    watcher.mark_handled(batch_paths)
+        except KeyboardInterrupt:
+            # Moves interrupted halfway are left in the journal, and resumed by the next watch or resume
+            logging.info("Stopped watching")
+
+    def _watch_merge_batch(self, batch_paths: List[Path], path_allocator: PathAllocator,
+                           similar_index: Optional[BKTree]) -> None:
+        """
+        Merge a batch of settled files, a file which cannot be merged is skipped rather than stopping the watch
+        When the batch fails, e.g. a file removed or locked since polled, its files are merged one by one
+        """
+        try:
+            self._merge_execute(*self._merge_plan(batch_paths, path_allocator, similar_index), append_journal=True,
+                                similar_index=similar_index)
+            return
+        except (OSError, ExifToolException) as e:
+            logging.error(f"Unable to merge the batch, merging its files one by one: {e}")
+
+        for path in batch_paths:
+            # The files moved before the batch failed are gone
+            if not path.exists():
+                continue
+            try:
+                self._merge_execute(*self._merge_plan([path], path_allocator, similar_index), append_journal=True,
+                                    similar_index=similar_index)
+            except (OSError, ExifToolException) as e:
+                logging.error(f"Skip {path}: {e}")
+                self.counter_logger.inc("Skipped by error")
+        self.counter_logger.dump()
+
+    def _merge_calculate_new_paths(self, pending_processing_paths, path_to_time, path_allocator: PathAllocator):
         incoming_path_to_new_path = {}
-        library_dedup_paths = set(self.library.get_all_library_paths())
         for path in pending_processing_paths:
-            dedup_suffix = 0
-            new_path = self.renamer.get_path(path)
-            if not new_path:
+            if path_to_time[path] is None:
                 logging.warning(f"Unable to rename {path}")
                 self.counter_logger.inc("Unable to rename")
                 continue
 
-            new_path_without_dedup_suffix = new_path
-            while new_path in library_dedup_paths:
-                dedup_suffix = dedup_suffix + 1
-                new_path = self.renamer.suffix_path(new_path_without_dedup_suffix, dedup_suffix)
-
+            new_path = path_allocator.allocate(self.renamer.get_path_by_time(path, path_to_time[path].time))
             logging.info(f"Plan to move {path} => {new_path}")
             incoming_path_to_new_path[path] = new_path
-            library_dedup_paths.add(new_path)
             self.counter_logger.inc("Plan to move")
         return incoming_path_to_new_path
 
-    def _merge_move_files(self, incoming_path_to_new_path, incoming_path_to_hash):
-        for cur_path, new_path in incoming_path_to_new_path.items():
-            logging.info(f"Move {cur_path} => {new_path}")
-            self.library.move_file(cur_path, new_path)
-            self.cache.upsert_hashcode_doc(new_path, incoming_path_to_hash[cur_path], os.path.getsize(new_path))
-            self.counter_logger.inc("Added to library")
+    def _load_similar_index(self) -> BKTree:
+        """
+        Index the perceptual hashes of the library photos for SimilarCheck
+        Only the library photos hashed by similar or merged with SimilarCheck on are indexed
+        @return: The index of the library paths
+        """
+        index = BKTree()
+        for path, (_, phash) in self.cache.get_perceptual_hashes().items():
+            if phash is not None:
+                index.add(phash, path)
+        if len(index) == 0:
+            logging.info("No library photo indexed for SimilarCheck yet, run similar once to index them")
+        return index
+
+    def _merge_check_similar(self, paths: Iterable[Path], index: BKTree) -> Dict[Path, int]:
+        """
+        Warn about the incoming photos similar to library photos or to each other, they are still merged
+        @param paths: The incoming paths
+        @param index: The index of the library photos, left as is
+        @return: Dict of incoming path to perceptual hash
+        """
+        incoming_index = BKTree()
+        path_to_phash = {}
+        photo_paths = [path for path in paths if self.perceptual_hasher.is_supported(path)]
+        for path, phash in self.perceptual_hasher.get_hashes(photo_paths, self.config.jobs):
+            if phash is None:
+                continue
+            matches = index.search(phash, self.config.similar_distance) + \
+                incoming_index.search(phash, self.config.similar_distance)
+            if len(matches) > 0:
+                distance, similar_path = min(matches, key=lambda match: match[0])
+                logging.warning(f"Similar (distance {distance}): {path} ~ {similar_path}")
+                self.counter_logger.inc("Similar photos")
+            incoming_index.add(phash, path)
+            path_to_phash[path] = phash
+        return path_to_phash
+
+    def _merge_record_perceptual_hashes(self, journal_entries, incoming_path_to_phash: Dict[Path, int],
+                                        similar_index: Optional[BKTree] = None) -> None:
+        # The moved photos are indexed for the SimilarCheck of the next merges without decoding them again
+        entries = []
+        for cur_path, _, new_path in journal_entries:
+            if cur_path in incoming_path_to_phash and not cur_path.exists() and new_path.exists():
+                entries.append((new_path, os.stat(new_path).st_mtime_ns, incoming_path_to_phash[cur_path]))
+                if similar_index is not None:
+                    similar_index.add(incoming_path_to_phash[cur_path], new_path)
+        self.cache.upsert_perceptual_hashes(entries)
+
+    def similar(self):
+        """
+        Find the similar photos in the library, like re-encoded, resized or exported copies which MD5 tells apart
+        1. Compute the perceptual hashes of the photos added or modified since the last run, the others are cached
+        2. Index the hashes in a BK-tree, looking up each photo before adding it so that each pair is reported once
+           - A lookup within a small distance only visits a small part of the tree, rather than every photo
+        """
+        if not self.perceptual_hasher.is_available():
+            raise InvalidInputException("similar requires Pillow and NumPy, install them to find similar photos")
+
+        index = BKTree()
+        for path, phash in sorted(self._update_perceptual_hashes()):
+            for distance, similar_path in index.search(phash, self.config.similar_distance):
+                logging.warning(f"Similar (distance {distance}): {path} ~ {similar_path}")
+                self.counter_logger.inc("Similar pairs")
+            index.add(phash, path)
+        logging.info(f"Photos indexed by perceptual hash: {len(index)}")
+        self.counter_logger.dump()
+
+    def _update_perceptual_hashes(self) -> List[Tuple[str, int]]:
+        """
+        Bring the perceptual hashes in the cache in sync with the library photos
+        @return: List of (path, hash) of the library photos which can be decoded
+        """
+        path_to_cached = self.cache.get_perceptual_hashes()
+        path_to_phash = {}
+        path_to_mtime = {}
+        for path, stat in self.library.iter_library_files():
+            if not self.perceptual_hasher.is_supported(path):
+                continue
+            cached = path_to_cached.pop(path.lower(), None)
+            if cached is not None and cached[0] == stat.st_mtime_ns:
+                path_to_phash[path] = cached[1]
+            else:
+                path_to_mtime[path] = stat.st_mtime_ns
+        # The ones left are no longer in the library
+        self.cache.delete_perceptual_hashes(path_to_cached.keys())
+        logging.info(f"Photos to hash perceptually: {len(path_to_mtime)}")
+
+        entries = []
+        for path, phash in self.perceptual_hasher.get_hashes(path_to_mtime.keys(), self.config.jobs):
+            path_to_phash[path] = phash
+            entries.append((path, path_to_mtime[path], phash))
+            self.counter_logger.inc("Perceptual hashed", step=1000)
+            if len(entries) >= self.config.cache_batch_size:
+                self.cache.upsert_perceptual_hashes(entries)
+                entries = []
+        self.cache.upsert_perceptual_hashes(entries)
+        return [(path, phash) for path, phash in path_to_phash.items() if phash is not None]
+
+    def _get_taken_paths(self, dir_path: Path) -> List[str]:
+        # The cache is kept in sync with the library by setup and merge, and the listing of the target directory
+        # covers the files added since, so the library is not walked again
+        return self.cache.get_paths_in_dir(dir_path) + self.library.get_dir_paths(dir_path)
+
+    def _merge_move_files(self, journal_entries):
+        """
+        Move the files of the journal entries, checkpointing each move in the journal along with the hash
+        Moves run concurrently, the cache is updated in batches as they complete
+        The journal is cleared once all moves are done, failed ones are left for resume to retry
+        """
+        hashcodes = {cur_path: hashcode for cur_path, hashcode, _ in journal_entries}
+        with self.cache.batch(self.config.cache_batch_size) as batch:
+            moves = ((cur_path, new_path) for cur_path, _, new_path in journal_entries)
+            for cur_path, new_path, stat in self.library.move_files(moves, self.config.move_jobs):
+                if stat is None:
+                    batch.set_journal_status(cur_path, JOURNAL_FAILED)
+                    self.counter_logger.inc("Move failed")
+                    continue
+                logging.info(f"Moved {cur_path} => {new_path}")
+                self._record_move(batch, cur_path, hashcodes[cur_path], new_path, stat)
+                self.counter_logger.inc("Added to library", step=1000)
+
+        if len(self.cache.get_journal_entries()) == 0:
+            self.cache.clear_journal()
+        else:
+            logging.warning("Run resume to retry the failed moves")
+
+    def _record_move(self, batch: CacheBatch, cur_path, hashcode, new_path, stat: os.stat_result) -> None:
+        if hashcode is None:
+            self._upsert_doc(batch, new_path, "", Hasher.ALGORITHM_PENDING, stat)
+        else:
+            self._upsert_doc(batch, new_path, hashcode, self.hasher.get_algorithm(stat.st_size), stat)
+        batch.set_journal_status(cur_path, JOURNAL_MOVED)
 
     def setup(self):
         """
-        Set up the Organizer library:
-        1. For all docs in Cache, remove if the file is missing in Library
-        2. For all files in the Library, hash it if the hash is missing in Cache
+        Set up the Organizer library by reconciling the scanned file stats with the Cache inside SQLite:
+        1. For files moved inside the Library (same device and inode), carry the hash over to the new path
+        2. For all docs in Cache, remove if the file is missing in Library
+        3. For all files in the Library, hash it if it is new, modified since hashing (size or mtime changed)
+           or hashed by an outdated algorithm
         """
-        library_paths = set(self.library.get_all_library_paths())
-        cache_docs = self.cache.get_all()
-        logging.info(f"Pre-Setup Hash size: {len(cache_docs)}")
-        self._setup_remove_redundant_hash(library_paths, cache_docs)
+        logging.info(f"Pre-Setup Hash size: {self.cache.count()}")
+        scanned = self.cache.load_scan((path, stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev,
+                                        self.hasher.get_algorithm(stat.st_size))
+                                       for path, stat in self.library.iter_library_files())
+        logging.info(f"Library files scanned: {scanned}")
+        try:
+            self._setup_remove_redundant_hash()
+            self._setup_pave_cache()
+        finally:
+            self.cache.drop_scan()
 
-        cache_docs = self.cache.get_all()
-        self._setup_pave_cache(library_paths, cache_docs)
+        logging.info(f"Post-Setup Hash size: {self.cache.count()}")
 
-        logging.info(f"Post-Setup Hash size: {len(self.cache.get_all())}")
+    def _setup_remove_redundant_hash(self):
+        # The directory listing has no file id on Windows, so stat the files which may have been moved
+        missing_file_id_paths = self.cache.get_scan_paths_without_file_id()
+        if len(missing_file_id_paths) > 0:
+            self.cache.update_scan_file_ids((path, stat.st_ino, stat.st_dev)
+                                            for path, stat in ((p, os.stat(p)) for p in missing_file_id_paths))
 
-    def _setup_remove_redundant_hash(self, library_paths, cache_docs):
-        for path in [doc.path for doc in cache_docs]:
-            if path not in library_paths:
-                self.cache.delete_by_path(path)
-                logging.debug(f"Hash removed for non-exist file: {path}")
-                self.counter_logger.inc("Hash removed", step=1000)
+        # Moved files are carried over before the docs of their old paths are removed
+        self.counter_logger.inc("Hash moved", increment=self.cache.scan_carry_over_moved())
+        self.counter_logger.inc("Hash removed", increment=self.cache.scan_delete_missing())
         self.counter_logger.dump()
 
-    def _setup_pave_cache(self, library_paths, cache_docs):
-        # Check if cache entry already exists
-        cache_paths = set([doc.path for doc in cache_docs])
-        paths_to_hash = list(filter(lambda p: p not in cache_paths, library_paths))
-        self.counter_logger.inc(f"Hash hits", increment=len(library_paths) - len(paths_to_hash))
-
-        # Compute and update hash
-        logging.info(f"Files to hash: {len(paths_to_hash)}")
-        for path in paths_to_hash:
-            hashcode = self.hasher.get_hash(path)
-            self.cache.upsert_hashcode_doc(path, hashcode, os.path.getsize(path))
-            logging.debug(f"Hashed to {hashcode}: {path}")
-            self.counter_logger.inc("Hash computed", step=1000)
+    def _setup_pave_cache(self):
+        self.counter_logger.inc("Stat recorded", increment=self.cache.scan_record_stat())
+        path_to_scanned = {path: (size, mtime_ns) for path, size, mtime_ns in self.cache.get_scan_paths_to_hash()}
+
+        # Compute and update hash as the results arrive
+        logging.info(f"Files to hash: {len(path_to_scanned)}")
+        with self.cache.batch(self.config.cache_batch_size) as batch:
+            for path, hashcode in self.hasher.get_hashes(path_to_scanned.keys(), self.config.jobs):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    logging.warning(f"Skip {path} deleted while hashing")
+                    self.counter_logger.inc("Deleted while hashing")
+                    continue
+                # Recorded with the stat of a later content, the hash of a file modified while hashing would be trusted
+                if (stat.st_size, stat.st_mtime_ns) != path_to_scanned[path]:
+                    logging.warning(f"Skip {path} modified while hashing, the next setup hashes it again")
+                    self.counter_logger.inc("Modified while hashing")
+                    continue
+                self._upsert_doc(batch, path, hashcode, self.hasher.get_algorithm(stat.st_size), stat)
+                logging.debug(f"Hashed to {hashcode}: {path}")
+                self.counter_logger.inc("Hash computed", step=1000)
         self.counter_logger.dump()
 
     @staticmethod
-    def _group_by(docs: List[Doc], key_selector: Callable[[Doc], str]):
-        key_to_doc = {}
-        for doc in docs:
-            key = key_selector(doc)
-            if key not in key_to_doc:
-                key_to_doc[key] = []
-            key_to_doc[key].append(doc)
-        return key_to_doc
+    def _upsert_doc(batch: CacheBatch, path, hashcode: str, algorithm: str, stat: os.stat_result) -> None:
+        batch.upsert_hashcode_doc(path, hashcode, stat.st_size, algorithm, stat.st_mtime_ns, stat.st_ino, stat.st_dev)
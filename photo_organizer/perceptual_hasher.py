@@ -0,0 +1,77 @@
+import logging
+import os
+import pathlib
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+from .executor import map_bounded
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # Optional, only needed by the similar action and the SimilarCheck of merge
+    np = None
+    Image = None
+
+# The photos Pillow decodes out of the box, HEIC would need a plugin
+PERCEPTUAL_SUFFIXES = frozenset([".bmp", ".gif", ".jpg", ".jpeg", ".png"])
+
+
+class PerceptualHasher:
+    """
+    Difference hash (dHash) of photos, which survives re-encoding, resizing and small edits unlike MD5
+    so that the copies recompressed by OneDrive or WhatsApp, or exported to another format, can be told apart
+    from different photos by a small Hamming distance
+    """
+
+    def __init__(self, hash_size: int = 8):
+        """
+        @param hash_size: The width and height of the grid of gradients, the hash has hash_size ** 2 bits
+        """
+        self.hash_size = hash_size
+
+    @staticmethod
+    def is_available() -> bool:
+        """
+        @return: Whether Pillow and NumPy are installed
+        """
+        return Image is not None
+
+    @staticmethod
+    def is_supported(file_path: Union[str, pathlib.Path]) -> bool:
+        """
+        @param file_path: The file path
+        @return: Whether the file is a photo which can be hashed
+        """
+        return os.path.splitext(file_path)[1].lower() in PERCEPTUAL_SUFFIXES
+
+    def get_hash(self, file_path: Union[str, pathlib.Path]) -> Optional[int]:
+        """
+        Get the dHash of a photo:
+        1. Shrink the grayscale photo to (hash_size + 1) x hash_size, which drops the details and the noise
+        2. Compare each pixel with its right neighbour, one bit per comparison
+        @param file_path: The file path
+        @return: The hash as an unsigned integer, or None if the file cannot be decoded
+        """
+        try:
+            with Image.open(file_path) as image:
+                # JPEG is decoded at a reduced scale directly, much faster than decoding the full photo
+                image.draft("L", (self.hash_size * 8, self.hash_size * 8))
+                image = image.convert("L").resize((self.hash_size + 1, self.hash_size), Image.BILINEAR)
+                pixels = np.asarray(image, dtype=np.int16)
+        except (OSError, ValueError) as e:
+            logging.debug(f"Unable to decode {file_path} for the perceptual hash: {e}")
+            return None
+
+        bits = pixels[:, 1:] > pixels[:, :-1]
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+    def get_hashes(self, file_paths: Iterable[Union[str, pathlib.Path]], jobs: int = 1) \
+            -> Iterator[Tuple[Union[str, pathlib.Path], Optional[int]]]:
+        """
+        Hash the given photos on a pool of worker threads and stream the results back in completion order
+        Pillow releases the GIL while decoding, so threads decode in parallel
+        @param file_paths: The file paths
+        @param jobs: The number of worker threads, 1 for hashing on the calling thread
+        @return: Iterator of (path, hash or None) in completion order
+        """
+        return map_bounded(lambda path: (path, self.get_hash(path)), file_paths, jobs, jobs * 4, "PerceptualHasher")
@@ -0,0 +1,171 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+_END = object()
+
+
+class _Stage:
+    def __init__(self, name: str, func: Callable[[Any], Iterable], workers: int,
+                 flush: Optional[Callable[[], Iterable]], queue_size: int):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.flush = flush
+        self.input = queue.Queue(maxsize=queue_size)
+        self.running_workers = workers
+        self.lock = threading.Lock()
+        # Stats
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.depth_max = 0
+        self.depth_total = 0
+
+
+class Pipeline:
+    """
+    A chain of stages running on their own threads, connected by bounded queues
+    so that the disk, the CPU and exiftool are kept busy at the same time while the memory stays bounded
+    Each stage maps an input item to an iterable of output items, so that it can filter, fan out or batch items
+    """
+
+    def __init__(self, name: str, queue_size: int = 256):
+        """
+        @param name: The name used in the logs and thread names
+        @param queue_size: The maximum number of items waiting in front of each stage
+        """
+        self.name = name
+        self.queue_size = queue_size
+        self._stages: List[_Stage] = []
+        self._error: Optional[BaseException] = None
+        self._stopping = False
+
+    def add_stage(self, name: str, func: Callable[[Any], Iterable], workers: int = 1,
+                  flush: Optional[Callable[[], Iterable]] = None) -> "Pipeline":
+        """
+        Append a stage to the pipeline
+        @param name: The stage name
+        @param func: The function mapping an input item to an iterable of output items
+        @param workers: The number of threads running func, the order of the outputs is not kept if more than 1
+        @param flush: The function returning the last output items once the input is exhausted, e.g. a partial batch
+        @return: The pipeline itself
+        """
+        self._stages.append(_Stage(name, func, workers, flush, self.queue_size))
+        return self
+
+    def run(self, items: Iterable) -> Iterator:
+        """
+        Feed the items through the stages, and stream the outputs of the last stage back
+        The first exception raised by a stage stops the pipeline and is re-raised here
+        A pipeline runs once
+        @param items: The input items, consumed lazily
+        @return: Iterator of the output items of the last stage
+        """
+        output = queue.Queue(maxsize=self.queue_size)
+        threads = [threading.Thread(target=self._feed, args=(items,), name=f"{self.name}-feed", daemon=True)]
+        for index, stage in enumerate(self._stages):
+            next_queue = self._stages[index + 1].input if index + 1 < len(self._stages) else output
+            threads.extend(threading.Thread(target=self._work, args=(stage, next_queue), daemon=True,
+                                            name=f"{self.name}-{stage.name}-{worker}")
+                           for worker in range(stage.workers))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        finished = False
+        try:
+            while True:
+                item = output.get()
+                if item is _END:
+                    finished = True
+                    break
+                if not self._stopping:
+                    yield item
+        finally:
+            if not finished:
+                # Closed early by the caller, let the stages drain their queues without processing
+                self._stopping = True
+                while output.get() is not _END:
+                    pass
+            for thread in threads:
+                thread.join()
+            self._log_stats(time.perf_counter() - start)
+
+        if self._error is not None:
+            raise self._error
+
+    def _feed(self, items: Iterable) -> None:
+        first = self._stages[0].input
+        try:
+            for item in items:
+                if self._stopping:
+                    break
+                first.put(item)
+        except BaseException as e:
+            self._fail(e)
+        for _ in range(self._stages[0].workers):
+            first.put(_END)
+
+    def _work(self, stage: _Stage, next_queue: queue.Queue) -> None:
+        while True:
+            with stage.lock:
+                depth = stage.input.qsize()
+                stage.depth_max = max(stage.depth_max, depth)
+                stage.depth_total += depth
+            item = stage.input.get()
+            if item is _END:
+                break
+            with stage.lock:
+                stage.items_in += 1
+            if self._stopping:
+                continue  # Drain without processing, so that the upstream stages are not blocked
+            self._process(stage, next_queue, lambda: stage.func(item))
+
+        with stage.lock:
+            stage.running_workers -= 1
+            last_worker = stage.running_workers == 0
+        if not last_worker:
+            return
+        if stage.flush is not None and not self._stopping:
+            self._process(stage, next_queue, stage.flush)
+        for _ in range(self._get_workers(next_queue)):
+            next_queue.put(_END)
+
+    def _process(self, stage: _Stage, next_queue: queue.Queue, func: Callable[[], Iterable]) -> None:
+        start = time.perf_counter()
+        outputs = 0
+        blocked_seconds = 0.0
+        try:
+            for output in func():
+                # Waiting for room in a full queue is the next stage being the bottleneck, not this one being busy
+                put_start = time.perf_counter()
+                next_queue.put(output)
+                blocked_seconds += time.perf_counter() - put_start
+                outputs += 1
+        except BaseException as e:
+            self._fail(e)
+        with stage.lock:
+            stage.items_out += outputs
+            stage.busy_seconds += time.perf_counter() - start - blocked_seconds
+
+    def _fail(self, error: BaseException) -> None:
+        if self._error is None:
+            self._error = error
+        self._stopping = True
+
+    def _get_workers(self, next_queue: queue.Queue) -> int:
+        for stage in self._stages:
+            if stage.input is next_queue:
+                return stage.workers
+        return 1
+
+    def _log_stats(self, elapsed: float) -> None:
+        for stage in self._stages:
+            gets = stage.items_in + stage.workers
+            utilization = stage.busy_seconds / max(elapsed * stage.workers, 1e-9)
+            logging.info(f"Pipeline {self.name} stage {stage.name}: {stage.items_in} in, {stage.items_out} out, "
+                         f"{stage.items_in / max(elapsed, 1e-9):.1f} items/s, {utilization:.0%} busy, "
+                         f"queue depth max {stage.depth_max} avg {stage.depth_total / gets:.1f}")
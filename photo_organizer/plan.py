@@ -0,0 +1,50 @@
+import json
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+
+class PlanEntry(NamedTuple):
+    """
+    A planned move of merge, with the stat of the incoming file at planning time to detect changes before applying
+    """
+    incoming_path: Path
+    hashcode: Optional[str]  # None if hashing is deferred
+    new_path: Path
+    size: int
+    mtime_ns: int
+
+
+def write_plan(plan_path: Path, entries: Iterable[PlanEntry]) -> int:
+    """
+    Write the plan as JSON lines, one entry per line as they come
+    @param plan_path: The plan file path
+    @param entries: The plan entries
+    @return: The number of entries written
+    """
+    count = 0
+    with open(plan_path, "w", encoding="utf-8") as plan_file:
+        for entry in entries:
+            plan_file.write(json.dumps({
+                "incoming_path": str(entry.incoming_path),
+                "hashcode": entry.hashcode,
+                "new_path": str(entry.new_path),
+                "size": entry.size,
+                "mtime_ns": entry.mtime_ns
+            }) + "\n")
+            count += 1
+    return count
+
+
+def read_plan(plan_path: Path) -> Iterator[PlanEntry]:
+    """
+    Lazily read the plan written by write_plan
+    @param plan_path: The plan file path
+    @return: Iterator of the plan entries
+    """
+    with open(plan_path, "r", encoding="utf-8") as plan_file:
+        for line in plan_file:
+            if line.strip() == "":
+                continue
+            entry = json.loads(line)
+            yield PlanEntry(Path(entry["incoming_path"]), entry["hashcode"], Path(entry["new_path"]),
+                            entry["size"], entry["mtime_ns"])
@@ -1,9 +1,15 @@
 import datetime
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Sequence
 
 from photo_organizer.exif.exif_tool import ExifTool
+from photo_organizer.exif.header_parser import get_sub_second_microseconds
+from photo_organizer.renamer.renamer import ExtractedTime
+
+# QuickTime metadata may be stored after the mdat atom, which exiftool stops at with -fast2
+QUICKTIME_SUFFIXES = frozenset([".m4v", ".mov", ".mp4"])
 
 
 class MetadataTimeExtractor:
@@ -11,8 +17,15 @@ class MetadataTimeExtractor:
     The time extractor from EXIF data
     """
 
-    def __init__(self, working_dir: Path):
-        self.exif_tool = ExifTool(working_dir / "exiftool.exe")
+    def __init__(self, working_dir: Path, sessions: int = 1, chunk_size: int = 50):
+        """
+        @param working_dir: The dir containing exiftool.exe
+        @param sessions: The number of exiftool sessions extracting chunks in parallel
+        @param chunk_size: The number of files passed to exiftool per call
+        """
+        self.exif_tool = ExifTool(working_dir / "exiftool.exe", sessions=sessions)
+        self.sessions = sessions
+        self.chunk_size = chunk_size
         self.exif_date_field_to_format = {
             "EXIF:DateTimeOriginal": "%Y:%m:%d %H:%M:%S",   # Prefer EXIF:DateTimeOriginal for non .mov files
             "QuickTime:CreationDate": "%Y:%m:%d %H:%M:%S%z",  # Prefer CreationDate since it has timezone info
@@ -23,21 +36,66 @@ class MetadataTimeExtractor:
             "File:FileModifyDate": "%Y:%m:%d %H:%M:%S%z"
         }
 
+        # The fraction of a second of EXIF:DateTimeOriginal, e.g. to tell apart the shots of a burst
+        self.exif_sub_second_field = "EXIF:SubSecTimeOriginal"
+
     def get_time(self, path: Path) -> Optional[datetime.datetime]:
-        metadata = self.exif_tool.get_metadata(path)[0]
+        extracted_time = self.get_times([path])[path]
+        return None if extracted_time is None else extracted_time.time
+
+    def get_times(self, paths: Sequence[Path]) -> Dict[Path, Optional[ExtractedTime]]:
+        """
+        Get the time of many files, passing chunks of files to exiftool and only requesting the date tags
+        @param paths: The file paths
+        @return: Dict of path to extracted time, None if no time is found
+        """
+        chunks = [paths[start:start + self.chunk_size] for start in range(0, len(paths), self.chunk_size)]
+        path_to_time = {}
+        with ThreadPoolExecutor(max_workers=self.sessions, thread_name_prefix="ExifTool") as executor:
+            for chunk_path_to_time in executor.map(self._get_times_of_chunk, chunks):
+                path_to_time.update(chunk_path_to_time)
+        return path_to_time
+
+    def get_version(self) -> str:
+        return f"2:{self.exif_date_field_to_format}:{self.exif_date_backup_fields_to_format}:" \
+               f"{self.exif_sub_second_field}"
+
+    def _get_times_of_chunk(self, paths: Sequence[Path]) -> Dict[Path, Optional[ExtractedTime]]:
+        tags = list(self.exif_date_field_to_format.keys()) + list(self.exif_date_backup_fields_to_format.keys()) + \
+            [self.exif_sub_second_field]
+        quicktime_paths = [path for path in paths if Path(path).suffix.lower() in QUICKTIME_SUFFIXES]
+        other_paths = [path for path in paths if Path(path).suffix.lower() not in QUICKTIME_SUFFIXES]
+        metadata_list = self.exif_tool.get_metadata_batch(quicktime_paths, tags, fast=1) + \
+            self.exif_tool.get_metadata_batch(other_paths, tags, fast=2)
+
+        source_file_to_metadata = {metadata["SourceFile"]: metadata for metadata in metadata_list}
+        path_to_time = {}
+        for path in paths:
+            metadata = source_file_to_metadata.get(Path(path).as_posix())
+            if metadata is None:
+                logging.warning(f"No metadata read by exiftool for {path}")
+                path_to_time[path] = None
+            else:
+                path_to_time[path] = self._get_time_from_metadata(path, metadata)
+        return path_to_time
+
+    def _get_time_from_metadata(self, path: Path, metadata: dict) -> Optional[ExtractedTime]:
         logging.debug(f"{path}: {metadata}")
 
         for exif_date_field, date_format in self.exif_date_field_to_format.items():
             if exif_date_field not in metadata:
                 continue
             try:
-                return datetime.datetime.strptime(metadata[exif_date_field], date_format)
+                time = datetime.datetime.strptime(metadata[exif_date_field], date_format)
             except ValueError:
                 return None
+            if exif_date_field == "EXIF:DateTimeOriginal" and self.exif_sub_second_field in metadata:
+                time = time.replace(microsecond=get_sub_second_microseconds(str(metadata[self.exif_sub_second_field])))
+            return ExtractedTime(time, exif_date_field)
 
         for exif_date_field, date_format in self.exif_date_backup_fields_to_format.items():
             if exif_date_field in metadata:
                 logging.warning(f"Unreliable date {exif_date_field} used for {path} = {metadata[exif_date_field]}")
-                return datetime.datetime.strptime(metadata[exif_date_field], date_format)
+                return ExtractedTime(datetime.datetime.strptime(metadata[exif_date_field], date_format), exif_date_field)
 
         return None
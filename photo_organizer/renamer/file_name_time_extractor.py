@@ -1,38 +1,108 @@
 import datetime
-import re
 import logging
+import os
+import re
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Sequence, Union
+
+from photo_organizer.renamer.renamer import ExtractedTime
+
+DEFAULT_PATTERNS = [
+    "%Y%m%d_%H%M%S",
+    "%Y%m%d-%H%M%S"
+]
+
+# The strftime directives supported in patterns, with the datetime field and digit count of each
+DIRECTIVE_TO_FIELD = {
+    "Y": ("year", 4),
+    "m": ("month", 2),
+    "d": ("day", 2),
+    "H": ("hour", 2),
+    "M": ("minute", 2),
+    "S": ("second", 2)
+}
 
 
 class FileNameTimeExtractor:
     """
     The time extractor from file name
+    All patterns are compiled once into a single regex, whose match for the first pattern found exactly once is used
     """
-    def __init__(self):
-        self.known_patterns = [
-            "%Y%m%d_%H%M%S",
-            "%Y%m%d-%H%M%S"
-        ]
-
-    def get_time(self, path: Path) -> Optional[datetime.datetime]:
-        filename = path.name
-        for pattern in self.known_patterns:
-            regex_pattern = self._get_regex_pattern(pattern)
-            matches = re.findall(regex_pattern, filename)
-            if len(matches) == 0:
-                continue
-            elif len(matches) > 1:
+    def __init__(self, patterns: Optional[List[str]] = None):
+        """
+        @param patterns: The strftime like patterns of the time in file names in priority order, e.g. "IMG-%Y%m%d-WA",
+            supporting %Y %m %d %H %M %S, the default ones if None
+        """
+        self.known_patterns = list(DEFAULT_PATTERNS if patterns is None else patterns)
+        self.regex = re.compile("|".join(f"(?P<p{index}>{self._get_regex_pattern(pattern, index)})"
+                                         for index, pattern in enumerate(self.known_patterns)))
+        # The group names of each pattern in datetime argument order, with the fields if not passable by position
+        all_fields = [field for field, _ in DIRECTIVE_TO_FIELD.values()]
+        self.pattern_groups = {}
+        for index in range(len(self.known_patterns)):
+            fields = [field for field in all_fields if f"p{index}_{field}" in self.regex.groupindex]
+            groups = [f"p{index}_{field}" for field in fields]
+            self.pattern_groups[f"p{index}"] = (index, groups, None if fields == all_fields[:len(fields)] else fields)
+
+    def get_time(self, path: Union[Path, str]) -> Optional[datetime.datetime]:
+        filename = path.name if isinstance(path, Path) else os.path.basename(path)
+        matches = list(self.regex.finditer(filename))
+        if len(matches) == 0:
+            return None
+        elif len(matches) == 1:
+            return self._get_time_from_match(filename, matches[0])
+
+        index_to_matches = {}
+        for match in matches:
+            index_to_matches.setdefault(self.pattern_groups[match.lastgroup][0], []).append(match)
+        for index in sorted(index_to_matches.keys()):
+            if len(index_to_matches[index]) > 1:
                 logging.warning(f"Multiple time pattern matches in the file name: {filename}")
                 continue
-
-            return datetime.datetime.strptime(matches[0], pattern)
+            time = self._get_time_from_match(filename, index_to_matches[index][0])
+            if time is not None:
+                return time
 
         return None
 
+    def get_times(self, paths: Sequence[Path]) -> Dict[Path, Optional[ExtractedTime]]:
+        path_to_time = {}
+        for path in paths:
+            time = self.get_time(path)
+            path_to_time[path] = None if time is None else ExtractedTime(time, "FileName")
+        return path_to_time
+
+    def _get_time_from_match(self, filename: str, match: re.Match) -> Optional[datetime.datetime]:
+        _, groups, fields = self.pattern_groups[match.lastgroup]
+        try:
+            if fields is None:
+                return datetime.datetime(*map(int, match.group(*groups)))
+            return datetime.datetime(**dict(zip(fields, map(int, match.group(*groups)))))
+        except ValueError:
+            logging.debug(f"Invalid time {match.group()} in the file name: {filename}")
+            return None
+
+    def get_version(self) -> str:
+        return "1:" + ",".join(self.known_patterns)
+
     @staticmethod
-    def _get_regex_pattern(time_pattern):
-        regex_pattern = time_pattern.replace("%", "")
-        regex_pattern = re.sub("[mMdDhHsS]", "\\\\d\\\\d", regex_pattern)
-        regex_pattern = re.sub("[yY]", "\\\\d\\\\d\\\\d\\\\d", regex_pattern)
+    def _get_regex_pattern(time_pattern: str, index: int) -> str:
+        """
+        Translate a strftime like pattern into a regex with a named group per field, like (?P<p0_year>\\d{4})
+        """
+        parts = re.split("(%.)", time_pattern)
+        regex_pattern = ""
+        fields = set()
+        for part in parts:
+            if not part.startswith("%") or len(part) != 2:
+                regex_pattern += re.escape(part)
+            elif part[1] in DIRECTIVE_TO_FIELD and DIRECTIVE_TO_FIELD[part[1]][0] not in fields:
+                field, digits = DIRECTIVE_TO_FIELD[part[1]]
+                fields.add(field)
+                regex_pattern += f"(?P<p{index}_{field}>\\d{{{digits}}})"
+            else:
+                raise ValueError(f"Unsupported or repeated directive {part} in file name pattern {time_pattern}")
+
+        if not {"year", "month", "day"}.issubset(fields):
+            raise ValueError(f"File name pattern {time_pattern} should contain at least %Y, %m and %d")
         return regex_pattern
@@ -0,0 +1,39 @@
+import datetime
+import logging
+import struct
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+from photo_organizer.exif import header_parser
+from photo_organizer.renamer.renamer import ExtractedTime
+
+
+class HeaderTimeExtractor:
+    """
+    The time extractor parsing the JPEG, HEIC and QuickTime headers in process
+    It resolves the common files without starting exiftool, and leaves the rest to the following extractors
+    """
+
+    def get_time(self, path: Path) -> Optional[datetime.datetime]:
+        extracted_time = self._get_extracted_time(path)
+        return None if extracted_time is None else extracted_time.time
+
+    def get_times(self, paths: Sequence[Path]) -> Dict[Path, Optional[ExtractedTime]]:
+        return {path: self._get_extracted_time(path) for path in paths}
+
+    def get_version(self) -> str:
+        return "2"
+
+    @staticmethod
+    def _get_extracted_time(path: Path) -> Optional[ExtractedTime]:
+        try:
+            with open(path, "rb") as f:
+                parsed_time = header_parser.read_time(f)
+        except OSError as e:
+            logging.debug(f"Failed to read the header of {path}: {e}")
+            return None
+        except (struct.error, ValueError, OverflowError) as e:
+            # A corrupted header the parser does not guard against, left to the following extractors
+            logging.debug(f"Failed to parse the header of {path}: {e}")
+            return None
+        return None if parsed_time is None else ExtractedTime(*parsed_time)
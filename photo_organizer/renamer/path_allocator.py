@@ -0,0 +1,46 @@
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Set, Union
+
+from photo_organizer.renamer.renamer import Renamer
+
+
+class PathAllocator:
+    """
+    Allocate library paths free of conflicts, suffixing a taken path with the lowest free suffix like _01
+    The next suffix to try is remembered per path, so a burst of files sharing a time takes linear time in total
+    Paths are compared case-insensitively like on Windows
+    The taken paths are loaded per directory on first use, so only the directories receiving files are looked at
+    """
+
+    def __init__(self, get_taken_paths: Callable[[Path], Iterable[Union[Path, str]]]):
+        """
+        @param get_taken_paths: The function getting the paths already in a library directory like 2020/08
+        """
+        self._get_taken_paths = get_taken_paths
+        self._loaded_dirs: Set[str] = set()
+        self._taken: Set[str] = set()
+        self._path_to_next_suffix: Dict[str, int] = {}
+
+    def allocate(self, path: Path) -> Path:
+        """
+        Get the path itself if free, otherwise the path suffixed with the lowest free suffix, and mark it as taken
+        @param path: The path planned by the renamer
+        @return: The free path
+        """
+        key = str(path).lower()
+        dir_key = os.path.dirname(key)
+        if dir_key not in self._loaded_dirs:
+            self._loaded_dirs.add(dir_key)
+            self._taken.update(str(taken_path).lower() for taken_path in self._get_taken_paths(path.parent))
+
+        stem_key, suffix_key = os.path.splitext(key)
+        suffix = self._path_to_next_suffix.get(key, 0)
+        candidate = key if suffix == 0 else stem_key + Renamer.get_suffix(suffix) + suffix_key
+        while candidate in self._taken:
+            suffix += 1
+            candidate = stem_key + Renamer.get_suffix(suffix) + suffix_key
+
+        self._taken.add(candidate)
+        self._path_to_next_suffix[key] = suffix + 1
+        return path if suffix == 0 else Renamer.suffix_path(path, suffix)
@@ -1,5 +1,15 @@
+import datetime
+import hashlib
 from pathlib import Path
-from typing import Optional
+from typing import Dict, NamedTuple, Optional, Sequence
+
+
+class ExtractedTime(NamedTuple):
+    """
+    The time a media file was taken, with the source it was extracted from like "EXIF:DateTimeOriginal"
+    """
+    time: datetime.datetime
+    source: str
 
 
 class Renamer:
@@ -8,10 +18,15 @@ class Renamer:
     It uses a list of time extractors to find out the taken time of a media file, to decide the path
     """
 
-    def __init__(self, time_extractors):
+    def __init__(self, time_extractors, sub_second_names: bool = False):
+        """
+        @param time_extractors: The time extractors in priority order
+        @param sub_second_names: Append the milliseconds to the names of files whose time has them,
+                                 like 20200801_093650123.jpg, so that bursts of shots rarely need suffixes
+        """
         self.time_extractors = time_extractors
+        self.sub_second_names = sub_second_names
         self.file_path_pattern = "./%Y/%m/%Y%m%d_%H%M%S"
-        pass
 
     def get_path(self, path: Path) -> Optional[Path]:
         """
@@ -27,15 +42,61 @@ class Renamer:
 
         return None
 
+    def get_times(self, paths: Sequence[Path]) -> Dict[Path, Optional[ExtractedTime]]:
+        """
+        Get the times for many files, each time extractor handling the files left by the previous ones at once
+        @param paths: File paths
+        @return: Dict of path to the extracted time, None if no time is found
+        """
+        path_to_time = {}
+        unresolved_paths = list(paths)
+        for time_extractor in self.time_extractors:
+            if len(unresolved_paths) == 0:
+                break
+            path_to_time.update({path: extracted_time
+                                 for path, extracted_time in time_extractor.get_times(unresolved_paths).items()
+                                 if extracted_time is not None})
+            unresolved_paths = [path for path in unresolved_paths if path not in path_to_time]
+
+        for path in unresolved_paths:
+            path_to_time[path] = None
+        return path_to_time
+
+    def get_path_by_time(self, path: Path, time: datetime.datetime) -> Path:
+        """
+        Get the new path for a file taken at the time
+        @param path: File path
+        @param time: The time the file was taken
+        @return: The new file name
+        """
+        new_file_name = time.strftime(self.file_path_pattern)
+        if self.sub_second_names and time.microsecond != 0:
+            new_file_name += f"{time.microsecond // 1000:03}"
+        return Path(new_file_name + path.suffix.lower())
+
+    def get_version(self) -> str:
+        """
+        Get the version of the time extraction, which changes with the extractors or their config
+        @return: The version
+        """
+        versions = [f"{type(extractor).__name__}:{extractor.get_version()}" for extractor in self.time_extractors]
+        return hashlib.md5("|".join(versions).encode()).hexdigest()
+
     @staticmethod
     def suffix_path(path: Path, suffix: int) -> Path:
         """
         Suffix the path for avoiding name confliction
         @param path: file path
-        @param suffix: the suffix number
+        @param suffix: the suffix number, 2 digits at least and widened past 99 like _100
         @return: new path
         """
-        if suffix > 99:
-            raise Exception(f"Suffix is more than 2 digit")
+        return path.parent / (path.stem + Renamer.get_suffix(suffix) + path.suffix.lower())
 
-        return path.parent / (path.stem + f"_{suffix:02}" + path.suffix.lower())
+    @staticmethod
+    def get_suffix(suffix: int) -> str:
+        """
+        Get the text suffix_path appends to the file stem
+        @param suffix: the suffix number
+        @return: The suffix like _01
+        """
+        return f"_{suffix:02}"
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from benchmarks import run as benchmark_run
+from benchmarks.synthetic_library import build_library
+from photo_organizer.renamer.header_time_extractor import HeaderTimeExtractor
+
+
+class Test_build_library:
+    def test_should_lay_out_library_and_incoming_files(self):
+        library = build_library(Path("library"), file_count=50, incoming_count=20, duplicate_rate=0.5,
+                                file_size=1024)
+
+        assert len(library.library_paths) == 50
+        assert all(path.parent.parent.parent == Path("library") for path in library.library_paths)
+        assert len(library.incoming_paths) == 20
+        assert 0 < library.duplicate_count < 20
+        assert len({path.read_bytes() for path in library.library_paths}) == 50
+
+        media_paths = [path for path in library.incoming_paths if path.name.startswith("DSC_")]
+        assert all(time is not None for time in HeaderTimeExtractor().get_times(media_paths).values())
+
+
+class Test_run:
+    def test_should_run_all_scenarios(self, monkeypatch, capsys):
+        monkeypatch.setattr(benchmark_run, "FILE_NAME_COUNT", 100)
+        library = build_library(Path("library").resolve(), file_count=30, incoming_count=10, file_size=1024)
+        scenarios = list(benchmark_run.MICRO_SCENARIOS) + list(benchmark_run.END_TO_END_SCENARIOS)
+
+        results = benchmark_run.run(library, Path(".").resolve(), jobs=2, scenarios=scenarios, profile=False)
+
+        assert list(results.keys()) == scenarios
+        assert results["merge_apply"].count == 10 - library.duplicate_count
+        assert len(list(Path("library/Incoming").iterdir())) == library.duplicate_count
+
+    def test_should_flag_regressions_beyond_tolerance(self, capsys):
+        baseline = {"scenarios": {"a": {"seconds": 1, "rate": 100}, "b": {"seconds": 1, "rate": 100},
+                                  "c": {"seconds": 0.001, "rate": 100}}}
+        results = {"scenarios": {"a": {"seconds": 1.1, "rate": 90}, "b": {"seconds": 2, "rate": 50},
+                                 "c": {"seconds": 0.002, "rate": 50}, "d": {"seconds": 1, "rate": 1}}}
+
+        assert benchmark_run.compare(results, baseline, tolerance=0.25) == ["b"]
@@ -0,0 +1,48 @@
+"""
+Stand-in for exiftool speaking the "-stay_open True -@ -" protocol
+The content of each file is returned as its metadata JSON, except files containing CRASH or HANG
+"""
+import json
+import os
+import sys
+import time
+
+
+def respond(args):
+    metadata = []
+    skip_next = False
+    for arg in args:
+        if skip_next or arg.startswith("-"):
+            skip_next = arg == "-charset"
+            continue
+        if not os.path.exists(arg):
+            sys.stderr.write(f"Error: File not found - {arg}\n")
+            continue
+        with open(arg) as f:
+            content = f.read()
+        if content == "CRASH":
+            os._exit(1)
+        elif content == "HANG":
+            time.sleep(3600)
+        metadata.append(dict(json.loads(content), SourceFile=arg))
+    if len(metadata) > 0:
+        sys.stdout.write(json.dumps(metadata) + "\n")
+
+
+def main():
+    args = []
+    for line in sys.stdin:
+        line = line.rstrip("\n")
+        if line.startswith("-execute"):
+            respond(args)
+            sys.stdout.write(f"{{ready{line[len('-execute'):]}}}\n")
+            sys.stdout.flush()
+            args = []
+        elif args[-1:] == ["-stay_open"] and line == "False":
+            return
+        else:
+            args.append(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from exception.exception import ExifToolException
+from photo_organizer.exif.exif_tool import ExifTool
+
+FAKE_EXIFTOOL = [sys.executable, str(Path(__file__).resolve().parent / "fake_exiftool.py")]
+
+
+@pytest.fixture()
+def exif_tool():
+    exif_tool = ExifTool(FAKE_EXIFTOOL, sessions=2, timeout=5)
+    yield exif_tool
+    exif_tool.close()
+
+
+def write_file(path, content):
+    path = Path(path)
+    path.write_text(content if isinstance(content, str) else json.dumps(content))
+    return path
+
+
+class Test_get_metadata:
+    def test_should_return_metadata(self, exif_tool):
+        path = write_file("1.jpg", {"EXIF:DateTimeOriginal": "2020:08:01 09:36:50"})
+
+        assert exif_tool.get_metadata(path) == [{"EXIF:DateTimeOriginal": "2020:08:01 09:36:50", "SourceFile": "1.jpg"}]
+
+    def test_should_reuse_session(self, exif_tool):
+        path = write_file("1.jpg", {})
+        for _ in range(5):
+            exif_tool.get_metadata(path)
+
+        assert len(exif_tool._sessions) == 1
+
+    def test_should_return_empty_for_missing_file(self, exif_tool):
+        assert exif_tool.get_metadata(Path("missing.jpg")) == []
+
+    def test_should_serve_parallel_calls_with_bounded_sessions(self, exif_tool):
+        paths = [write_file(f"{i}.jpg", {"Index": i}) for i in range(20)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(exif_tool.get_metadata, paths))
+
+        assert [result[0]["Index"] for result in results] == list(range(20))
+        assert len(exif_tool._sessions) <= 2
+
+    def test_should_restart_after_crash(self, exif_tool):
+        with pytest.raises(ExifToolException):
+            exif_tool.get_metadata(write_file("crash.jpg", "CRASH"))
+
+        assert exif_tool.get_metadata(write_file("1.jpg", {"Index": 1})) == [{"Index": 1, "SourceFile": "1.jpg"}]
+
+    def test_should_restart_after_timeout(self):
+        exif_tool = ExifTool(FAKE_EXIFTOOL, timeout=1)
+        with pytest.raises(ExifToolException):
+            exif_tool.get_metadata(write_file("hang.jpg", "HANG"))
+
+        assert exif_tool.get_metadata(write_file("1.jpg", {"Index": 1})) == [{"Index": 1, "SourceFile": "1.jpg"}]
+        exif_tool.close()
+
+
+class Test_get_metadata_batch:
+    def test_should_return_metadata_of_readable_files(self, exif_tool):
+        paths = [write_file("1.jpg", {"Index": 1}), Path("missing.jpg"), write_file("2.jpg", {"Index": 2})]
+
+        metadata = exif_tool.get_metadata_batch(paths, tags=["EXIF:DateTimeOriginal"], fast=2)
+        assert metadata == [{"Index": 1, "SourceFile": "1.jpg"}, {"Index": 2, "SourceFile": "2.jpg"}]
+        assert exif_tool.get_metadata_batch([]) == []
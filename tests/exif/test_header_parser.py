@@ -0,0 +1,76 @@
+import io
+import struct
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from photo_organizer.exif import header_parser
+from benchmarks.media_builders import make_heic, make_jpeg, make_quicktime, make_tiff
+
+# 2020-08-01 01:13:55 UTC in seconds since 1904-01-01
+MEDIA_SECONDS = int((datetime(2020, 8, 1, 1, 13, 55) - datetime(1904, 1, 1)).total_seconds())
+
+
+def truncate_exif_infe(data: bytes) -> bytes:
+    """
+    Shrink the size of the infe box of the Exif item below what its version needs
+    """
+    position = data.index(b"infe", data.index(b"infe") + 4) - 4
+    return data[:position] + struct.pack(">I", 14) + data[position + 4:]
+
+
+class Test_read_time:
+    @pytest.mark.parametrize("endian", ["<", ">"])
+    def test_should_read_jpeg(self, endian):
+        data = make_jpeg(make_tiff("2020:08:01 09:13:55", endian))
+        assert header_parser.read_time(io.BytesIO(data)) == \
+            (datetime(2020, 8, 1, 9, 13, 55), "EXIF:DateTimeOriginal")
+
+    def test_should_read_sub_seconds(self):
+        data = make_jpeg(make_tiff("2020:08:01 09:13:55", sub_sec="045"))
+        assert header_parser.read_time(io.BytesIO(data)) == \
+            (datetime(2020, 8, 1, 9, 13, 55, 45000), "EXIF:DateTimeOriginal")
+
+    def test_should_read_heic(self):
+        data = make_heic(make_tiff("2020:08:01 09:13:55"))
+        assert header_parser.read_time(io.BytesIO(data)) == \
+            (datetime(2020, 8, 1, 9, 13, 55), "EXIF:DateTimeOriginal")
+
+    @pytest.mark.parametrize("mdat_first,iso_meta", [(True, False), (False, False), (True, True)])
+    def test_should_prefer_quicktime_creation_date(self, mdat_first, iso_meta):
+        data = make_quicktime("2020-08-01T09:13:55+0800", MEDIA_SECONDS, mdat_first=mdat_first, iso_meta=iso_meta)
+        assert header_parser.read_time(io.BytesIO(data)) == \
+            (datetime(2020, 8, 1, 9, 13, 55, tzinfo=timezone(timedelta(hours=8))), "QuickTime:CreationDate")
+
+    @pytest.mark.parametrize("mdhd_version", [0, 1])
+    def test_should_fall_back_to_media_create_date(self, mdhd_version):
+        data = make_quicktime(None, MEDIA_SECONDS, mdhd_version)
+        assert header_parser.read_time(io.BytesIO(data)) == \
+            (datetime(2020, 8, 1, 1, 13, 55), "QuickTime:MediaCreateDate")
+
+    @pytest.mark.parametrize("data", [
+        b"",
+        b"not a media file",
+        make_jpeg(make_tiff(None)),
+        make_jpeg(make_tiff("0000:00:00 00:00:00")),
+        make_jpeg(make_tiff("2020:08:01 09:13:55"))[:30],
+        make_heic(make_tiff(None)),
+        make_quicktime(None, 0),
+        make_quicktime(None, MEDIA_SECONDS)[:100],
+    ])
+    def test_should_return_none_when_not_found(self, data):
+        assert header_parser.read_time(io.BytesIO(data)) is None
+
+    @pytest.mark.parametrize("data", [
+        make_quicktime(None, 2 ** 62, 1),
+        make_quicktime(None, 2 ** 64 - 1, 1),
+        truncate_exif_infe(make_heic(make_tiff("2020:08:01 09:13:55"))),
+    ], ids=["mdhd_past_max_time", "mdhd_max_uint64", "truncated_infe"])
+    def test_should_return_none_for_corrupted_headers(self, data):
+        assert header_parser.read_time(io.BytesIO(data)) is None
+
+
+class Test_read_tiff_sub_sec_time:
+    def test_should_read_sub_sec(self):
+        assert header_parser.read_tiff_sub_sec_time(make_tiff("2020:08:01 09:13:55", sub_sec="123")) == "123"
+        assert header_parser.read_tiff_sub_sec_time(make_tiff("2020:08:01 09:13:55")) is None
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+from photo_organizer.renamer.path_allocator import PathAllocator
+
+
+class TestPathAllocator:
+    def test_should_allocate_lowest_free_suffix(self):
+        dir_to_paths = {Path("2020/08"): [Path("2020/08/1.jpg"), "2020/08/1_01.JPG", Path("2020/08/1_03.jpg")]}
+        allocator = PathAllocator(lambda dir_path: dir_to_paths.pop(dir_path, []))
+
+        assert allocator.allocate(Path("2020/08/2.jpg")) == Path("2020/08/2.jpg")
+        assert allocator.allocate(Path("2020/08/1.jpg")) == Path("2020/08/1_02.jpg")
+        assert allocator.allocate(Path("2020/08/1.jpg")) == Path("2020/08/1_04.jpg")
+        assert allocator.allocate(Path("2020/08/1.MP4")) == Path("2020/08/1.MP4")
+        assert allocator.allocate(Path("2020/09/1.jpg")) == Path("2020/09/1.jpg")
+
+    def test_should_allocate_bursts_past_99(self):
+        allocator = PathAllocator(lambda dir_path: [])
+        paths = [allocator.allocate(Path("2020/08/1.jpg")) for _ in range(1001)]
+
+        assert len(set(paths)) == 1001
+        assert paths[99] == Path("2020/08/1_99.jpg")
+        assert paths[1000] == Path("2020/08/1_1000.jpg")
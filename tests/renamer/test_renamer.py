@@ -4,7 +4,7 @@ from unittest.mock import Mock
 
 import pytest
 
-from photo_organizer.renamer.renamer import Renamer
+from photo_organizer.renamer.renamer import ExtractedTime, Renamer
 
 
 class TestRenamer:
@@ -24,6 +24,38 @@ class TestRenamer:
         renamer = Renamer([])
         assert renamer.suffix_path(Path("./dir1/dir2/1.jpg"), 1) == Path("./dir1/dir2/1_01.jpg")
         assert renamer.suffix_path(Path("666.mp4"), 50) == Path("666_50.mp4")
+        assert renamer.suffix_path(Path("666.MP4"), 100) == Path("666_100.mp4")
+
+    def test_get_path_by_time_with_sub_second_names(self):
+        renamer = Renamer([], sub_second_names=True)
+        assert renamer.get_path_by_time(Path("1.JPG"), datetime(2020, 8, 1, 9, 36, 50, 45000)) == \
+            Path("2020/08/20200801_093650045.jpg")
+        assert renamer.get_path_by_time(Path("1.jpg"), datetime(2020, 8, 1, 9, 36, 50)) == \
+            Path("2020/08/20200801_093650.jpg")
+        assert Renamer([]).get_path_by_time(Path("1.jpg"), datetime(2020, 8, 1, 9, 36, 50, 45000)) == \
+            Path("2020/08/20200801_093650.jpg")
+
+    def test_get_times(self):
+        extractor1 = Mock()
+        extractor1.get_times = Mock(side_effect=lambda paths: {p: ExtractedTime(datetime(2020, 8, 1), "1")
+                                                               if p.name == "1.jpg" else None for p in paths})
+        extractor2 = Mock()
+        extractor2.get_times = Mock(side_effect=lambda paths: {p: ExtractedTime(datetime(2021, 8, 1), "2")
+                                                               if p.name == "2.JPG" else None for p in paths})
+        renamer = Renamer([extractor1, extractor2])
+
+        assert renamer.get_times([Path("1.jpg"), Path("2.JPG"), Path("3.jpg")]) == {
+            Path("1.jpg"): ExtractedTime(datetime(2020, 8, 1), "1"),
+            Path("2.JPG"): ExtractedTime(datetime(2021, 8, 1), "2"),
+            Path("3.jpg"): None
+        }
+        extractor2.get_times.assert_called_once_with([Path("2.JPG"), Path("3.jpg")])
+
+    def test_get_version_should_change_with_extractors(self):
+        extractor = Mock()
+        extractor.get_version = Mock(return_value="1")
+        version = Renamer([extractor]).get_version()
+        assert Renamer([extractor]).get_version() == version
 
-        with pytest.raises(Exception):
-            renamer.suffix_path(Path("666.mp4"), 100)
+        extractor.get_version = Mock(return_value="2")
+        assert Renamer([extractor]).get_version() != version
@@ -1,8 +1,18 @@
-from datetime import datetime
+import json
+import struct
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import Mock
 
 import pytest
 
+from photo_organizer.exif.exif_tool import ExifTool
+from photo_organizer.renamer.exif_time_extractor import MetadataTimeExtractor
 from photo_organizer.renamer.file_name_time_extractor import FileNameTimeExtractor
+from photo_organizer.renamer.header_time_extractor import HeaderTimeExtractor
+from photo_organizer.renamer.renamer import ExtractedTime
+from benchmarks.media_builders import make_heic, make_jpeg, make_tiff
 
 
 class TestFileNameTimeExtractor:
@@ -16,3 +26,79 @@ class TestFileNameTimeExtractor:
     def test_get_time_should_extract_correctly(filename, expected_time):
         extractor = FileNameTimeExtractor()
         assert extractor.get_time(filename) == expected_time
+
+    @staticmethod
+    @pytest.mark.parametrize("filename,expected_time", [
+        ("IMG-20200801-WA0001.jpg", datetime(2020, 8, 1)),
+        ("PXL_20200801_091355123.jpg", datetime(2020, 8, 1, 9, 13, 55)),
+        ("Screenshot_2020-08-01-09-13-55.png", datetime(2020, 8, 1, 9, 13, 55)),
+        ("IMG_20200801_091355.jpg", None),
+        ("IMG-20201340-WA0001.jpg", None),
+        ("IMG-20200801-WA0001_IMG-20200802-WA0001.jpg", None),
+        ("Photo 01.08.2020.jpg", datetime(2020, 8, 1)),
+    ])
+    def test_get_time_should_extract_configured_patterns(filename, expected_time):
+        extractor = FileNameTimeExtractor(["IMG-%Y%m%d-WA", "PXL_%Y%m%d_%H%M%S", "Screenshot_%Y-%m-%d-%H-%M-%S",
+                                           "%d.%m.%Y"])
+        assert extractor.get_time(Path("dir") / filename) == expected_time
+
+    @staticmethod
+    def test_get_time_should_prefer_earlier_pattern():
+        extractor = FileNameTimeExtractor(["%Y%m%d_%H%M%S", "%Y-%m-%d"])
+        assert extractor.get_time("2020-08-02 20200801_091355.jpg") == datetime(2020, 8, 1, 9, 13, 55)
+
+    @staticmethod
+    @pytest.mark.parametrize("pattern", ["%H%M%S", "%Y%m%d_%f", "%Y%m%d%d"])
+    def test_should_reject_invalid_pattern(pattern):
+        with pytest.raises(ValueError):
+            FileNameTimeExtractor([pattern])
+
+
+class TestMetadataTimeExtractor:
+    @staticmethod
+    def test_get_times_should_extract_in_chunks():
+        fake_exiftool = [sys.executable, str(Path(__file__).resolve().parent.parent / "exif" / "fake_exiftool.py")]
+        extractor = MetadataTimeExtractor(Path("."), sessions=2, chunk_size=2)
+        extractor.exif_tool = ExifTool(fake_exiftool, sessions=2)
+        Path("1.jpg").write_text(json.dumps({"EXIF:DateTimeOriginal": "2020:08:01 09:13:55",
+                                             "EXIF:SubSecTimeOriginal": "045"}))
+        Path("2.mov").write_text(json.dumps({"QuickTime:CreationDate": "2020:08:01 09:13:55+08:00",
+                                             "QuickTime:MediaCreateDate": "2020:08:01 01:13:55"}))
+        Path("3.mp4").write_text(json.dumps({"File:FileModifyDate": "2020:08:01 09:13:55+08:00"}))
+        Path("4.jpg").write_text(json.dumps({}))
+        paths = [Path("1.jpg"), Path("2.mov"), Path("3.mp4"), Path("4.jpg"), Path("missing.jpg")]
+
+        tz = timezone(timedelta(hours=8))
+        assert extractor.get_times(paths) == {
+            Path("1.jpg"): ExtractedTime(datetime(2020, 8, 1, 9, 13, 55, 45000), "EXIF:DateTimeOriginal"),
+            Path("2.mov"): ExtractedTime(datetime(2020, 8, 1, 9, 13, 55, tzinfo=tz), "QuickTime:CreationDate"),
+            Path("3.mp4"): ExtractedTime(datetime(2020, 8, 1, 9, 13, 55, tzinfo=tz), "File:FileModifyDate"),
+            Path("4.jpg"): None,
+            Path("missing.jpg"): None
+        }
+        extractor.exif_tool.close()
+
+
+class TestHeaderTimeExtractor:
+    @staticmethod
+    def test_get_times_should_leave_unparsed_files():
+        Path("1.jpg").write_bytes(make_jpeg(make_tiff("2020:08:01 09:13:55", sub_sec="5")))
+        Path("2.heic").write_bytes(make_heic(make_tiff("2020:08:01 09:13:56")))
+        Path("3.jpg").write_bytes(make_jpeg(make_tiff(None)))
+        paths = [Path("1.jpg"), Path("2.heic"), Path("3.jpg"), Path("missing.jpg")]
+
+        extractor = HeaderTimeExtractor()
+        assert extractor.get_times(paths) == {
+            Path("1.jpg"): ExtractedTime(datetime(2020, 8, 1, 9, 13, 55, 500000), "EXIF:DateTimeOriginal"),
+            Path("2.heic"): ExtractedTime(datetime(2020, 8, 1, 9, 13, 56), "EXIF:DateTimeOriginal"),
+            Path("3.jpg"): None,
+            Path("missing.jpg"): None
+        }
+        assert extractor.get_time(Path("1.jpg")) == datetime(2020, 8, 1, 9, 13, 55, 500000)
+
+    @staticmethod
+    @pytest.mark.parametrize("error", [struct.error("unpack requires a buffer"), OverflowError("date out of range")])
+    def test_get_times_should_leave_corrupted_files(monkeypatch, error):
+        Path("1.mov").write_bytes(b"corrupted")
+        monkeypatch.setattr("photo_organizer.exif.header_parser.read_time", Mock(side_effect=error))
+        assert HeaderTimeExtractor().get_times([Path("1.mov")]) == {Path("1.mov"): None}
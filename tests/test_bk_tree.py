@@ -0,0 +1,35 @@
+import random
+
+from photo_organizer.bk_tree import BKTree, hamming_distance
+
+
+def test_hamming_distance():
+    assert hamming_distance(0b1011, 0b0001) == 2
+    assert hamming_distance((1 << 64) - 1, 0) == 64
+
+
+class Test_search:
+    def test_should_match_brute_force(self):
+        rng = random.Random(1)
+        hashes = [rng.getrandbits(64) for _ in range(2000)]
+        # Near copies of some hashes
+        hashes += [hashcode ^ (1 << rng.randrange(64)) for hashcode in hashes[:100]]
+        tree = BKTree()
+        for index, hashcode in enumerate(hashes):
+            tree.add(hashcode, index)
+
+        assert len(tree) == len(hashes)
+        for query in hashes[:50] + [rng.getrandbits(64) for _ in range(50)]:
+            expected = sorted((hamming_distance(query, hashcode), index) for index, hashcode in enumerate(hashes)
+                              if hamming_distance(query, hashcode) <= 10)
+            assert sorted(tree.search(query, 10)) == expected
+
+    def test_should_keep_items_of_same_hash(self):
+        tree = BKTree()
+        tree.add(5, "a")
+        tree.add(5, "b")
+        tree.add(4, "c")
+
+        assert tree.search(5, 0) == [(0, "a"), (0, "b")]
+        assert [item for _, item in tree.search(5, 1)] == ["a", "b", "c"]
+        assert BKTree().search(5, 64) == []
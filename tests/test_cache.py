@@ -1,10 +1,12 @@
 import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from unittest.mock import Mock
 
 import pytest
 
-from photo_organizer.cache import Cache
+from photo_organizer.cache import JOURNAL_FAILED, JOURNAL_MOVED, Cache, Doc
 
 
 @pytest.fixture
@@ -45,6 +47,23 @@ class Test_get_all:
         assert set([doc.size for doc in docs]) == {1024}
 
 
+class Test_iter_docs:
+    def test_should_stream_all_docs_in_batches(self, cache):
+        cache.upsert_many([Doc(Path(f"./{i}.jpg"), str(i), i) for i in range(25)])
+
+        docs = list(cache.iter_docs(batch_size=10))
+        assert sorted(doc.size for doc in docs) == list(range(25))
+        assert {doc.path for doc in docs} == {Path(f"./{i}.jpg") for i in range(25)}
+        assert isinstance(docs[0].path_str, str)
+
+    def test_should_not_hold_lock_between_batches(self, cache):
+        fill_cache(cache)
+        docs = cache.iter_docs(batch_size=1)
+        next(docs)
+        cache.upsert_hashcode_doc(Path("./4.jpg"), "000", 1)
+        assert len(list(docs)) >= 2
+
+
 class Test_get_doc_by_path:
     def test_should_return_correct_result(self, cache):
         fill_cache(cache)
@@ -68,3 +87,200 @@ class Test_delete_by_path:
         cache.delete_by_path(Path("./2.jpg"))
         assert len(cache.get_all()) == 2
         assert cache.get_doc_by_path(Path("./2.jpg")) is None
+
+
+class Test_migrate:
+    def test_should_tag_legacy_rows(self):
+        Path("./Temp/").mkdir(exist_ok=True)
+        conn = sqlite3.connect("./Temp/database.db")
+        conn.execute("CREATE TABLE hash (path text PRIMARY KEY, hashcode text NOT NULL, size long NOT NULL)")
+        conn.execute("INSERT INTO hash VALUES ('1.jpg', 'abc', 1024)")
+        conn.execute("INSERT INTO hash VALUES ('2.mp4', '209715200', 209715200)")
+        conn.commit()
+        conn.close()
+
+        config = Mock()
+        config.working_dir = Path("./Temp/")
+        cache = Cache(config)
+        assert cache.get_doc_by_path(Path("1.jpg")).algorithm == "md5"
+        assert cache.get_doc_by_path(Path("2.mp4")).algorithm == "size"
+        cache._conn.close()
+
+
+class Test_get_docs_by_sizes:
+    def test_should_return_correct_result(self, cache):
+        fill_cache(cache)
+        cache.upsert_hashcode_doc(Path("./4.JPG"), "000", 2048)
+
+        size_to_docs = cache.get_docs_by_sizes([1, 1024, 2048])
+        assert 1 not in size_to_docs
+        assert len(size_to_docs[1024]) == 3
+        assert size_to_docs[2048][0].path == Path("./4.jpg")
+
+
+class Test_many:
+    def test_should_upsert_and_delete_many(self, cache):
+        cache.upsert_many([Doc(Path(f"./{i}.jpg"), str(i), i) for i in range(100)])
+        assert len(cache.get_all()) == 100
+
+        cache.delete_many([Path(f"./{i}.jpg") for i in range(50)])
+        assert len(cache.get_all()) == 50
+        assert cache.get_doc_by_path(Path("./50.jpg")).hashcode == "50"
+
+    def test_should_handle_quotes_in_path(self, cache):
+        cache.upsert_hashcode_doc(Path("./it's.jpg"), "123", 1024)
+        assert cache.get_doc_by_path(Path("./it's.jpg")).hashcode == "123"
+
+
+class Test_batch:
+    def test_should_flush_in_order(self, cache):
+        with cache.batch(batch_size=3) as batch:
+            batch.upsert_hashcode_doc(Path("./1.jpg"), "1", 1)
+            batch.delete_by_path(Path("./1.jpg"))
+            batch.upsert_hashcode_doc(Path("./2.jpg"), "2", 1)
+            assert len(cache.get_all()) == 1
+            batch.upsert_hashcode_doc(Path("./3.jpg"), "3", 1)
+            assert len(cache.get_all()) == 1
+
+        assert set([doc.hashcode for doc in cache.get_all()]) == {"2", "3"}
+
+    def test_should_rollback_failed_flush(self, cache):
+        fill_cache(cache)
+        with pytest.raises(sqlite3.IntegrityError):
+            with cache.batch() as batch:
+                batch.delete_by_path(Path("./1.jpg"))
+                batch.upsert_hashcode_doc(Path("./4.jpg"), None, 1)
+
+        assert len(cache.get_all()) == 3
+
+
+class Test_scan:
+    def test_should_reconcile_scan(self, cache):
+        cache.upsert_hashcode_doc(Path("./Same.jpg"), "1", 1, "md5", 10, 100, 1)
+        cache.upsert_hashcode_doc(Path("./changed.jpg"), "2", 1, "md5", 10, 101, 1)
+        cache.upsert_hashcode_doc(Path("./moved.jpg"), "3", 1, "md5", 10, 102, 1)
+        cache.upsert_hashcode_doc(Path("./deleted.jpg"), "4", 1, "md5", 10, 103, 1)
+        cache.upsert_hashcode_doc(Path("./legacy.jpg"), "5", 1, "md5")
+        assert cache.count() == 5
+
+        assert cache.load_scan([
+            ("Same.jpg", 1, 10, 100, 1, "md5"),
+            ("changed.jpg", 1, 11, 101, 1, "md5"),
+            ("new/moved.jpg", 1, 10, 0, 0, "md5"),
+            ("legacy.jpg", 1, 12, 104, 1, "md5"),
+            ("new.jpg", 1, 10, 105, 1, "md5"),
+        ]) == 5
+        assert cache.get_scan_paths_without_file_id() == ["new/moved.jpg"]
+        cache.update_scan_file_ids([("new/moved.jpg", 102, 1)])
+
+        assert cache.scan_carry_over_moved() == 1
+        assert cache.scan_delete_missing() == 2
+        assert cache.scan_record_stat() == 1
+        assert sorted(path for path, _, _ in cache.get_scan_paths_to_hash()) == ["changed.jpg", "new.jpg"]
+        cache.drop_scan()
+
+        assert cache.get_doc_by_path(Path("new/moved.jpg")).hashcode == "3"
+        assert cache.get_doc_by_path(Path("legacy.jpg")).mtime_ns == 12
+        assert cache.get_doc_by_path(Path("deleted.jpg")) is None
+
+
+class Test_get_docs_by_values:
+    def test_should_return_by_hashcodes(self, cache):
+        fill_cache(cache)
+        cache.upsert_hashcode_doc(Path("./2_copy.jpg"), "456", 2048)
+
+        hash_to_docs = cache.get_docs_by_hashcodes(iter(["123", "456", "666", "456"]))
+        assert set(hash_to_docs.keys()) == {"123", "456"}
+        assert len(hash_to_docs["456"]) == 2
+        assert cache.get_docs_by_hashcodes([]) == {}
+
+    def test_should_return_by_sizes_across_chunks(self, cache):
+        cache.upsert_many([Doc(Path(f"./{i}.jpg"), str(i), i) for i in range(1200)])
+
+        size_to_docs = cache.get_docs_by_sizes(range(0, 2400, 2))
+        assert len(size_to_docs) == 600
+        assert size_to_docs[1198][0].path == Path("./1198.jpg")
+
+
+class Test_metadata_times:
+    def test_should_round_trip_times(self, cache):
+        tz = timezone(timedelta(hours=-5))
+        cache.upsert_metadata_times([
+            ("a", (datetime(2020, 8, 1, 9, 36, 50), "EXIF:DateTimeOriginal")),
+            ("b", (datetime(2020, 8, 1, 9, 36, 50, tzinfo=tz), "QuickTime:CreationDate")),
+            ("c", None),
+        ], "v1")
+
+        assert cache.get_metadata_times(["a", "b", "c", "d"], "v1") == {
+            "a": (datetime(2020, 8, 1, 9, 36, 50), "EXIF:DateTimeOriginal"),
+            "b": (datetime(2020, 8, 1, 9, 36, 50, tzinfo=tz), "QuickTime:CreationDate"),
+            "c": None
+        }
+        assert cache.get_metadata_times(["a"], "v2") == {}
+
+    def test_should_delete_other_versions(self, cache):
+        cache.upsert_metadata_times([("a", None)], "v1")
+        cache.upsert_metadata_times([("a", None)], "v2")
+
+        assert cache.delete_metadata_of_other_versions("v2") == 1
+        assert cache.get_metadata_times(["a"], "v2") == {"a": None}
+
+
+class Test_journal:
+    def test_should_checkpoint_moves(self, cache):
+        cache.start_journal([(Path("Incoming/A.jpg"), "1", Path("2020/08/a.jpg")),
+                             (Path("Incoming/b.jpg"), None, Path("2020/08/b.jpg"))])
+        with cache.batch() as batch:
+            batch.upsert_hashcode_doc(Path("2020/08/a.jpg"), "1", 1)
+            batch.set_journal_status(Path("Incoming/A.jpg"), JOURNAL_MOVED)
+
+        assert cache.get_journal_entries() == [(Path("Incoming/b.jpg"), None, Path("2020/08/b.jpg"))]
+        cache.clear_journal()
+        assert cache.get_journal_entries() == []
+
+    def test_should_keep_moves_not_done_when_appending(self, cache):
+        cache.start_journal([(Path("Incoming/a.jpg"), "1", Path("2020/08/a.jpg")),
+                             (Path("Incoming/b.jpg"), "2", Path("2020/08/b.jpg"))])
+        with cache.batch() as batch:
+            batch.set_journal_status(Path("Incoming/a.jpg"), JOURNAL_MOVED)
+            batch.set_journal_status(Path("Incoming/b.jpg"), JOURNAL_FAILED)
+        cache.start_journal([(Path("Incoming/c.jpg"), None, Path("2020/08/c.jpg"))], append=True)
+
+        assert cache.get_journal_entries() == [(Path("Incoming/b.jpg"), "2", Path("2020/08/b.jpg")),
+                                               (Path("Incoming/c.jpg"), None, Path("2020/08/c.jpg"))]
+
+
+class Test_get_paths_in_dir:
+    def test_should_return_direct_children(self, cache):
+        cache.upsert_hashcode_doc(Path("2020/08/1.JPG"), "1", 1)
+        cache.upsert_hashcode_doc(Path("2020/08/sub/2.jpg"), "2", 1)
+        cache.upsert_hashcode_doc(Path("2020/080/3.jpg"), "3", 1)
+        cache.upsert_hashcode_doc(Path("2020/09/4.jpg"), "4", 1)
+
+        assert cache.get_paths_in_dir(Path("2020/08")) == [str(Path("2020/08/1.jpg"))]
+
+
+class Test_perceptual_hashes:
+    def test_should_round_trip_unsigned_hashes(self, cache):
+        cache.upsert_perceptual_hashes([(Path("2020/08/A.jpg"), 1, (1 << 64) - 1),
+                                        (Path("2020/08/b.jpg"), 2, 5),
+                                        (Path("2020/08/c.jpg"), 3, None)])
+
+        assert cache.get_perceptual_hashes() == {str(Path("2020/08/a.jpg")): (1, (1 << 64) - 1),
+                                                 str(Path("2020/08/b.jpg")): (2, 5),
+                                                 str(Path("2020/08/c.jpg")): (3, None)}
+        cache.delete_perceptual_hashes([str(Path("2020/08/a.jpg"))])
+        assert len(cache.get_perceptual_hashes()) == 2
+
+
+class Test_audit_queries:
+    def test_should_group_duplicate_hashes_and_names(self, cache):
+        cache.upsert_hashcode_doc(Path("2020/08/1.jpg"), "1", 1)
+        cache.upsert_hashcode_doc(Path("2020/09/1.JPG"), "1", 1)
+        cache.upsert_hashcode_doc(Path("2020/09/2.jpg"), "2", 1)
+        cache.upsert_hashcode_doc(Path("2020/09/3.jpg"), "", 1, "pending")
+        cache.upsert_hashcode_doc(Path("2020/09/4.jpg"), "", 1, "pending")
+
+        assert cache.get_duplicate_hashcodes("pending") == {"1": [str(Path("2020/08/1.jpg")),
+                                                                  str(Path("2020/09/1.jpg"))]}
+        assert cache.get_duplicate_names() == {"1.jpg": [str(Path("2020/08/1.jpg")), str(Path("2020/09/1.jpg"))]}
@@ -12,7 +12,14 @@ from photo_organizer.config import Config
 @pytest.fixture()
 def setup_full_config_file():
     full_config = {
-        "IncomingDir": "Temp/IncomingDir"
+        "IncomingDir": "Temp/IncomingDir",
+        "Jobs": 4,
+        "MoveJobs": 2,
+        "MmapThreshold": 16,
+        "FileNamePatterns": ["IMG-%Y%m%d-WA"],
+        "SubSecondNames": True,
+        "SimilarCheck": True,
+        "SimilarDistance": 4
     }
     with open("./config.json", "w") as config_file:
         config_file.write(json.dumps(full_config))
@@ -47,6 +54,13 @@ def test_should_read_correct_config(setup_full_config_file):
     assert config.incoming_dir == Path("Temp/IncomingDir")
     assert config.working_dir == Path(".PhotoOrganizer")
     assert config.md5_size_limit == 100
+    assert config.mmap_threshold == 16
+    assert config.jobs == 4
+    assert config.move_jobs == 2
+    assert config.file_name_patterns == ["IMG-%Y%m%d-WA"]
+    assert config.sub_second_names
+    assert config.similar_check
+    assert config.similar_distance == 4
 
 
 def test_should_provide_correct_default(setup_minimum_config_file):
@@ -55,6 +69,14 @@ def test_should_provide_correct_default(setup_minimum_config_file):
     assert config.incoming_dir == Path("Temp/IncomingDir")
     assert config.working_dir == Path(".PhotoOrganizer")
     assert config.md5_size_limit == 100
+    assert config.mmap_threshold is None
+    assert config.jobs == 8
+    assert config.move_jobs == 4
+    assert config.cache_batch_size == 1000
+    assert config.file_name_patterns is None
+    assert not config.sub_second_names
+    assert not config.similar_check
+    assert config.similar_distance == 6
 
 
 def test_config_file_missing_should_throw():
@@ -72,3 +94,47 @@ def test_incoming_dir_nonexist_should_throw(setup_full_config_file):
 
     with pytest.raises(InvalidConfigException):
         Config()
+
+
+def test_invalid_jobs_should_throw(setup_minimum_config_file):
+    with open("./config.json", "w") as config_file:
+        config_file.write(json.dumps({
+            "IncomingDir": "Temp/IncomingDir",
+            "Jobs": 0
+        }))
+
+    with pytest.raises(InvalidConfigException):
+        Config()
+
+
+def test_invalid_file_name_patterns_should_throw(setup_minimum_config_file):
+    with open("./config.json", "w") as config_file:
+        config_file.write(json.dumps({
+            "IncomingDir": "Temp/IncomingDir",
+            "FileNamePatterns": "%Y%m%d"
+        }))
+
+    with pytest.raises(InvalidConfigException):
+        Config()
+
+
+def test_unsupported_file_name_patterns_should_throw(setup_minimum_config_file):
+    with open("./config.json", "w") as config_file:
+        config_file.write(json.dumps({
+            "IncomingDir": "Temp/IncomingDir",
+            "FileNamePatterns": ["IMG-%Y%m%d-WA", "IMG_%H%M%S"]
+        }))
+
+    with pytest.raises(InvalidConfigException):
+        Config()
+
+
+def test_invalid_similar_distance_should_throw(setup_minimum_config_file):
+    with open("./config.json", "w") as config_file:
+        config_file.write(json.dumps({
+            "IncomingDir": "Temp/IncomingDir",
+            "SimilarDistance": 65
+        }))
+
+    with pytest.raises(InvalidConfigException):
+        Config()
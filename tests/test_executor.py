@@ -0,0 +1,40 @@
+import threading
+
+import pytest
+
+from photo_organizer.executor import map_bounded
+
+
+class Test_map_bounded:
+    def test_should_run_on_calling_thread_with_one_job(self):
+        results = map_bounded(lambda x: (x, threading.current_thread()), range(3), 1, 4, "test")
+        assert list(results) == [(x, threading.current_thread()) for x in range(3)]
+
+    def test_should_run_workers_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def wait(x):
+            barrier.wait()
+            return x * 2
+
+        assert sorted(map_bounded(wait, range(6), 3, 3, "test")) == [0, 2, 4, 6, 8, 10]
+
+    def test_should_bound_submitted_items(self):
+        consumed = []
+
+        def items():
+            for x in range(20):
+                consumed.append(x)
+                yield x
+
+        results = map_bounded(lambda x: x, items(), 2, 4, "test")
+        first = next(results)
+        assert len(consumed) <= 5
+        assert sorted([first, *results]) == list(range(20))
+
+    def test_should_raise_worker_exception(self):
+        def fail(x):
+            raise ValueError(x)
+
+        with pytest.raises(ValueError):
+            list(map_bounded(fail, range(3), 2, 4, "test"))
@@ -1,3 +1,4 @@
+import hashlib
 import pathlib
 from pathlib import Path
 
@@ -22,4 +23,58 @@ def test_should_hash_correctly():
 
     hasher = Hasher(5)
     hashcode = hasher.get_hash(pathlib.Path("./2020/1.jpg"))
-    assert hashcode == "17"
+    assert hashcode == hashlib.md5(b"17SomeRandomContent").hexdigest()
+
+
+def test_should_get_algorithm_by_size():
+    hasher = Hasher(100)
+    assert hasher.get_algorithm(100) == Hasher.ALGORITHM_MD5
+    assert hasher.get_algorithm(101) == Hasher.ALGORITHM_SAMPLED
+
+
+def test_sampled_hash_should_differ_for_same_size_files():
+    hasher = Hasher(10, sample_size=4)
+    path1 = Path("./2020/large1.mp4")
+    path2 = Path("./2020/large2.mp4")
+    path1.write_bytes(b"0123456789abcdefghij0123456789")
+    path2.write_bytes(b"0123456789abcdXfghij0123456789")
+
+    assert hasher.get_hash(path1) != hasher.get_hash(path2)
+    assert hasher.get_hash(path1) == hashlib.md5(b"30" + b"0123" + b"defg" + b"6789").hexdigest()
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_should_hash_all_files(jobs):
+    paths = []
+    for i in range(20):
+        path = Path(f"./2020/{i}.jpg")
+        with path.open("w") as f:
+            f.write("SomeRandomContent")
+        paths.append(path)
+
+    hasher = Hasher(100)
+    path_to_hash = dict(hasher.get_hashes(iter(paths), jobs))
+    assert set(path_to_hash.keys()) == set(paths)
+    assert set(path_to_hash.values()) == {"b539721f0afbb19451fb5e3c782e1804"}
+
+
+@pytest.mark.parametrize("chunk_size,mmap_threshold", [
+    (1, None),
+    (7, None),
+    (1024, None),
+    (7, 1),
+], ids=[
+    "single_byte_chunks",
+    "chunks_not_aligned_with_size",
+    "chunk_larger_than_file",
+    "mmap",
+])
+def test_should_hash_same_regardless_of_reading_strategy(chunk_size, mmap_threshold):
+    hasher = Hasher(100, chunk_size=chunk_size, mmap_threshold=mmap_threshold)
+    assert hasher.get_hash(pathlib.Path("./2020/1.jpg")) == "b539721f0afbb19451fb5e3c782e1804"
+
+
+def test_should_hash_empty_file():
+    path = Path("./2020/empty.jpg")
+    path.touch()
+    assert Hasher(100, mmap_threshold=0).get_hash(path) == "d41d8cd98f00b204e9800998ecf8427e"
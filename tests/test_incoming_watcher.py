@@ -0,0 +1,47 @@
+import os
+from pathlib import Path
+
+from photo_organizer.incoming_watcher import IncomingWatcher
+
+
+def write_file(path, content):
+    path = Path(path)
+    path.write_text(content)
+    return path
+
+
+class Test_poll:
+    def test_should_wait_for_files_to_settle(self):
+        path = write_file("./1.jpg", "A")
+        watcher = IncomingWatcher(settle_seconds=2)
+
+        assert watcher.poll([path], now=0) == []
+        assert watcher.poll([path], now=1) == []
+        # Still being written
+        write_file(path, "AB")
+        assert watcher.poll([path], now=2) == []
+        assert watcher.poll([path], now=3) == []
+        assert watcher.poll([path], now=4) == [path]
+
+    def test_should_skip_handled_files_until_modified(self):
+        path = write_file("./1.jpg", "A")
+        watcher = IncomingWatcher(settle_seconds=0)
+        watcher.poll([path], now=0)
+        assert watcher.poll([path], now=1) == [path]
+        watcher.mark_handled([path])
+
+        assert watcher.poll([path], now=2) == []
+        assert watcher.poll([path], now=3) == []
+        write_file(path, "AB")
+        os.utime(path, ns=(1, 1))
+        watcher.poll([path], now=4)
+        assert watcher.poll([path], now=5) == [path]
+
+    def test_should_forget_removed_files(self):
+        path = write_file("./1.jpg", "A")
+        watcher = IncomingWatcher(settle_seconds=0)
+        watcher.poll([path], now=0)
+        path.unlink()
+
+        assert watcher.poll([path], now=1) == []
+        assert watcher._pending == {}
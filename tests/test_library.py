@@ -1,8 +1,11 @@
+import logging
+import os
 from pathlib import Path
 from unittest.mock import Mock
 
 import pytest
 
+from exception.exception import FileMoveException
 from photo_organizer.library import Library
 
 
@@ -53,3 +56,113 @@ class Test_get_all_incoming_paths:
 
         paths = library.get_all_incoming_paths()
         assert paths == [Path(p) for p in expected_library_paths]
+
+
+class Test_iter_library_files:
+    def test_should_yield_stat(self, library):
+        path = Path("./2020/05/2.jpg")
+        path.parent.mkdir(parents=True)
+        path.write_text("RandomText")
+
+        assert [(Path(p), stat.st_size) for p, stat in library.iter_library_files()] == [(path, 10)]
+
+    def test_should_ignore_directories_with_media_suffix(self, library):
+        Path("./2020/folder.jpg").mkdir(parents=True)
+        assert list(library.iter_library_files()) == []
+
+    def test_should_summarize_unrecognized_files(self, library, caplog):
+        Path("./2020").mkdir()
+        for name in ["1.txt", "2.txt", "3.aae"]:
+            Path("./2020", name).write_text("RandomText")
+
+        with caplog.at_level(logging.INFO):
+            assert list(library.iter_library_files()) == []
+        assert [r.message for r in caplog.records] == ["Not recognized media files by suffix: {'.txt': 2, '.aae': 1}"]
+
+
+class Test_move_file:
+    def test_should_rename_on_same_device(self, library):
+        Path("1.jpg").write_text("A")
+        stat = library.move_file(Path("1.jpg"), Path("2020/08/1.jpg"))
+
+        assert Path("2020/08/1.jpg").read_text() == "A"
+        assert not Path("1.jpg").exists()
+        assert stat.st_size == 1
+
+    def test_should_copy_verify_and_remove_across_devices(self, library, monkeypatch):
+        Path("1.jpg").write_bytes(b"A" * 3000000)
+        os.utime("1.jpg", ns=(1000000000, 1000000000))
+        monkeypatch.setattr(Library, "_is_same_device", staticmethod(lambda path, dir_path: False))
+        Library.move_file(Path("1.jpg"), Path("2020/08/1.jpg"))
+
+        assert Path("2020/08/1.jpg").read_bytes() == b"A" * 3000000
+        assert not Path("1.jpg").exists()
+        assert not Path("2020/08/1.jpg.partial").exists()
+        assert os.stat("2020/08/1.jpg").st_mtime_ns == 1000000000
+
+    def test_should_keep_source_when_verification_fails(self, library, monkeypatch):
+        Path("1.jpg").write_text("A")
+        monkeypatch.setattr("hashlib.md5", lambda *args, calls=iter(range(100)): Mock(
+            hexdigest=Mock(return_value=str(next(calls)))))
+        with pytest.raises(FileMoveException):
+            Library._copy_verified(Path("1.jpg"), Path("2.jpg"))
+
+        assert Path("1.jpg").exists()
+        assert not Path("2.jpg").exists()
+        assert not Path("2.jpg.partial").exists()
+
+    def test_should_not_overwrite(self, library):
+        Path("1.jpg").write_text("A")
+        Path("2.jpg").write_text("B")
+        with pytest.raises(FileMoveException):
+            library.move_file(Path("1.jpg"), Path("2.jpg"))
+
+
+class Test_move_files:
+    def test_should_move_concurrently_and_report_failures(self, library):
+        moves = []
+        for i in range(10):
+            Path(f"{i}.jpg").write_text(str(i))
+            moves.append((Path(f"{i}.jpg"), Path(f"2020/{i}.jpg")))
+        moves.append((Path("missing.jpg"), Path("2020/missing.jpg")))
+
+        results = {cur_path: stat for cur_path, _, stat in library.move_files(moves, jobs=3)}
+        assert len(results) == 11
+        assert results[Path("missing.jpg")] is None
+        assert all(Path(f"2020/{i}.jpg").read_text() == str(i) for i in range(10))
+
+
+class Test_get_dir_paths:
+    def test_should_list_all_entries(self, library):
+        Path("2020/08").mkdir(parents=True)
+        Path("2020/08/1.jpg").write_text("A")
+        Path("2020/08/1.txt").write_text("A")
+
+        assert sorted(library.get_dir_paths(Path("2020/08"))) == [str(Path("2020/08/1.jpg")), str(Path("2020/08/1.txt"))]
+        assert library.get_dir_paths(Path("2020/09")) == []
+
+
+class Test_get_sizes:
+    def test_should_stat_in_order(self, library):
+        paths = []
+        for i in range(10):
+            path = Path(f"./{i}.jpg")
+            path.write_text("A" * i)
+            paths.append(str(path))
+        paths.append("./missing.jpg")
+
+        assert library.get_sizes(paths, jobs=3) == list(range(10)) + [None]
+        assert library.get_sizes([], jobs=3) == []
+
+    def test_should_return_none_for_unreadable_files(self, library, monkeypatch):
+        Path("./1.jpg").write_text("A")
+        Path("./2.jpg").write_text("BB")
+        stat = os.stat
+
+        def locked_stat(path, *args, **kwargs):
+            if str(path).endswith("1.jpg"):
+                raise PermissionError(f"Locked: {path}")
+            return stat(path, *args, **kwargs)
+
+        monkeypatch.setattr("photo_organizer.library.os.stat", locked_stat)
+        assert library.get_sizes(["./1.jpg", "./2.jpg"], jobs=2) == [None, 2]
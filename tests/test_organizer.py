@@ -0,0 +1,447 @@
+import json
+import math
+import os
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+
+from exception.exception import AuditException, InvalidInputException
+from photo_organizer.hasher import Hasher
+from photo_organizer.library import Library
+from photo_organizer.organizer import Organizer
+
+
+@pytest.fixture()
+def organizer():
+    config = Mock()
+    config.cur_working_dir = Path(".")
+    config.incoming_dir = Path("./Incoming")
+    config.working_dir = Path("./.PhotoOrganizer")
+    config.md5_size_limit = 1
+    config.mmap_threshold = None
+    config.jobs = 2
+    config.move_jobs = 2
+    config.cache_batch_size = 2
+    config.file_name_patterns = None
+    config.sub_second_names = False
+    config.similar_check = False
+    config.similar_distance = 6
+    config.incoming_dir.mkdir()
+    organizer = Organizer(config)
+    yield organizer
+    organizer.cache._conn.close()
+
+
+def write_file(path, content):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return path
+
+
+def merge(organizer, monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda: "y")
+    organizer.merge()
+
+
+class Test_audit:
+    def test_should_report_issues(self, organizer):
+        write_file("./2020/08/1.jpg", "A")
+        write_file("./2020/09/1.jpg", "A")
+        write_file("./2020/09/2.jpg", "B")
+        write_file("./2020/09/3.jpg", "C")
+        organizer.setup()
+        write_file("./2020/09/2.jpg", "BB")
+        Path("./2020/09/3.jpg").unlink()
+
+        with pytest.raises(AuditException):
+            organizer.audit(Path("audit.json"))
+
+        report = json.loads(Path("audit.json").read_text())
+        paths = [str(Path("2020/08/1.jpg")), str(Path("2020/09/1.jpg"))]
+        assert report["duplicate_hashes"] == [{"hashcode": "7fc56270e7a70fa81a5935b72eacbe29", "paths": paths}]
+        assert report["duplicate_names"] == [{"name": "1.jpg", "paths": paths}]
+        assert report["size_changed"] == [{"path": str(Path("2020/09/2.jpg")), "cached_size": 1, "size": 2}]
+        assert report["missing"] == [str(Path("2020/09/3.jpg"))]
+
+    def test_should_pass_clean_library(self, organizer):
+        write_file("./2020/08/1.jpg", "A")
+        organizer.setup()
+        organizer.audit(Path("audit.json"))
+
+        assert json.loads(Path("audit.json").read_text())["size_changed"] == []
+
+
+class Test_setup:
+    def test_should_hash_library_files(self, organizer):
+        write_file("./2020/08/20200801_093650.jpg", "A")
+        write_file("./2020/08/20200801_093651.jpg", "B")
+        organizer.setup()
+
+        docs = organizer.cache.get_all()
+        assert len(docs) == 2
+        assert all([doc.algorithm == Hasher.ALGORITHM_MD5 for doc in docs])
+
+    def test_should_hash_through_mmap_from_config(self, organizer):
+        organizer.config.mmap_threshold = 1
+        mmap_organizer = Organizer(organizer.config)
+        mmap_organizer.cache._conn.close()
+
+        assert mmap_organizer.hasher.mmap_threshold == 1024 * 1024
+        assert organizer.hasher.mmap_threshold is None
+
+    def test_should_upgrade_outdated_rows(self, organizer):
+        path = write_file("./2020/08/20200801_093650.jpg", "A")
+        organizer.cache.upsert_hashcode_doc(path, "1", 1, Hasher.ALGORITHM_SIZE)
+        organizer.setup()
+
+        doc = organizer.cache.get_doc_by_path(path)
+        assert doc.algorithm == Hasher.ALGORITHM_MD5
+        assert doc.hashcode == "7fc56270e7a70fa81a5935b72eacbe29"
+
+    def test_should_rehash_changed_files(self, organizer):
+        path = write_file("./2020/08/20200801_093650.jpg", "A")
+        organizer.setup()
+        write_file(path, "BB")
+        organizer.setup()
+
+        assert organizer.cache.get_doc_by_path(path).hashcode == "9d3d9048db16a7eee539e93e3618cbe7"
+
+    def test_should_not_record_files_modified_while_hashing(self, organizer, monkeypatch):
+        path = write_file("./2020/08/20200801_093650.jpg", "A")
+        get_hash = organizer.hasher.get_hash
+
+        def modifying_get_hash(file_path):
+            hashcode = get_hash(file_path)
+            write_file(path, "BB")
+            return hashcode
+
+        monkeypatch.setattr(organizer.hasher, "get_hash", modifying_get_hash)
+        organizer.setup()
+        assert organizer.cache.get_doc_by_path(path) is None
+
+        monkeypatch.setattr(organizer.hasher, "get_hash", get_hash)
+        organizer.setup()
+        assert organizer.cache.get_doc_by_path(path).hashcode == "9d3d9048db16a7eee539e93e3618cbe7"
+
+    def test_should_skip_files_deleted_while_hashing(self, organizer, monkeypatch):
+        path = write_file("./2020/08/20200801_093650.jpg", "A")
+        write_file("./2020/08/20200801_093651.jpg", "B")
+        get_hash = organizer.hasher.get_hash
+
+        def deleting_get_hash(file_path):
+            hashcode = get_hash(file_path)
+            if Path(file_path) == path:
+                path.unlink()
+            return hashcode
+
+        monkeypatch.setattr(organizer.hasher, "get_hash", deleting_get_hash)
+        organizer.setup()
+
+        assert organizer.cache.get_doc_by_path(path) is None
+        assert organizer.cache.get_doc_by_path(Path("2020/08/20200801_093651.jpg")) is not None
+
+    def test_should_carry_hash_over_for_moved_files(self, organizer):
+        path = write_file("./2020/08/20200801_093650.jpg", "A")
+        organizer.setup()
+        organizer.cache.upsert_hashcode_doc(path, "carried", 1, Hasher.ALGORITHM_MD5,
+                                            os.stat(path).st_mtime_ns, os.stat(path).st_ino, os.stat(path).st_dev)
+        new_path = Path("./2021/08/20200801_093650.jpg")
+        new_path.parent.mkdir(parents=True)
+        path.rename(new_path)
+        organizer.setup()
+
+        assert organizer.cache.get_doc_by_path(path) is None
+        assert organizer.cache.get_doc_by_path(new_path).hashcode == "carried"
+
+    def test_should_record_stat_without_rehashing_legacy_rows(self, organizer):
+        path = write_file("./2020/08/20200801_093650.jpg", "A")
+        organizer.cache.upsert_hashcode_doc(path, "legacy", 1)
+        organizer.setup()
+
+        doc = organizer.cache.get_doc_by_path(path)
+        assert doc.hashcode == "legacy"
+        assert doc.mtime_ns == os.stat(path).st_mtime_ns
+
+
+class Test_merge:
+    def test_should_move_files_and_defer_unique_sizes(self, organizer, monkeypatch):
+        write_file("./Incoming/IMG_20200801_093650.jpg", "A")
+        merge(organizer, monkeypatch)
+
+        assert Path("./2020/08/20200801_093650.jpg").exists()
+        doc = organizer.cache.get_doc_by_path(Path("2020/08/20200801_093650.jpg"))
+        assert doc.algorithm == Hasher.ALGORITHM_PENDING
+
+        organizer.setup()
+        doc = organizer.cache.get_doc_by_path(Path("2020/08/20200801_093650.jpg"))
+        assert doc.algorithm == Hasher.ALGORITHM_MD5
+
+    def test_should_skip_duplicates(self, organizer, monkeypatch):
+        write_file("./2020/08/20200801_093650.jpg", "A")
+        write_file("./Incoming/IMG_20200802_093650.jpg", "A")
+        write_file("./Incoming/IMG_20200803_093650.jpg", "B")
+        write_file("./Incoming/IMG_20200804_093650.jpg", "B")
+        write_file("./Incoming/IMG_20200805_093650.jpg", "CC")
+        merge(organizer, monkeypatch)
+
+        assert not Path("./2020/08/20200802_093650.jpg").exists()
+        assert Path("./2020/08/20200803_093650.jpg").exists()
+        assert not Path("./2020/08/20200804_093650.jpg").exists()
+        assert Path("./2020/08/20200805_093650.jpg").exists()
+        assert Path("./Incoming/IMG_20200802_093650.jpg").exists()
+        assert Path("./Incoming/IMG_20200804_093650.jpg").exists()
+
+    def test_should_suffix_conflicting_names(self, organizer, monkeypatch):
+        write_file("./2020/08/20200801_093650.jpg", "A")
+        write_file("./Incoming/IMG_20200801_093650.jpg", "B")
+        merge(organizer, monkeypatch)
+
+        assert Path("./2020/08/20200801_093650_01.jpg").read_text() == "B"
+
+    def test_should_suffix_without_walking_library_again(self, organizer, monkeypatch):
+        write_file("./2020/08/20200801_093650.jpg", "A")
+        write_file("./Incoming/IMG_20200801_093650.jpg", "B")
+        organizer.setup()
+        # Added after setup, only found by listing the target directory
+        write_file("./2020/08/20200801_093650_01.jpg", "C")
+        monkeypatch.setattr(organizer, "setup", lambda: None)
+        organizer.library.get_all_library_paths = Mock(side_effect=Exception("Should not walk"))
+        merge(organizer, monkeypatch)
+
+        assert Path("./2020/08/20200801_093650_02.jpg").read_text() == "B"
+
+    def test_should_reuse_extracted_times(self, organizer, monkeypatch):
+        write_file("./Incoming/IMG_20200801_093650.jpg", "A")
+        monkeypatch.setattr("builtins.input", lambda: "n")
+        organizer.merge()
+
+        organizer.renamer.time_extractors[0].get_times = Mock(side_effect=Exception("Should not extract"))
+        merge(organizer, monkeypatch)
+        assert Path("./2020/08/20200801_093650.jpg").exists()
+
+    def test_should_extract_time_again_for_renamed_files(self, organizer, monkeypatch):
+        write_file("./Incoming/IMG_20200801_093650.jpg", "A")
+        monkeypatch.setattr("builtins.input", lambda: "n")
+        organizer.merge()
+
+        Path("./Incoming/IMG_20200801_093650.jpg").rename("./Incoming/IMG_20210505_101010.jpg")
+        merge(organizer, monkeypatch)
+        assert Path("./2021/05/20210505_101010.jpg").read_text() == "A"
+        assert not Path("./2020/08/20200801_093650.jpg").exists()
+
+    def test_should_detect_duplicates_of_pending_library_files(self, organizer, monkeypatch):
+        write_file("./Incoming/IMG_20200801_093650.jpg", "A")
+        merge(organizer, monkeypatch)
+        write_file("./Incoming/IMG_20200802_093650.jpg", "A")
+        write_file("./Incoming/IMG_20200803_093650.jpg", "B")
+        # Not set up again, so the library file is still pending
+        monkeypatch.setattr(organizer, "setup", lambda: None)
+        merge(organizer, monkeypatch)
+
+        assert not Path("./2020/08/20200802_093650.jpg").exists()
+        assert Path("./2020/08/20200803_093650.jpg").exists()
+        doc = organizer.cache.get_doc_by_path(Path("2020/08/20200801_093650.jpg"))
+        assert doc.algorithm == Hasher.ALGORITHM_MD5
+
+
+class Test_resume:
+    def test_should_resume_interrupted_merge(self, organizer, monkeypatch):
+        write_file("./Incoming/IMG_20200801_093650.jpg", "A")
+        write_file("./Incoming/IMG_20200802_093650.jpg", "BB")
+        move_file = Library.move_file
+
+        def interrupted_move_file(cur_path, new_path):
+            if "0802" in cur_path.name:
+                raise KeyboardInterrupt()
+            return move_file(cur_path, new_path)
+
+        monkeypatch.setattr(Library, "move_file", staticmethod(interrupted_move_file))
+        with pytest.raises(KeyboardInterrupt):
+            merge(organizer, monkeypatch)
+        monkeypatch.setattr(Library, "move_file", staticmethod(move_file))
+
+        organizer.renamer.get_times = Mock(side_effect=Exception("Should not extract"))
+        organizer.hasher.get_hash = Mock(side_effect=Exception("Should not hash"))
+        organizer.resume()
+
+        assert Path("./2020/08/20200801_093650.jpg").read_text() == "A"
+        assert Path("./2020/08/20200802_093650.jpg").read_text() == "BB"
+        assert organizer.cache.get_doc_by_path(Path("2020/08/20200802_093650.jpg")) is not None
+        assert organizer.cache.get_journal_entries() == []
+
+    def test_should_record_moves_not_checkpointed(self, organizer):
+        write_file("./2020/08/1.jpg", "A")
+        write_file("./2020/08/2.jpg", "B")
+        write_file("./Incoming/2.jpg", "B")
+        organizer.cache.start_journal([(Path("Incoming/1.jpg"), "h1", Path("2020/08/1.jpg")),
+                                       (Path("Incoming/2.jpg"), None, Path("2020/08/2.jpg"))])
+        organizer.resume()
+
+        assert not Path("./Incoming/2.jpg").exists()
+        assert organizer.cache.get_doc_by_path(Path("2020/08/1.jpg")).hashcode == "h1"
+        assert organizer.cache.get_doc_by_path(Path("2020/08/2.jpg")).algorithm == Hasher.ALGORITHM_PENDING
+        assert organizer.cache.get_journal_entries() == []
+
+    def test_should_keep_conflicting_moves_in_journal(self, organizer):
+        write_file("./2020/08/1.jpg", "A")
+        write_file("./Incoming/1.jpg", "B")
+        organizer.cache.start_journal([(Path("Incoming/1.jpg"), None, Path("2020/08/1.jpg"))])
+        organizer.resume()
+
+        assert Path("./Incoming/1.jpg").exists()
+        assert len(organizer.cache.get_journal_entries()) == 1
+
+
+class Test_watch:
+    def test_should_merge_settled_files(self, organizer):
+        write_file("./2020/08/20200801_093650.jpg", "A")
+        write_file("./Incoming/IMG_20200801_093650.jpg", "A")
+        write_file("./Incoming/IMG_20200802_093650.jpg", "B")
+        organizer.watch(interval=0, settle_seconds=0, cycles=2)
+
+        assert Path("./2020/08/20200802_093650.jpg").read_text() == "B"
+        assert Path("./Incoming/IMG_20200801_093650.jpg").exists()
+
+    def test_should_merge_later_drops_without_walking_library(self, organizer, monkeypatch):
+        write_file("./Incoming/IMG_20200801_093650.jpg", "A")
+        monkeypatch.setattr(organizer, "setup", lambda: None)
+        organizer.library.iter_library_files = Mock(side_effect=Exception("Should not walk"))
+        polls = []
+
+        def sleep(_):
+            polls.append(None)
+            if len(polls) == 2:
+                write_file("./Incoming/Sub/IMG_20200801_093650.jpg", "B")
+
+        monkeypatch.setattr("photo_organizer.organizer.time.sleep", sleep)
+        organizer.watch(interval=0, settle_seconds=0, cycles=4)
+
+        assert Path("./2020/08/20200801_093650.jpg").read_text() == "A"
+        assert Path("./2020/08/20200801_093650_01.jpg").read_text() == "B"
+
+    def test_should_skip_files_failing_to_merge(self, organizer, monkeypatch):
+        write_file("./Incoming/IMG_20200801_093650.jpg", "A")
+        write_file("./Incoming/IMG_20200802_093650.jpg", "B")
+        get_sampled_hash = organizer.hasher.get_sampled_hash
+
+        def locked_get_sampled_hash(path, size):
+            if "0801" in path.name:
+                raise PermissionError(f"Locked: {path}")
+            return get_sampled_hash(path, size)
+
+        monkeypatch.setattr(organizer.hasher, "get_sampled_hash", locked_get_sampled_hash)
+        organizer.watch(interval=0, settle_seconds=0, cycles=3)
+
+        assert Path("./Incoming/IMG_20200801_093650.jpg").exists()
+        assert Path("./2020/08/20200802_093650.jpg").read_text() == "B"
+
+    def test_should_keep_failed_moves_for_resume(self, organizer, monkeypatch):
+        write_file("./Incoming/IMG_20200801_093650.jpg", "A")
+        move_file = Library.move_file
+
+        def failing_move_file(cur_path, new_path):
+            if "0801" in cur_path.name:
+                raise PermissionError(f"Locked: {cur_path}")
+            return move_file(cur_path, new_path)
+
+        monkeypatch.setattr(Library, "move_file", staticmethod(failing_move_file))
+        polls = []
+
+        def sleep(_):
+            polls.append(None)
+            if len(polls) == 2:
+                write_file("./Incoming/IMG_20200802_093650.jpg", "BB")
+
+        monkeypatch.setattr("photo_organizer.organizer.time.sleep", sleep)
+        organizer.watch(interval=0, settle_seconds=0, cycles=4)
+        assert Path("./2020/08/20200802_093650.jpg").read_text() == "BB"
+
+        monkeypatch.setattr(Library, "move_file", staticmethod(move_file))
+        organizer.resume()
+        assert Path("./2020/08/20200801_093650.jpg").read_text() == "A"
+        assert organizer.cache.get_journal_entries() == []
+
+
+class Test_plan:
+    def test_should_apply_written_plan(self, organizer):
+        write_file("./Incoming/IMG_20200801_093650.jpg", "A")
+        write_file("./Incoming/IMG_20200802_093650.jpg", "BB")
+        write_file("./Incoming/IMG_20200803_093650.jpg", "CCC")
+        organizer.merge(plan_out=Path("plan.jsonl"))
+        assert not Path("./2020").exists()
+
+        organizer.hasher.get_hash = Mock(side_effect=Exception("Should not hash"))
+        organizer.library.get_all_incoming_paths = Mock(side_effect=Exception("Should not scan"))
+        Path("./Incoming/IMG_20200802_093650.jpg").write_text("Changed")
+        Path("./Incoming/IMG_20200803_093650.jpg").unlink()
+        organizer.apply_plan(Path("plan.jsonl"))
+
+        assert Path("./2020/08/20200801_093650.jpg").read_text() == "A"
+        assert not Path("./2020/08/20200802_093650.jpg").exists()
+        assert organizer.cache.get_doc_by_path(Path("2020/08/20200801_093650.jpg")) is not None
+
+
+def write_photo(path, size, flip=False):
+    image_module = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    image = image_module.new("L", (size, size))
+    image.putdata([int(127 + 120 * math.sin(2 * math.pi * ((size - 1 - x if flip else x) + 2 * y) / size))
+                   for y in range(size) for x in range(size)])
+    image.save(path)
+    return path
+
+
+class Test_similar:
+    def test_should_require_pillow(self, organizer, monkeypatch):
+        monkeypatch.setattr(organizer.perceptual_hasher, "is_available", lambda: False)
+        with pytest.raises(InvalidInputException):
+            organizer.similar()
+
+    def test_should_report_similar_photos(self, organizer, caplog):
+        write_photo("./2020/08/1.png", 64)
+        write_photo("./2020/08/1_resized.jpg", 48)
+        write_photo("./2020/08/2.png", 64, flip=True)
+        organizer.similar()
+
+        similar_logs = [record.message for record in caplog.records if record.message.startswith("Similar (")]
+        assert len(similar_logs) == 1 and "1_resized.jpg" in similar_logs[0] and "1.png" in similar_logs[0]
+        assert len(organizer.cache.get_perceptual_hashes()) == 3
+
+        Path("./2020/08/2.png").unlink()
+        organizer.perceptual_hasher.get_hash = Mock(side_effect=Exception("Should not hash"))
+        organizer.similar()
+        assert len(organizer.cache.get_perceptual_hashes()) == 2
+
+    def test_should_warn_similar_incoming_photos_on_merge(self, organizer, monkeypatch, caplog):
+        write_photo("./2020/08/20200801_093650.png", 64)
+        organizer.similar()
+        write_photo("./Incoming/IMG_20200802_093650.jpg", 48)
+        organizer.config.similar_check = True
+        merge(organizer, monkeypatch)
+
+        assert f"Similar (distance 0): {Path('Incoming/IMG_20200802_093650.jpg')} ~ " \
+               f"{Path('2020/08/20200801_093650.png')}" in [record.message for record in caplog.records]
+        assert Path("./2020/08/20200802_093650.jpg").exists()
+        assert str(Path("2020/08/20200802_093650.jpg")) in organizer.cache.get_perceptual_hashes()
+
+    def test_should_index_photos_merged_by_watch(self, organizer, monkeypatch, caplog):
+        write_photo("./Incoming/IMG_20200801_093650.png", 64)
+        organizer.config.similar_check = True
+        organizer.cache.get_perceptual_hashes = Mock(wraps=organizer.cache.get_perceptual_hashes)
+        polls = []
+
+        def sleep(_):
+            polls.append(None)
+            if len(polls) == 2:
+                write_photo("./Incoming/IMG_20200802_093650.jpg", 48)
+
+        monkeypatch.setattr("photo_organizer.organizer.time.sleep", sleep)
+        organizer.watch(interval=0, settle_seconds=0, cycles=4)
+
+        assert f"Similar (distance 0): {Path('Incoming/IMG_20200802_093650.jpg')} ~ " \
+               f"{Path('2020/08/20200801_093650.png')}" in [record.message for record in caplog.records]
+        assert organizer.cache.get_perceptual_hashes.call_count == 1
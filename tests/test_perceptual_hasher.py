@@ -0,0 +1,46 @@
+import math
+from pathlib import Path
+
+import pytest
+
+from photo_organizer.bk_tree import hamming_distance
+from photo_organizer.perceptual_hasher import PerceptualHasher
+
+Image = pytest.importorskip("PIL.Image")
+pytest.importorskip("numpy")
+
+
+def write_photo(path, size, phase=0.0):
+    image = Image.new("RGB", (size, size))
+    image.putdata([(int(127 + 120 * math.sin(2 * math.pi * (x + 2 * y) / size + phase)), 100, 50)
+                   for y in range(size) for x in range(size)])
+    image.save(path)
+    return Path(path)
+
+
+class Test_get_hash:
+    def test_should_match_reencoded_copies(self):
+        hasher = PerceptualHasher()
+        original = hasher.get_hash(write_photo("original.png", 128))
+        resized = hasher.get_hash(write_photo("resized.jpg", 80))
+        different = hasher.get_hash(write_photo("different.png", 128, phase=math.pi))
+
+        assert hamming_distance(original, resized) <= 6
+        assert hamming_distance(original, different) > 20
+        assert 0 <= original < 1 << 64
+
+    def test_should_return_none_for_undecodable_file(self):
+        Path("broken.jpg").write_bytes(b"not a photo")
+        assert PerceptualHasher().get_hash(Path("broken.jpg")) is None
+
+    def test_should_hash_on_worker_threads(self):
+        paths = [write_photo(f"{i}.png", 32, phase=i) for i in range(10)]
+        hasher = PerceptualHasher()
+
+        assert dict(hasher.get_hashes(paths, jobs=3)) == {path: hasher.get_hash(path) for path in paths}
+
+
+def test_is_supported():
+    assert PerceptualHasher.is_supported(Path("a.JPG"))
+    assert PerceptualHasher.is_supported("2020/08/a.png")
+    assert not PerceptualHasher.is_supported(Path("a.mp4"))
@@ -0,0 +1,60 @@
+import logging
+import threading
+
+import pytest
+
+from photo_organizer.pipeline import Pipeline
+
+
+class Test_run:
+    def test_should_chain_stages_in_order(self):
+        pipeline = Pipeline("test", queue_size=2) \
+            .add_stage("double", lambda x: [x * 2]) \
+            .add_stage("odd", lambda x: [x + 1, x + 1] if x % 4 == 0 else [])
+        assert list(pipeline.run(range(5))) == [1, 1, 5, 5, 9, 9]
+
+    def test_should_run_workers_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def wait(x):
+            barrier.wait()
+            return [x]
+
+        pipeline = Pipeline("test").add_stage("wait", wait, workers=3)
+        assert sorted(pipeline.run(range(6))) == list(range(6))
+
+    def test_should_flush_batches(self):
+        batch = []
+
+        def add(x):
+            batch.append(x)
+            if len(batch) == 3:
+                yield list(batch)
+                batch.clear()
+
+        def flush():
+            yield list(batch)
+
+        pipeline = Pipeline("test").add_stage("batch", add, flush=flush)
+        assert list(pipeline.run(range(7))) == [[0, 1, 2], [3, 4, 5], [6]]
+
+    def test_should_raise_first_error(self):
+        def fail(x):
+            if x == 50:
+                raise ValueError("Failed")
+            return [x]
+
+        pipeline = Pipeline("test", queue_size=1).add_stage("fail", fail, workers=2).add_stage("copy", lambda x: [x])
+        with pytest.raises(ValueError):
+            list(pipeline.run(range(1000)))
+
+    def test_should_stop_when_closed_early(self):
+        pipeline = Pipeline("test", queue_size=1).add_stage("copy", lambda x: [x])
+        outputs = pipeline.run(iter(range(1000000)))
+        assert next(outputs) == 0
+        outputs.close()
+
+    def test_should_log_stage_stats(self, caplog):
+        caplog.set_level(logging.INFO)
+        list(Pipeline("test").add_stage("copy", lambda x: [x]).run(range(3)))
+        assert "Pipeline test stage copy: 3 in, 3 out" in caplog.text
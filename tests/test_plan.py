@@ -0,0 +1,12 @@
+from pathlib import Path
+
+from photo_organizer.plan import PlanEntry, read_plan, write_plan
+
+
+class Test_plan:
+    def test_should_round_trip_entries(self):
+        entries = [PlanEntry(Path("Incoming/it's 1.jpg"), "abc", Path("2020/08/20200801_093650.jpg"), 1, 10),
+                   PlanEntry(Path("Incoming/2.jpg"), None, Path("2020/08/20200801_093651.jpg"), 2, 20)]
+
+        assert write_plan(Path("plan.jsonl"), iter(entries)) == 2
+        assert list(read_plan(Path("plan.jsonl"))) == entries
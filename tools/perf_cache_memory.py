@@ -0,0 +1,66 @@
+"""
+Benchmark of the peak Python memory of loading the whole hash table, against the former Doc holding a Path,
+and of streaming it with Cache.iter_docs
+Usage: python tools/perf_cache_memory.py [row_count]
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from unittest.mock import Mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from photo_organizer.cache import Cache, Doc  # noqa: E402
+
+
+class LegacyDoc:
+    def __init__(self, path, hashcode, size, algorithm="md5", mtime_ns=None, inode=None, device=None):
+        self.path = path
+        self.hashcode = hashcode
+        self.size = size
+        self.algorithm = algorithm
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.device = device
+
+
+def legacy_get_all(cache: Cache):
+    rows = cache._conn.execute(f"SELECT {Cache._doc_columns} FROM hash").fetchall()
+    return [LegacyDoc(Path(row[0]), *row[1:]) for row in rows]
+
+
+def stream_sizes(cache: Cache):
+    return sum(doc.size for doc in cache.iter_docs())
+
+
+def measure(name, func, cache):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(cache)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"{name:<16} {elapsed:>8.2f} s {peak / 1024 / 1024:>10.1f} MB peak")
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as temp_dir:
+        config = Mock()
+        config.working_dir = Path(temp_dir)
+        cache = Cache(config)
+        cache.upsert_many(Doc(f"20{i % 20:02}/{i % 12 + 1:02}/20{i % 20:02}0101_{i:08}.jpg", f"{i:032x}", i,
+                              "md5", i, i, 1) for i in range(row_count))
+        print(f"Rows: {cache.count()}")
+
+        measure("legacy get_all", legacy_get_all, cache)
+        measure("get_all", Cache.get_all, cache)
+        measure("iter_docs", stream_sizes, cache)
+        cache._conn.close()
+
+
+if __name__ == "__main__":
+    main()
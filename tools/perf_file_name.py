@@ -0,0 +1,53 @@
+"""
+Benchmark of the per-name cost of FileNameTimeExtractor against the former regex-rebuilding, strptime based extractor
+Usage: python tools/perf_file_name.py [name_count]
+"""
+import datetime
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from photo_organizer.renamer.file_name_time_extractor import DEFAULT_PATTERNS, FileNameTimeExtractor  # noqa: E402
+
+NAME_FORMATS = ["IMG_%Y%m%d_%H%M%S.jpg", "VID_%Y%m%d-%H%M%S_1234.mp4", "IMG_%H%M.HEIC", "DSC%m%d%S.JPG"]
+
+
+def legacy_get_time(filename):
+    for pattern in DEFAULT_PATTERNS:
+        regex_pattern = pattern.replace("%", "")
+        regex_pattern = re.sub("[mMdDhHsS]", "\\\\d\\\\d", regex_pattern)
+        regex_pattern = re.sub("[yY]", "\\\\d\\\\d\\\\d\\\\d", regex_pattern)
+        matches = re.findall(regex_pattern, filename)
+        if len(matches) != 1:
+            continue
+        return datetime.datetime.strptime(matches[0], pattern)
+    return None
+
+
+def build_names(name_count):
+    random.seed(0)
+    start = datetime.datetime(2000, 1, 1)
+    return [(start + datetime.timedelta(seconds=random.randrange(20 * 365 * 86400))).strftime(NAME_FORMATS[i % 4])
+            for i in range(name_count)]
+
+
+def measure(name, get_time, names):
+    start = time.perf_counter()
+    found = sum(1 for filename in names if get_time(filename) is not None)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {elapsed / len(names) * 1e9:>10.0f} ns/name {found:>10} found")
+
+
+def main():
+    name_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    names = build_names(name_count)
+    measure("legacy", legacy_get_time, names)
+    measure("compiled", FileNameTimeExtractor().get_time, names)
+
+
+if __name__ == "__main__":
+    main()
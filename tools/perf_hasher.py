@@ -0,0 +1,53 @@
+"""
+Micro-benchmark of Hasher throughput (MB/s) and peak Python memory against reading the whole file at once
+Usage: python tools/perf_hasher.py [size_in_mb] [rounds]
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from photo_organizer.hasher import Hasher  # noqa: E402
+
+
+def legacy_hash(path):
+    return hashlib.md5(open(path, 'rb').read()).hexdigest()
+
+
+def measure(name, hash_func, path, size, rounds):
+    hash_func(path)  # Warm up the page cache so every strategy reads from memory
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        hash_func(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<10} {size * rounds / elapsed / 1024 / 1024:>10.1f} MB/s {peak / 1024 / 1024:>10.2f} MB peak")
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    size = size_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "sample.bin"
+        with path.open("wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        streaming = Hasher(size + 1)
+        mapped = Hasher(size + 1, mmap_threshold=1)
+        measure("legacy", legacy_hash, path, size, rounds)
+        measure("streaming", streaming.get_hash, path, size, rounds)
+        measure("mmap", mapped.get_hash, path, size, rounds)
+
+
+if __name__ == "__main__":
+    main()
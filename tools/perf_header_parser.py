@@ -0,0 +1,69 @@
+"""
+Benchmark of the in-process header parser against exiftool in files/s on a synthetic set of JPEG, HEIC and MOV files
+exiftool is looked up as exiftool.exe in the working dir, then on PATH, and skipped if absent
+Usage: python tools/perf_header_parser.py [file_count] [working_dir]
+"""
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from photo_organizer.exif.exif_tool import ExifTool  # noqa: E402
+from photo_organizer.renamer.exif_time_extractor import MetadataTimeExtractor  # noqa: E402
+from photo_organizer.renamer.header_time_extractor import HeaderTimeExtractor  # noqa: E402
+from benchmarks.media_builders import make_heic, make_jpeg, make_quicktime, make_tiff  # noqa: E402
+
+
+def build_files(root: Path, file_count: int):
+    media_seconds = int((datetime(2020, 8, 1) - datetime(1904, 1, 1)).total_seconds())
+    payloads = [(".jpg", make_jpeg(make_tiff("2020:08:01 09:13:55"))),
+                (".heic", make_heic(make_tiff("2020:08:01 09:13:55"))),
+                (".mov", make_quicktime("2020-08-01T09:13:55+0800", media_seconds))]
+    paths = []
+    for i in range(file_count):
+        suffix, payload = payloads[i % len(payloads)]
+        path = root / f"{i}{suffix}"
+        path.write_bytes(payload)
+        paths.append(path)
+    return paths
+
+
+def find_exiftool(working_dir: Path):
+    if (working_dir / "exiftool.exe").exists():
+        return working_dir / "exiftool.exe"
+    executable = shutil.which("exiftool")
+    return None if executable is None else Path(executable)
+
+
+def measure(name, extractor, paths):
+    start = time.perf_counter()
+    path_to_time = extractor.get_times(paths)
+    elapsed = time.perf_counter() - start
+    resolved = len([extracted_time for extracted_time in path_to_time.values() if extracted_time is not None])
+    print(f"{name:<10} {len(paths) / elapsed:>10.1f} files/s {resolved:>8} resolved")
+
+
+def main():
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    working_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else Path("./.PhotoOrganizer")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = build_files(Path(temp_dir), file_count)
+        measure("header", HeaderTimeExtractor(), paths)
+
+        exiftool = find_exiftool(working_dir)
+        if exiftool is None:
+            print("exiftool   not found, skipped")
+            return
+        extractor = MetadataTimeExtractor(working_dir, sessions=4)
+        extractor.exif_tool = ExifTool(exiftool, sessions=4)
+        measure("exiftool", extractor, paths)
+        extractor.exif_tool.close()
+
+
+if __name__ == "__main__":
+    main()
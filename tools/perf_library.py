@@ -0,0 +1,58 @@
+"""
+Benchmark of the library walker against the former Path.glob based scan on a synthetic tree
+Usage: python tools/perf_library.py [file_count]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import Mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from photo_organizer.library import Library  # noqa: E402
+
+SUFFIXES = [".jpg", ".heic", ".mp4", ".mov", ".png", ".aae"]
+
+
+def glob_scan(root: Path):
+    media_suffixes = [".bmp", ".gif", ".heic", ".jpg", ".jpeg", ".m4v", ".mov", ".mp4", ".nef", ".png"]
+    return list(filter(lambda p: p.suffix.lower() in media_suffixes, root.glob("[0-9]*/**/*")))
+
+
+def build_tree(root: Path, file_count: int):
+    files_per_month = max(1, file_count // (20 * 12))
+    created = 0
+    for year in range(2000, 2020):
+        for month in range(1, 13):
+            month_dir = root / str(year) / f"{month:02}"
+            month_dir.mkdir(parents=True)
+            for i in range(files_per_month):
+                if created >= file_count:
+                    return
+                open(month_dir / f"{year}{month:02}01_{i:06}{SUFFIXES[i % len(SUFFIXES)]}", "w").close()
+                created += 1
+
+
+def measure(name, scan):
+    start = time.perf_counter()
+    count = len(scan())
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8} {count:>8} files {elapsed:>8.2f} s {count / elapsed:>10.0f} files/s")
+
+
+def main():
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        build_tree(root, file_count)
+        config = Mock()
+        config.cur_working_dir = root
+        library = Library(config)
+
+        measure("glob", lambda: glob_scan(root))
+        measure("scandir", lambda: list(library.iter_library_files()))
+
+
+if __name__ == "__main__":
+    main()